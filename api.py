@@ -0,0 +1,150 @@
+"""Versioned JSON API for Blogly.
+
+    GET /api/v1/<users|posts|tags>?ids=1,2,3   those rows, one query per resource
+    GET /api/v1/<users|posts|tags>?after=...   a page of rows in id order
+    GET /api/v1/posts/stream                   every post as NDJSON
+
+All of them take ?fields=a,b to return only some columns, so clients can
+skip heavy ones like profile_pic, content and content_html; id is always included.
+Posts' 'tags' field lists their tag ids and costs one more query.
+"""
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy import select
+from werkzeug.exceptions import HTTPException
+
+from models import db, User, Post, Tags, PostTags
+from pagination import keyset_page, page_size
+from transfer import stream
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+RESOURCES = {
+    'users': (User, ('id', 'first_name', 'last_name', 'profile_pic', 'post_count', 'updated_at')),
+    'posts': (Post, ('id', 'title', 'content', 'content_html', 'excerpt', 'posted_by', 'posted_at', 'updated_at',
+                     'tags')),
+    'tags': (Tags, ('id', 'name', 'post_count', 'updated_at')),
+}
+
+
+@api.errorhandler(HTTPException)
+def api_error(e):
+    """Errors as JSON rather than HTML pages"""
+
+    return jsonify(error=e.description), e.code
+
+
+def requested_fields(resource):
+    """Fields named by ?fields=, or all of them, with id first"""
+    allowed = RESOURCES[resource][1]
+    if 'fields' not in request.args:
+        return allowed
+
+    fields = tuple(dict.fromkeys(['id'] + [field for field in request.args['fields'].split(',') if field]))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, description=f'Unknown {resource} fields: {", ".join(unknown)}')
+
+    return fields
+
+
+def requested_ids():
+    """Distinct ids from ?ids=, in the order given, or None without it"""
+    if 'ids' not in request.args:
+        return None
+
+    try:
+        ids = list(dict.fromkeys(int(part) for part in request.args['ids'].split(',') if part))
+    except ValueError:
+        abort(400, description='ids must be comma-separated integers')
+
+    if len(ids) > current_app.config['API_MAX_IDS']:
+        abort(400, description=f'At most {current_app.config["API_MAX_IDS"]} ids per request')
+
+    return ids
+
+
+def columns(model, fields):
+    return [getattr(model, field) for field in fields if field != 'tags']
+
+
+def to_record(row):
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row._mapping.items()}
+
+
+def attach_tags(records):
+    """Fill in each post record's tag ids with one query"""
+    tag_ids = defaultdict(list)
+    if records:
+        links = (select(PostTags.post_id, PostTags.tag_id)
+                 .where(PostTags.post_id.in_([record['id'] for record in records]))
+                 .order_by(PostTags.post_id, PostTags.tag_id))
+        for post_id, tag_id in db.session.execute(links):
+            tag_ids[post_id].append(tag_id)
+
+    for record in records:
+        record['tags'] = tag_ids[record['id']]
+
+
+def fetch(resource):
+    model = RESOURCES[resource][0]
+    fields = requested_fields(resource)
+    query = db.session.query(*columns(model, fields))
+    ids = requested_ids()
+
+    if ids is None:
+        per_page = page_size(current_app.config['API_PER_PAGE'], current_app.config['API_MAX_PER_PAGE'])
+        rows, next_cursor = keyset_page(query, [model.id], request.args.get('after'), per_page=per_page)
+        body = {'data': [to_record(row) for row in rows], 'next': next_cursor}
+    else:
+        found = {row.id: to_record(row) for row in query.filter(model.id.in_(ids))} if ids else {}
+        body = {'data': [found[row_id] for row_id in ids if row_id in found],
+                'missing': [row_id for row_id in ids if row_id not in found]}
+
+    if 'tags' in fields:
+        attach_tags(body['data'])
+
+    return jsonify(body)
+
+
+@api.route('/users')
+def users():
+    """JSON users by ?ids= or by page"""
+
+    return fetch('users')
+
+
+@api.route('/posts')
+def posts():
+    """JSON posts by ?ids= or by page"""
+
+    return fetch('posts')
+
+
+@api.route('/tags')
+def tags():
+    """JSON tags by ?ids= or by page"""
+
+    return fetch('tags')
+
+
+@api.route('/posts/stream')
+def stream_posts():
+    """Every post after ?after_id= in id order, as newline-delimited JSON read through a server-side cursor"""
+    fields = requested_fields('posts')
+    stmt = (select(*columns(Post, fields))
+            .where(Post.id > request.args.get('after_id', 0, type=int))
+            .order_by(Post.id))
+
+    def generate():
+        for rows in stream(db.session.connection(), stmt).partitions():
+            records = [to_record(row) for row in rows]
+            if 'tags' in fields:
+                attach_tags(records)
+            yield ''.join(json.dumps(record) + '\n' for record in records)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -1,59 +1,377 @@
 """Blogly application."""
-from flask import Flask, request, redirect, render_template, flash
-from flask_debugtoolbar import DebugToolbarExtension
-from sqlalchemy import desc, delete
-from models import db, connect_db, User, Post, Tags, PostTags
+import os
+import click
+from flask import (Flask, Blueprint, current_app, request, redirect, render_template, flash, jsonify, abort,
+                   send_file)
+from werkzeug.local import LocalProxy
+from sqlalchemy import func, literal, null, select, text, union_all
+from sqlalchemy.orm import joinedload, selectinload, load_only
+from models import (db, connect_db, touch, install_timestamps, User, Post, Tags, PostTags, PostViews, DeleteJob,
+                    RelatedPost)
+from config import CONFIGS
+from pagination import keyset_page, page_size
+from media import (LocalImageStore, DIGEST_PATTERN, MAX_URL_LENGTH, InvalidImageURL, get_image_store, store_image,
+                   store_image_value, image_url, sniff_mimetype)
+from search import install_search, search_posts, lookup_posts
+from counters import adjust_user_count, adjust_tag_counts, recount_users, recount_tags, install_count_columns
+from tagging import set_post_tags, set_tag_posts, change_tag_posts, install_post_tag_key
+from pool import engine_options, pool_stats
+from routing import REPLICA_PREFIX, init_routing
+from metrics import init_metrics
+from pagecache import PageCache, LRUCache, FileSystemCache, cached_page
+from conditional import conditional, is_fresh
+from api import api
+from deletes import (ACTIVE, init_deletes, install_cascades, queue_delete, delete_user_rows, delete_tag_rows,
+                     run_delete_job)
+from transfer import DUMP_READERS, DUMP_WRITERS, dump_format, export_records, import_records
+from viewcounts import init_views, counts_views, popular_query
+from catalog import init_catalog, bump_version
+from markup import render_post, install_render_columns, rerender_posts
+from related import init_related, update_related, queue_related, rebuild_related, related_posts
+from feeds import place_post, remove_post, post_scopes, rfc822, serve as serve_feed
+
+blogly = Blueprint('blogly', __name__)
+
+page_cache = LocalProxy(lambda: current_app.extensions['page_cache'])
+tag_catalog = LocalProxy(lambda: current_app.extensions['tag_catalog'])
+
+PAGE_CACHE_BACKENDS = {
+    'lru': lambda config: LRUCache(config['PAGE_CACHE_MAX_BYTES']),
+    'filesystem': lambda config: FileSystemCache(config['PAGE_CACHE_DIR'], config['PAGE_CACHE_MAX_BYTES']),
+    None: lambda config: None,
+}
+
+
+def create_app(config=None, overrides=None):
+    """Build a Blogly app for a config profile name or object, with optional setting overrides.
+
+    The profile defaults to $BLOGLY_CONFIG, or development. Nothing here touches the database.
+    """
+    config = config or os.environ.get('BLOGLY_CONFIG', 'development')
+
+    app = Flask(__name__)
+    app.config.from_object(CONFIGS[config] if isinstance(config, str) else config)
+    app.config.update(overrides or {})
+    app.config['MEDIA_ROOT'] = app.config['MEDIA_ROOT'] or os.path.join(app.instance_path, 'media')
+    app.config['PAGE_CACHE_DIR'] = app.config['PAGE_CACHE_DIR'] or os.path.join(app.instance_path, 'page-cache')
+
+    if app.config['DEBUG_TB_ENABLED']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    pool_options = engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**pool_options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    init_metrics(app)
+    init_routing(app)
+    connect_db(app)
+    init_deletes(app)
+    init_related(app)
+    init_views(app)
+    init_catalog(app)
+
+    app.extensions['image_store'] = LocalImageStore(app.config['MEDIA_ROOT'])
+    app.extensions['page_cache'] = PageCache(PAGE_CACHE_BACKENDS[app.config['PAGE_CACHE_BACKEND']](app.config))
+    app.add_template_global(image_url)
+    app.add_template_filter(rfc822)
+
+    app.register_blueprint(blogly)
+    app.register_blueprint(api)
+
+    return app
+
+
+@blogly.cli.command('init-db')
+def init_db_command():
+    """Create any missing tables"""
+    db.create_all()
+
+    click.echo('Database initialized')
+
+
+@blogly.cli.command('upgrade-schema')
+def upgrade_schema_command():
+    """Bring tables made by an older Blogly up to date: link keys, counters, timestamps and indexes"""
+    with db.engine.begin() as connection:
+        install_post_tag_key(connection)
+        install_count_columns(connection)
+        install_timestamps(connection)
+        for model in (User, Post, Tags, PostTags):
+            for index in model.__table__.indexes:
+                index.create(connection, checkfirst=True)
+    db.create_all()
+
+    recount_users()
+    recount_tags()
+    db.session.commit()
+
+    click.echo('Schema upgraded')
+
+def feed_page(cursor, query=None):
+    """Get a page of the newest posts older than cursor"""
+    if query is None:
+        query = Post.query.options(joinedload(Post.users), selectinload(Post.tags))
+
+    return keyset_page(query, [Post.posted_at, Post.id], cursor,
+                       per_page=current_app.config['FEED_PER_PAGE'], descending=True)
+
+
+def tag_stamps(post_ids):
+    """Validator rows for the tags shown on the given posts"""
+    if not post_ids:
+        return []
+
+    rows = (db.session.query(PostTags.post_id, Tags.id, Tags.updated_at)
+            .join(Tags, Tags.id == PostTags.tag_id)
+            .filter(PostTags.post_id.in_(post_ids))
+            .order_by(PostTags.post_id, Tags.id))
+
+    return [tuple(row) for row in rows]
 
-app = Flask(__name__)
-app.app_context().push()
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///blogly'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
 
-app.config['SECRET_KEY'] = 'HendrixIsAnnoying123'
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-debug = DebugToolbarExtension(app)
+def feed_validators():
+    """Validator rows for a homepage feed page"""
+    query = (db.session.query(Post.id, Post.posted_at, Post.updated_at, User.updated_at.label('author_updated_at'))
+             .join(User, User.id == Post.posted_by))
+    rows, next_cursor = feed_page(request.args.get('before'), query)
 
-connect_db(app)
+    return [tuple(row) for row in rows] + tag_stamps([row.id for row in rows])
 
-db.create_all()
 
-@app.route('/')
+@blogly.route('/')
+@conditional(feed_validators)
+@cached_page('before')
 def homepage():
-    """Displays 5 most recent posts"""
-    posts = Post.query.order_by(desc('posted_at')).limit(5)
+    """Displays most recent posts, paging back with ?before=<cursor>"""
+    page_cache.depends('posts')
+    posts, next_cursor = feed_page(request.args.get('before'))
+    for post in posts:
+        page_cache.depends(f'post:{ post.id }', f'user:{ post.posted_by }',
+                           *[f'tag:{ tag.id }' for tag in post.tags])
+
+    return render_template('home.html', posts=posts, next_cursor=next_cursor)
+
+
+@blogly.route('/api/feed')
+def api_feed():
+    """JSON page of most recent posts for infinite scroll"""
+    posts, next_cursor = feed_page(request.args.get('before'))
+
+    return jsonify(posts=[post.serialize() for post in posts], next=next_cursor)
+
+
+def feed_response(scope):
+    """A scope's Atom feed, or RSS with ?format=rss, answering revalidations with 304"""
+    body, etag, last_modified, mimetype = serve_feed(scope, request.args.get('format', 'atom'))
+
+    if is_fresh(etag, last_modified):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(body, mimetype=mimetype)
+
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.cache_control.no_cache = True
 
-    return render_template('home.html', posts=posts)
+    return resp
 
-@app.errorhandler(404)
+
+@blogly.route('/feed')
+def site_feed():
+    """Feed of the newest posts"""
+
+    return feed_response('site')
+
+@blogly.app_errorhandler(404)
 def page_not_found(e):
     """Display custom 404"""
 
     return render_template('404.html'), 404
 
+# search---------------------------------------------------------------------------------------------------------
+
+def search_args():
+    """Run a post search from the query string"""
+    q = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    if not q:
+        return q, page, [], False
+
+    results, has_more = search_posts(q, tag_id=request.args.get('tag', type=int),
+                                     user_id=request.args.get('author', type=int),
+                                     page=page, per_page=current_app.config['SEARCH_PER_PAGE'])
+
+    return q, page, results, has_more
+
+
+@blogly.route('/search')
+def search():
+    """Display ranked post search results"""
+    q, page, results, has_more = search_args()
+
+    return render_template('search.html', q=q, page=page, results=results, has_more=has_more)
+
+
+@blogly.route('/api/search')
+def api_search():
+    """JSON ranked post search results"""
+    q, page, results, has_more = search_args()
+
+    return jsonify(posts=[dict(post.serialize(), rank=float(rank)) for post, rank in results],
+                   page=page, has_more=has_more)
+
+
+@blogly.route('/api/posts/lookup')
+def api_lookup_posts():
+    """JSON list of a few posts whose titles start with ?q=, for typeahead pickers"""
+    q = request.args.get('q', '').strip()
+    posts = lookup_posts(q, limit=current_app.config['LOOKUP_LIMIT']) if q else []
+
+    return jsonify(posts=[{'id': post.id, 'title': post.title,
+                           'author': f'{ post.users.first_name } { post.users.last_name }'} for post in posts])
+
+
+@blogly.route('/api/cache/stats')
+def api_cache_stats():
+    """JSON page cache hit and miss counters for this worker"""
+
+    return jsonify(page_cache.stats())
+
+
+@blogly.route('/metrics')
+def metrics():
+    """Request, SQL and template metrics for this worker in Prometheus text format"""
+
+    return current_app.extensions['metrics'].render(), {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+@blogly.route('/api/pool/stats')
+def api_pool_stats():
+    """JSON connection pool usage and checkout wait times for this worker"""
+
+    stats = pool_stats(db.engine.pool)
+    stats['replicas'] = {key: pool_stats(engine.pool) for key, engine in db.engines.items()
+                         if key and key.startswith(REPLICA_PREFIX)}
+
+    return jsonify(stats)
+
+
+@blogly.cli.command('install-search')
+def install_search_command():
+    """Add full-text search structures to an existing database"""
+    with db.engine.begin() as connection:
+        install_search(connection)
+
+    click.echo('Search index installed')
+
+# media----------------------------------------------------------------------------------------------------------
+
+@blogly.route('/media/<digest>')
+def serve_media(digest):
+    """Serve a stored image, or one of its thumbnails with ?size="""
+    size = request.args.get('size', type=int)
+    if not DIGEST_PATTERN.fullmatch(digest):
+        abort(404)
+    if size is not None and size not in current_app.config['THUMBNAIL_SIZES']:
+        abort(404)
+
+    image = get_image_store().open(digest, size)
+    if image is None:
+        abort(404)
+
+    mimetype = sniff_mimetype(image.read(12))
+    image.seek(0)
+
+    resp = send_file(image, mimetype=mimetype, etag=f'{digest}-{size or "orig"}',
+                     max_age=current_app.config['MEDIA_MAX_AGE'], conditional=True)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+
+    return resp
+
+
+@blogly.cli.command('migrate-profile-pics')
+def migrate_profile_pics():
+    """Move data URI profile pictures into the image store, and drop URLs too long to keep"""
+    user_ids = [user_id for (user_id,) in
+                db.session.query(User.id).filter(User.profile_pic.like('data:%') |
+                                                 (func.length(User.profile_pic) > MAX_URL_LENGTH))]
+
+    for user_id in user_ids:
+        user = User.query.get(user_id)
+        try:
+            user.profile_pic = store_image_value(user.profile_pic)
+        except InvalidImageURL as err:
+            click.echo(f'User {user_id}: {err}; profile picture removed')
+            user.profile_pic = None
+        except ValueError:
+            click.echo(f'User {user_id}: unreadable profile picture removed')
+            user.profile_pic = None
+        db.session.commit()
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('ALTER TABLE users ALTER COLUMN profile_pic TYPE VARCHAR(500)'))
+        db.session.commit()
+
+    click.echo(f'Migrated {len(user_ids)} profile pictures')
+
+
+def profile_pic_from_form():
+    """Get a profile picture reference from the uploaded file or the image URL field"""
+    upload = request.files.get('profile_pic_file')
+    if upload and upload.filename:
+        return store_image(upload.read())
+
+    return store_image_value(request.form.get('profile_pic', ''))
+
 # users----------------------------------------------------------------------------------------------------------
 
-@app.route('/users')
+DIRECTORY_FIELDS = ('id', 'first_name', 'last_name', 'post_count')
+
+
+def users_page(cursor):
+    """Get a page of users in name order after cursor, loading only the listed columns"""
+    query = User.query.options(load_only(*[getattr(User, field) for field in DIRECTORY_FIELDS]))
+    per_page = page_size(current_app.config['USERS_PER_PAGE'], current_app.config['USERS_MAX_PER_PAGE'])
+
+    return keyset_page(query, [User.last_name, User.first_name, User.id], cursor, per_page=per_page)
+
+
+@blogly.route('/users')
 def show_all_users():
-    """Display list of all users"""
-    users = User.query.all()
+    """Display a page of users, paging forward with ?after=<cursor>"""
+    users, next_cursor = users_page(request.args.get('after'))
+
+    return render_template('users-all.html', users=users, next_cursor=next_cursor)
+
+
+@blogly.route('/api/users')
+def api_users():
+    """JSON page of users in name order"""
+    users, next_cursor = users_page(request.args.get('after'))
 
-    return render_template('users-all.html', users=users)
+    return jsonify(users=[user.serialize(DIRECTORY_FIELDS) for user in users], next=next_cursor)
 
 
-@app.route('/users/new')
+@blogly.route('/users/new')
 def add_user():
     """Display add users page"""
 
     return render_template('user-add.html')
 
 
-@app.route('/users/new', methods=['POST'])
+@blogly.route('/users/new', methods=['POST'])
 def submit_add_user():
     """Submit add users page"""
     first_name = request.form["first_name"]
     last_name = request.form["last_name"]
-    profile_pic = request.form["profile_pic"]
+    try:
+        profile_pic = profile_pic_from_form()
+    except InvalidImageURL as err:
+        flash(str(err))
+        return redirect('/users/new')
+    except ValueError:
+        flash('Profile picture must be a JPEG, PNG, GIF or WebP image')
+        return redirect('/users/new')
     profile_pic = profile_pic if profile_pic else None
 
     new_user = User(first_name=first_name, last_name=last_name, profile_pic=profile_pic)
@@ -63,16 +381,47 @@ def submit_add_user():
     return redirect(f"/users/{new_user.id}")
 
 
-@app.route('/users/<int:user_id>')
+def user_posts_page(query):
+    """Get a page of a user's posts, newest first, older than the ?before= cursor"""
+    per_page = page_size(current_app.config['USER_POSTS_PER_PAGE'], current_app.config['USER_POSTS_MAX_PER_PAGE'])
+
+    return keyset_page(query, [Post.posted_at, Post.id], request.args.get('before'),
+                       per_page=per_page, descending=True)
+
+
+def user_validators(user_id):
+    """Validator rows for a user's page"""
+    user = db.session.query(User.id, User.updated_at).filter_by(id=user_id).first()
+    if user is None:
+        return None
+
+    posts, next_cursor = user_posts_page(db.session.query(Post.id, Post.posted_at, Post.updated_at)
+                                         .filter_by(posted_by=user_id))
+
+    return [tuple(user)] + [tuple(post) for post in posts]
+
+
+@blogly.route('/users/<int:user_id>')
+@conditional(user_validators)
+@cached_page('before', 'per_page')
 def show_user(user_id):
-    """Display specified users page"""
+    """Display specified users page with their newest posts, paging back with ?before=<cursor>"""
+    page_cache.depends(f'user:{ user_id }', f'user-posts:{ user_id }')
     user = User.query.get_or_404(user_id)
-    posts = Post.query.filter_by(posted_by=user_id)
+    posts, next_cursor = user_posts_page(Post.query.filter_by(posted_by=user_id))
+    page_cache.depends(*[f'post:{ post.id }' for post in posts])
+
+    return render_template('user-page.html', user=user, posts=posts, next_cursor=next_cursor)
 
-    return render_template('user-page.html', user=user, posts=posts)
 
+@blogly.route('/users/<int:user_id>/feed')
+def user_feed(user_id):
+    """Feed of a user's newest posts"""
 
-@app.route('/users/<int:user_id>/edit')
+    return feed_response(f'user:{ user_id }')
+
+
+@blogly.route('/users/<int:user_id>/edit')
 def edit_user(user_id):
     """Display edit user page"""
     user = User.query.get_or_404(user_id)
@@ -80,7 +429,7 @@ def edit_user(user_id):
     return render_template('user-edit.html', user=user)
 
 
-@app.route('/users/<int:user_id>/edit', methods=['POST'])
+@blogly.route('/users/<int:user_id>/edit', methods=['POST'])
 def submit_edit_user(user_id):
     """Submit edit user page"""
     user = User.query.get_or_404(user_id)
@@ -91,37 +440,50 @@ def submit_edit_user(user_id):
     last_name = request.form["last_name"]
     user.last_name = last_name if last_name else user.last_name
 
-    profile_pic = request.form["profile_pic"]
+    try:
+        profile_pic = profile_pic_from_form()
+    except InvalidImageURL as err:
+        flash(str(err))
+        return redirect(f'/users/{ user.id }/edit')
+    except ValueError:
+        flash('Profile picture must be a JPEG, PNG, GIF or WebP image')
+        return redirect(f'/users/{ user.id }/edit')
     user.profile_pic = profile_pic if profile_pic else user.profile_pic
 
     db.session.add(user)
     db.session.commit()
+    page_cache.invalidate(f'user:{ user.id }', 'feeds')
 
     return redirect(f'/users/{ user.id }')
 
 
-@app.route('/users/<int:user_id>/delete', methods=['POST'])
+@blogly.route('/users/<int:user_id>/delete', methods=['POST'])
 def delete_user(user_id):
-    """Delete user"""
+    """Delete user, in the background if they have many posts"""
     user = User.query.get_or_404(user_id)
-    db.session.delete(user)
+    if user.post_count > current_app.config['DELETE_BACKGROUND_POSTS']:
+        job = queue_delete('user', user_id)
+        flash(f'User is being deleted in the background (job { job.id })')
+        return redirect('/users')
+
+    entities = delete_user_rows(user_id)
     db.session.commit()
+    page_cache.invalidate(*entities)
     flash('User has been deleted!')
 
     return redirect('/users')
 
 # posts----------------------------------------------------------------------------------------------------------
 
-@app.route('/users/<int:user_id>/posts/new')
+@blogly.route('/users/<int:user_id>/posts/new')
 def new_post(user_id):
     """Display new post page"""
     user = User.query.get_or_404(user_id)
-    tags = Tags.query.all()
 
-    return render_template('post-add.html', user=user, tags=tags)
+    return render_template('post-add.html', user=user, tag_boxes=tag_catalog.checkboxes('tag-name'))
 
 
-@app.route('/users/<int:user_id>/posts/new', methods=['POST'])
+@blogly.route('/users/<int:user_id>/posts/new', methods=['POST'])
 def submit_new_post(user_id):
     """Submit new post page"""
     user = User.query.get_or_404(user_id)
@@ -132,40 +494,86 @@ def submit_new_post(user_id):
     posted_by = user_id
 
     post = Post(title=title, content=content, posted_by=posted_by)
+    render_post(post)
 
     db.session.add(post)
-    db.session.commit()
+    db.session.flush()
 
-    tag_names = request.form.getlist('tag-name')
+    tag_ids = [int(tag) for tag in request.form.getlist('tag-name')]
+    added, removed = set_post_tags(post.id, tag_ids, current=set())
 
-    for tag in tag_names:
-        new_tag = PostTags(post_id=post.id, tag_id=tag)
-        db.session.add(new_tag)
-    
+    adjust_user_count(user_id, 1)
+    adjust_tag_counts(added, 1)
+    relisted = update_related([post.id])
     db.session.commit()
+    queue_related([post.id])
+    page_cache.invalidate('posts', f'user-posts:{ user_id }', *[f'tag:{ tag_id }' for tag_id in added],
+                          *[f'related:{ post_id }' for post_id in relisted])
+    place_post(post.id)
 
     return redirect(f'/users/{ user.id }')
 
 
-@app.route('/posts/<int:post_id>')
+def post_validators(post_id):
+    """Validator rows for a post's page"""
+    post = (db.session.query(Post.id, Post.updated_at, User.updated_at)
+            .join(User, User.id == Post.posted_by)
+            .filter(Post.id == post_id)
+            .first())
+    if post is None:
+        return None
+
+    # The post's tags and related posts in one query, keeping revalidation to two
+    tags = (select(literal('tag').label('kind'), Tags.id, Tags.updated_at, null().label('score'))
+            .join(PostTags, PostTags.tag_id == Tags.id)
+            .where(PostTags.post_id == post_id))
+    related = (select(literal('related'), Post.id, Post.updated_at, RelatedPost.score)
+               .join(RelatedPost, RelatedPost.related_id == Post.id)
+               .where(RelatedPost.post_id == post_id))
+    rows = db.session.execute(union_all(tags, related).order_by('kind', 'id'))
+
+    return [tuple(post)] + [tuple(row) for row in rows]
+
+
+@blogly.route('/posts/<int:post_id>')
+@counts_views
+@conditional(post_validators)
+@cached_page()
 def show_post(post_id):
     """Display post page"""
-    post = Post.query.get(post_id)
-    tags = PostTags.query.filter(PostTags.post_id == post_id)
+    page_cache.depends(f'post:{ post_id }')
+    # Tags join in with the post, leaving the second query for its related posts
+    post = (Post.query
+            .options(joinedload(Post.users), joinedload(Post.tags))
+            .filter_by(id=post_id)
+            .first_or_404())
+    related = related_posts(post_id)
+    page_cache.depends(f'user:{ post.posted_by }', f'related:{ post_id }', *[f'tag:{ tag.id }' for tag in post.tags],
+                       *[f'post:{ row.id }' for row in related])
 
-    return render_template('post-page.html', post=post, tags=tags)
-    
+    return render_template('post-page.html', post=post, related=related)
+
+
+@blogly.route('/posts/popular')
+def popular_posts():
+    """Display the most viewed posts, paging back with ?before=<cursor>"""
+    query = popular_query().options(joinedload(Post.users), selectinload(Post.tags))
+    rows, next_cursor = keyset_page(query, [PostViews.views, PostViews.post_id], request.args.get('before'),
+                                    per_page=current_app.config['POPULAR_PER_PAGE'], descending=True)
 
-@app.route('/posts/<int:post_id>/edit')
+    return render_template('posts-popular.html', rows=rows, next_cursor=next_cursor)
+
+
+@blogly.route('/posts/<int:post_id>/edit')
 def edit_post(post_id):
     """Display edit post page"""
-    post = Post.query.get_or_404(post_id)
-    tags = Tags.query.all()
+    post = Post.query.options(selectinload(Post.tags)).filter_by(id=post_id).first_or_404()
+    tag_boxes = tag_catalog.checkboxes('tags', {tag.id for tag in post.tags})
 
-    return render_template('post-edit.html', post=post, tags=tags)
+    return render_template('post-edit.html', post=post, tag_boxes=tag_boxes)
 
 
-@app.route('/posts/<int:post_id>/edit', methods=['POST'])
+@blogly.route('/posts/<int:post_id>/edit', methods=['POST'])
 def submit_edit_post(post_id):
     """Submit edit post page"""
     post = Post.query.get_or_404(post_id)
@@ -174,25 +582,44 @@ def submit_edit_post(post_id):
     post.title = title if title else post.title
 
     content = request.form["edit_post_content"]
-    post.content = content if content else post.content
+    if content and content != post.content:
+        post.content = content
+        render_post(post)
 
     tags = request.form.getlist('tags')
 
     post_tags = [int(tag) for tag in tags]
-    post.tags = Tags.query.filter(Tags.id.in_(post_tags)).all()
+    added, removed = set_post_tags(post.id, post_tags)
+    if added or removed:
+        touch(Post, [post.id])
 
     db.session.add(post)
+    adjust_tag_counts(added, 1)
+    adjust_tag_counts(removed, -1)
+    retagged = [post.id] if added or removed else []
+    relisted = update_related(retagged)
     db.session.commit()
+    queue_related(retagged)
+    page_cache.invalidate(f'post:{ post.id }', *[f'tag:{ tag_id }' for tag_id in added | removed],
+                          *[f'related:{ post_id }' for post_id in relisted])
+    place_post(post.id, removed)
 
     return redirect(f'/posts/{post.id}')
 
 
-@app.route('/posts/<int:post_id>/delete', methods=['POST'])
+@blogly.route('/posts/<int:post_id>/delete', methods=['POST'])
 def delete_post(post_id):
     """Delete post page"""
     post = Post.query.get_or_404(post_id)
+    tag_ids = [tag.id for tag in post.tags]
+
     db.session.delete(post)
+    adjust_user_count(post.posted_by, -1)
+    adjust_tag_counts(tag_ids, -1)
     db.session.commit()
+    page_cache.invalidate(f'post:{ post_id }', 'posts', f'user-posts:{ post.posted_by }',
+                          *[f'tag:{ tag_id }' for tag_id in tag_ids])
+    remove_post(post_id, post_scopes(post.posted_by, tag_ids))
     flash('Post has been deleted!')
 
 
@@ -200,73 +627,218 @@ def delete_post(post_id):
 
 # tags----------------------------------------------------------------------------------------------------------
 
-@app.route('/tags')
+@blogly.route('/tags')
+@cached_page()
 def show_all_tags():
-    """Display all tags"""
-    tags = Tags.query.all()
+    """Display all tags with their post counts"""
+    page_cache.depends('tags')
+    tags = Tags.query.order_by(Tags.name).all()
+    page_cache.depends(*[f'tag:{ tag.id }' for tag in tags])
 
     return render_template('tags-all.html', tags=tags)
 
 
-@app.route('/tags/<int:tag_id>')
+def tag_validators(tag_id):
+    """Validator rows for a tag's page"""
+    tag = db.session.query(Tags.id, Tags.updated_at).filter_by(id=tag_id).first()
+    if tag is None:
+        return None
+
+    posts = (db.session.query(Post.id, Post.updated_at, User.updated_at)
+             .join(PostTags, PostTags.post_id == Post.id)
+             .join(User, User.id == Post.posted_by)
+             .filter(PostTags.tag_id == tag_id)
+             .order_by(Post.id))
+
+    return [tuple(tag)] + [tuple(post) for post in posts]
+
+
+@blogly.route('/tags/<int:tag_id>')
+@conditional(tag_validators)
+@cached_page()
 def show_tag(tag_id):
     """Display specific tag details"""
-    tag = Tags.query.get_or_404(tag_id)
+    page_cache.depends(f'tag:{ tag_id }')
+    tag = (Tags.query
+           .options(selectinload(Tags.posts).joinedload(Post.users))
+           .filter_by(id=tag_id)
+           .first_or_404())
+    for post in tag.posts:
+        page_cache.depends(f'post:{ post.id }', f'user:{ post.posted_by }')
 
     return render_template('tag-page.html', tag=tag)
 
 
-@app.route('/tags/new')
+@blogly.route('/tags/<int:tag_id>/feed')
+def tag_feed(tag_id):
+    """Feed of a tag's newest posts"""
+
+    return feed_response(f'tag:{ tag_id }')
+
+
+@blogly.route('/tags/new')
 def new_tag():
     """Display new tag page"""
 
     return render_template('tag-add.html')
 
 
-@app.route('/tags/new', methods=['POST'])
+@blogly.route('/tags/new', methods=['POST'])
 def submit_new_tag():
     """Submit new tag page"""
     tag = request.form["tag_name"]
     new_tag = Tags(name=tag)
     db.session.add(new_tag)
+    bump_version('tags')
     db.session.commit()
+    page_cache.invalidate('tags')
 
     return redirect('/tags')
 
 
-@app.route('/tags/<int:tag_id>/edit')
+@blogly.route('/tags/<int:tag_id>/edit')
 def edit_tag(tag_id):
-    """Display specific tag details"""
-    tag = Tags.query.get_or_404(tag_id)
-    posts = Post.query.all()
+    """Display edit tag page with the posts currently tagged"""
+    tag = Tags.query.options(selectinload(Tags.posts)).filter_by(id=tag_id).first_or_404()
 
-    return render_template('tag-edit.html', tag=tag, posts=posts)
+    return render_template('tag-edit.html', tag=tag)
 
 
-@app.route('/tags/<int:tag_id>/edit', methods=['POST'])
+@blogly.route('/tags/<int:tag_id>/edit', methods=['POST'])
 def submit_edit_tag(tag_id):
-    """Submit specific tag details"""
+    """Submit specific tag details, either a full ?posts= list or add_posts/remove_posts changes"""
     tag = Tags.query.get_or_404(tag_id)
-    tag.name = request.form['tag_name']
-    posts = request.form.getlist('posts')
-    post_ids = [int(num) for num in posts]
-    tag.posts = Post.query.filter(Post.id.in_(post_ids)).all()
+    if tag.name != request.form['tag_name']:
+        tag.name = request.form['tag_name']
+        bump_version('tags')
+
+    if 'posts' in request.form:
+        post_ids = [int(num) for num in request.form.getlist('posts')]
+        added, removed = set_tag_posts(tag_id, post_ids)
+    else:
+        add_ids = [int(num) for num in request.form.getlist('add_posts')]
+        remove_ids = [int(num) for num in request.form.getlist('remove_posts')]
+        added, removed = change_tag_posts(tag_id, add_ids, remove_ids)
+
+    if added or removed:
+        touch(Tags, [tag_id])
+        touch(Post, added | removed)
 
     db.session.add(tag)
+    adjust_tag_counts([tag_id], len(added) - len(removed))
+    relisted = update_related(added | removed)
     db.session.commit()
+    queue_related(added | removed)
+    # The tag's name shows in every feed its posts are in
+    page_cache.invalidate(f'tag:{ tag_id }', 'feeds', *[f'post:{ post_id }' for post_id in added | removed],
+                          *[f'related:{ post_id }' for post_id in relisted])
 
     return redirect(f'/tags/{ tag_id }')
 
 
-@app.route('/tags/<int:tag_id>/delete', methods=['POST'])
+@blogly.route('/tags/<int:tag_id>/delete', methods=['POST'])
 def delete_tag(tag_id):
-    """Delete tag"""
+    """Delete tag and its posts, in the background if it has many"""
     tag = Tags.query.get_or_404(tag_id)
-    db.session.delete(tag)
+    if tag.post_count > current_app.config['DELETE_BACKGROUND_POSTS']:
+        job = queue_delete('tag', tag_id)
+        flash(f'Tag is being deleted in the background (job { job.id })')
+        return redirect('/tags')
+
+    entities = delete_tag_rows(tag_id)
     db.session.commit()
+    page_cache.invalidate(*entities)
     flash('Tag has been deleted!')
 
     return redirect('/tags')
 
 
+@blogly.route('/api/deletes/<int:job_id>')
+def api_delete_job(job_id):
+    """JSON status of a background delete"""
+    job = DeleteJob.query.get_or_404(job_id)
+
+    return jsonify(job.serialize())
+
+
+@blogly.cli.command('run-deletes')
+def run_deletes_command():
+    """Finish background deletes left unfinished by a stopped worker"""
+    job_ids = [job_id for (job_id,) in db.session.query(DeleteJob.id).filter(DeleteJob.status.in_(ACTIVE))]
+    db.session.commit()
+
+    for job_id in job_ids:
+        run_delete_job(current_app._get_current_object(), job_id)
+        click.echo(f'Delete job {job_id}: {db.session.get(DeleteJob, job_id).status}')
+
+
+@blogly.cli.command('install-cascades')
+def install_cascades_command():
+    """Make an existing database's foreign keys cascade on delete"""
+    try:
+        with db.engine.begin() as connection:
+            install_cascades(connection)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+
+    click.echo('Cascading foreign keys installed')
+
+
+@blogly.cli.command('recount')
+def recount_command():
+    """Recompute every user and tag post counter"""
+    recount_users()
+    recount_tags()
+    db.session.commit()
+
+    click.echo('Post counts recomputed')
+
+
+@blogly.cli.command('render-posts')
+@click.option('--all', 'everything', is_flag=True, help='Re-render every post, not just those rendered by an older version')
+@click.option('--batch', default=1000, show_default=True)
+def render_posts_command(everything, batch):
+    """Add the rendered-content columns if missing, then render posts' Markdown"""
+    with db.engine.begin() as connection:
+        install_render_columns(connection)
+
+    count = rerender_posts(batch, everything)
+    if count and page_cache.backend is not None:
+        # Every page and feed showing a post may have changed
+        page_cache.backend.clear()
+
+    click.echo(f'Rendered {count} posts')
+
+
+@blogly.cli.command('rebuild-related')
+@click.option('--batch', default=500, show_default=True, help='Posts per transaction')
+def rebuild_related_command(batch):
+    """Recompute every post's related posts"""
+    count = rebuild_related(batch)
+    if page_cache.backend is not None:
+        # Every post page shows its related posts
+        page_cache.backend.clear()
+
+    click.echo(f'Related posts rebuilt for {count} posts')
+
+
+@blogly.cli.command('export')
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(list(DUMP_WRITERS)), help='Defaults to csv for .csv files, else jsonl')
+def export_command(output, fmt):
+    """Stream every user, tag and post to a dump file"""
+    DUMP_WRITERS[fmt or dump_format(output.name)](export_records(), output)
+
+
+@blogly.cli.command('import')
+@click.argument('input', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(list(DUMP_READERS)), help='Defaults to csv for .csv files, else jsonl')
+def import_command(input, fmt):
+    """Add the users, tags and posts in a dump file, with new ids"""
+    try:
+        counts, entities = import_records(DUMP_READERS[fmt or dump_format(input.name)](input))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    page_cache.invalidate(*entities)
 
+    click.echo(f"Imported {counts['user']} users, {counts['tag']} tags and {counts['post']} posts")
@@ -0,0 +1,191 @@
+"""ASGI entry point serving Blogly's read pages from an asyncio engine.
+
+    uvicorn --factory asgi:create_asgi_app --workers 2
+
+GET and HEAD requests for /, /users/<id>, /posts/<id> and /tags/<id> run as
+coroutines on an AsyncEngine over the same models, through asyncpg for
+PostgreSQL or aiosqlite for SQLite. While one of them waits on the database
+the worker keeps serving the others, so a process holds many requests in
+flight on a few pooled connections instead of one per thread. Everything
+else, and those pages when they carry flashed messages, goes to the WSGI
+app on a thread. The async pages render the same templates, run the app's
+before/after request hooks such as metrics, and count post views, but skip
+the page cache and conditional GET, which are synchronous.
+"""
+import random
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, current_app, render_template, request, session
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.pool import NullPool
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.routing import Map, Rule
+
+from app import create_app
+from models import User, Post, Tags
+from pagination import keyset_query, split_page, page_size
+from pool import async_engine_options
+from related import related_query
+from routing import READ_METHODS
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+NEWEST_FIRST = [Post.posted_at, Post.id]
+
+
+def async_url(url):
+    """The same database URL through its asyncio driver"""
+    url = make_url(url)
+
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def async_engine(config, url):
+    return create_async_engine(async_url(url), **async_engine_options(config, url))
+
+
+async def newest_posts(db_session, stmt, per_page):
+    """A page of stmt's posts, newest first, older than the ?before= cursor"""
+    stmt = keyset_query(stmt, NEWEST_FIRST, request.args.get('before'), per_page=per_page, descending=True)
+
+    return split_page((await db_session.scalars(stmt)).all(), NEWEST_FIRST, per_page)
+
+
+async def homepage(db_session):
+    stmt = select(Post).options(joinedload(Post.users), selectinload(Post.tags))
+    posts, next_cursor = await newest_posts(db_session, stmt, current_app.config['FEED_PER_PAGE'])
+
+    return render_template('home.html', posts=posts, next_cursor=next_cursor)
+
+
+async def show_user(db_session, user_id):
+    user = await db_session.get(User, user_id)
+    if user is None:
+        abort(404)
+
+    per_page = page_size(current_app.config['USER_POSTS_PER_PAGE'], current_app.config['USERS_MAX_PER_PAGE'])
+    posts, next_cursor = await newest_posts(db_session, select(Post).filter_by(posted_by=user_id), per_page)
+
+    return render_template('user-page.html', user=user, posts=posts, next_cursor=next_cursor)
+
+
+async def show_post(db_session, post_id):
+    stmt = select(Post).options(joinedload(Post.users), selectinload(Post.tags)).filter_by(id=post_id)
+    post = (await db_session.scalars(stmt)).first()
+    if post is None:
+        abort(404)
+    related = (await db_session.execute(related_query(post_id))).all()
+    body = render_template('post-page.html', post=post, related=related)
+    # As counts_views does for the WSGI view
+    current_app.extensions['view_counter'].record(post_id)
+
+    return body
+
+
+async def show_tag(db_session, tag_id):
+    stmt = select(Tags).options(selectinload(Tags.posts).joinedload(Post.users)).filter_by(id=tag_id)
+    tag = (await db_session.scalars(stmt)).first()
+    if tag is None:
+        abort(404)
+
+    return render_template('tag-page.html', tag=tag)
+
+
+ROUTES = [
+    Rule('/', endpoint=homepage),
+    Rule('/users/<int:user_id>', endpoint=show_user),
+    Rule('/posts/<int:post_id>', endpoint=show_post),
+    Rule('/tags/<int:tag_id>', endpoint=show_tag),
+]
+
+
+class AsyncReads:
+    """ASGI app serving ROUTES itself and handing every other request to the WSGI app"""
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.urls = Map([rule.empty() for rule in ROUTES])
+        self.primary = async_engine(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+        self.replicas = [async_engine(app.config, url) for url in app.config['DATABASE_REPLICA_URLS']]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] in READ_METHODS:
+            try:
+                view, args = self.urls.bind('').match(scope['path'])
+            except NotFound:
+                pass
+            else:
+                if await self.serve(view, args, scope, send):
+                    return
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def dispose(self):
+        """Close pooled connections, which belong to the event loop that opened them"""
+        for engine in [self.primary, *self.replicas]:
+            # A NullPool holds nothing, and SQLAlchemy 1.4 rebuilds it with a first-connect lock that
+            # deadlocks concurrent tasks
+            if not isinstance(engine.pool, NullPool):
+                await engine.dispose()
+
+    def engine(self):
+        """A replica unless the client wrote recently, as routing.choose_bind does for the WSGI app"""
+        if self.replicas and session.get('primary_until', 0) < time.time():
+            return random.choice(self.replicas)
+
+        return self.primary
+
+    def request_context(self, scope):
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+        host = dict(headers).get('host', 'localhost')
+
+        return self.app.test_request_context(scope['path'], method=scope['method'], headers=headers,
+                                             query_string=scope['query_string'],
+                                             base_url=f'{scope["scheme"]}://{host}{scope.get("root_path", "")}')
+
+    async def serve(self, view, args, scope, send):
+        """Render view's page and send it, or return False to leave the request to the WSGI app"""
+        with self.request_context(scope):
+            # Pages showing flashed messages change the session; leave those to the WSGI app
+            if '_flashes' in session:
+                return False
+
+            try:
+                resp = self.app.preprocess_request()
+                if resp is None:
+                    async with AsyncSession(self.engine()) as db_session:
+                        resp = await view(db_session, **args)
+                resp = self.app.make_response(resp)
+            except HTTPException as err:
+                resp = self.app.make_response(self.app.handle_user_exception(err))
+            resp = self.app.process_response(resp)
+
+        await send({'type': 'http.response.start', 'status': resp.status_code,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in resp.headers.items()]})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else resp.get_data()})
+
+        return True
+
+
+def create_asgi_app(config=None, overrides=None):
+    """Build the Blogly app for a config profile and wrap it for ASGI servers"""
+    return AsyncReads(create_app(config, overrides))
@@ -0,0 +1,482 @@
+"""Route-level load benchmarks for Blogly.
+
+    python bench.py seed --users 100000 --posts 5000000 --tags 10000
+    python bench.py run --concurrency 8 --requests 200 --output bench.json
+    python bench.py compare-async --concurrency 64 --requests 1000
+
+seed adds a synthetic corpus to the configured database, with post authors
+and tags skewed so a few users and tags have most of the posts. run drives
+every route through the Flask test client, or a running server with --url,
+and reports p50/p95/p99 latency, throughput and SQL statements per request
+for each as JSON, so runs on different commits can be compared.
+compare-async drives the pages asgi.py serves asynchronously both ways in
+process, one thread per in-flight request against one task per in-flight
+request, and adds the peak Python memory per in-flight request to each.
+That comes from tracemalloc, so it leaves out the threads' stacks.
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import subprocess
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import click
+from sqlalchemy import func, insert
+
+from app import create_app
+from counters import recount_users, recount_tags
+from models import db, User, Post, Tags, PostTags
+
+WORDS = ('apple', 'river', 'stone', 'cloud', 'garden', 'piano', 'rocket', 'forest', 'coffee', 'window',
+         'mountain', 'ocean', 'thunder', 'candle', 'bridge', 'marble', 'lantern', 'harbor', 'meadow', 'falcon',
+         'copper', 'velvet', 'canyon', 'glacier', 'orchard', 'compass', 'saddle', 'quartz', 'ember', 'willow',
+         'basket', 'cobalt', 'dune', 'feather', 'granite', 'hollow', 'island', 'jungle', 'kettle', 'lagoon')
+
+BATCH = 10000
+SKEW = 1.1
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def skewed(n):
+    """Cumulative weights favouring earlier items with a Zipf-like skew"""
+    return list(accumulate(1 / (rank + 1) ** SKEW for rank in range(n)))
+
+
+def sentence(rng, length):
+    return ' '.join(rng.choices(WORDS, k=length))
+
+
+def chunks(total):
+    for start in range(0, total, BATCH):
+        yield range(start, min(start + BATCH, total))
+
+
+def new_ids(model, after):
+    """Ids of model rows added after id `after`, in order"""
+    return [row_id for (row_id,) in db.session.query(model.id).filter(model.id > after).order_by(model.id)]
+
+
+def seed_corpus(users, posts, tags, max_tags=3, seed=0, echo=lambda message: None):
+    """Bulk-insert a synthetic corpus alongside any existing rows"""
+    rng = random.Random(seed)
+    last_user, last_post, last_tag = (db.session.query(func.coalesce(func.max(model.id), 0)).scalar()
+                                      for model in (User, Post, Tags))
+
+    for chunk in chunks(users):
+        db.session.execute(insert(User.__table__), [
+            {'first_name': rng.choice(WORDS).title(), 'last_name': f'{rng.choice(WORDS).title()}{last_user + i}'}
+            for i in chunk])
+        db.session.commit()
+    user_ids = new_ids(User, last_user)
+    echo(f'{len(user_ids)} users')
+
+    db.session.execute(insert(Tags.__table__), [{'name': f'{rng.choice(WORDS)}-{last_tag + i}'} for i in range(tags)])
+    db.session.commit()
+    tag_ids = new_ids(Tags, last_tag)
+    echo(f'{len(tag_ids)} tags')
+
+    user_weights, tag_weights = skewed(len(user_ids)), skewed(len(tag_ids))
+    now = datetime.utcnow()
+    for chunk in chunks(posts):
+        authors = rng.choices(user_ids, cum_weights=user_weights, k=len(chunk))
+        db.session.execute(insert(Post.__table__), [
+            {'title': sentence(rng, rng.randint(2, 6)).capitalize(),
+             'content': sentence(rng, rng.randint(20, 120)),
+             'posted_at': now - timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+             'posted_by': author}
+            for author in authors])
+        db.session.commit()
+        echo(f'{chunk.stop} posts')
+
+    after = last_post
+    while tag_ids:
+        post_ids = [post_id for (post_id,) in db.session.query(Post.id)
+                    .filter(Post.id > after).order_by(Post.id).limit(BATCH)]
+        if not post_ids:
+            break
+
+        links = [{'post_id': post_id, 'tag_id': tag_id}
+                 for post_id in post_ids
+                 for tag_id in set(rng.choices(tag_ids, cum_weights=tag_weights, k=rng.randint(0, max_tags)))]
+        if links:
+            db.session.execute(insert(PostTags.__table__), links)
+        db.session.commit()
+        after = post_ids[-1]
+
+    recount_users()
+    recount_tags()
+    db.session.commit()
+    echo('counters recomputed')
+
+
+def sample_ids(model, k):
+    return [row_id for (row_id,) in db.session.query(model.id).order_by(func.random()).limit(k)]
+
+
+def route_plan(rng, writes=False):
+    """Request makers for each route, keyed by endpoint, using sampled existing rows"""
+    user_ids, post_ids, tag_ids = sample_ids(User, 100), sample_ids(Post, 100), sample_ids(Tags, 100)
+    if not (user_ids and post_ids and tag_ids):
+        raise click.ClickException('The database needs users, posts and tags; run "python bench.py seed" first')
+
+    def get(url):
+        return lambda: ('GET', url(), None)
+
+    def some(ids):
+        return ','.join(map(str, rng.sample(ids, min(20, len(ids)))))
+
+    plan = {
+        'homepage': get(lambda: '/'),
+        'api_feed': get(lambda: '/api/feed'),
+        'site_feed': get(lambda: '/feed'),
+        'user_feed': get(lambda: f'/users/{rng.choice(user_ids)}/feed'),
+        'tag_feed': get(lambda: f'/tags/{rng.choice(tag_ids)}/feed?format=rss'),
+        'search': get(lambda: f'/search?q={rng.choice(WORDS)}'),
+        'api_search': get(lambda: f'/api/search?q={rng.choice(WORDS)}+{rng.choice(WORDS)}'),
+        'api_post_lookup': get(lambda: f'/api/posts/lookup?q={rng.choice(WORDS)[:2]}'),
+        'show_all_users': get(lambda: '/users'),
+        'api_users': get(lambda: '/api/users'),
+        'new_user': get(lambda: '/users/new'),
+        'show_user': get(lambda: f'/users/{rng.choice(user_ids)}'),
+        'edit_user': get(lambda: f'/users/{rng.choice(user_ids)}/edit'),
+        'new_post': get(lambda: f'/users/{rng.choice(user_ids)}/posts/new'),
+        'show_post': get(lambda: f'/posts/{rng.choice(post_ids)}'),
+        'popular_posts': get(lambda: '/posts/popular'),
+        'edit_post': get(lambda: f'/posts/{rng.choice(post_ids)}/edit'),
+        'show_all_tags': get(lambda: '/tags'),
+        'show_tag': get(lambda: f'/tags/{rng.choice(tag_ids)}'),
+        'new_tag': get(lambda: '/tags/new'),
+        'edit_tag': get(lambda: f'/tags/{rng.choice(tag_ids)}/edit'),
+        'metrics': get(lambda: '/metrics'),
+        'api_pool_stats': get(lambda: '/api/pool/stats'),
+        'api_cache_stats': get(lambda: '/api/cache/stats'),
+        'api.users': get(lambda: f'/api/v1/users?ids={some(user_ids)}'),
+        'api.posts': get(lambda: f'/api/v1/posts?fields=title,tags&ids={some(post_ids)}'),
+        'api.tags': get(lambda: '/api/v1/tags'),
+    }
+
+    digest = (db.session.query(User.profile_pic).filter(User.profile_pic.like('media:%')).limit(1).scalar())
+    if digest:
+        plan['serve_media'] = get(lambda: f'/media/{digest[len("media:"):]}')
+
+    if writes:
+        # Resubmitting rows unchanged exercises the write paths without altering the corpus
+        post_tags = {post_id: [] for post_id in post_ids}
+        for post_id, tag_id in db.session.query(PostTags.post_id, PostTags.tag_id).filter(
+                PostTags.post_id.in_(post_ids)):
+            post_tags[post_id].append(tag_id)
+        tag_names = dict(db.session.query(Tags.id, Tags.name).filter(Tags.id.in_(tag_ids)))
+
+        def edit_post():
+            post_id = rng.choice(post_ids)
+            return 'POST', f'/posts/{post_id}/edit', {'edit_post_title': '', 'edit_post_content': '',
+                                                      'tags': post_tags[post_id]}
+
+        def edit_tag():
+            tag_id = rng.choice(tag_ids)
+            return 'POST', f'/tags/{tag_id}/edit', {'tag_name': tag_names[tag_id]}
+
+        plan['submit_edit_post'] = edit_post
+        plan['submit_edit_tag'] = edit_tag
+
+    return plan
+
+
+def test_client_caller(app):
+    """Per-thread request function using the Flask test client"""
+    def make():
+        client = app.test_client()
+
+        def call(method, url, data):
+            resp = client.open(url, method=method, data=data)
+            resp.get_data()
+            match = QUERIES.search(resp.headers.get('Server-Timing', ''))
+            return resp.status_code, int(match.group(1)) if match else None
+
+        return call
+
+    return make
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def http_caller(base_url):
+    """Per-thread request function against a running server"""
+    def make():
+        opener = urllib.request.build_opener(NoRedirects)
+
+        def call(method, url, data):
+            body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+            try:
+                resp = opener.open(urllib.request.Request(base_url + url, data=body, method=method))
+            except urllib.error.HTTPError as err:
+                resp = err
+            resp.read()
+            match = QUERIES.search(resp.headers.get('Server-Timing', ''))
+            return resp.status, int(match.group(1)) if match else None
+
+        return call
+
+    return make
+
+
+def asgi_caller(application):
+    """Request coroutine calling an ASGI app in process"""
+    async def call(method, url, data):
+        path, _, query = url.partition('?')
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                 'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0),
+                 'server': ('localhost', 80)}
+        body = urllib.parse.urlencode(data or {}, doseq=True).encode()
+        if data is not None:
+            scope['headers'] += [(b'content-type', b'application/x-www-form-urlencoded'),
+                                 (b'content-length', str(len(body)).encode())]
+        response = {'body': b''}
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode(): value.decode() for name, value in message['headers']}
+            else:
+                response['body'] += message.get('body', b'')
+
+        await application(scope, receive, send)
+        return response
+
+    return call
+
+
+def percentile(ordered, p):
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def drive(make_caller, make_request, requests, concurrency):
+    """Send requests to one route from concurrency threads; returns (samples, wall seconds)"""
+    def worker(count):
+        call = make_caller()
+        samples = []
+        for _ in range(count):
+            method, url, data = make_request()
+            start = time.perf_counter()
+            status, queries = call(method, url, data)
+            samples.append((time.perf_counter() - start, status, queries))
+        return samples
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = [sample for batch in pool.map(worker, shares) for sample in batch]
+
+    return samples, time.perf_counter() - start
+
+
+async def drive_async(call, make_request, requests, concurrency):
+    """Send requests to one route from concurrency tasks; returns (samples, wall seconds)"""
+    async def worker(count):
+        samples = []
+        for _ in range(count):
+            method, url, data = make_request()
+            start = time.perf_counter()
+            response = await call(method, url, data)
+            samples.append((time.perf_counter() - start, response['status'], None))
+        return samples
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    batches = await asyncio.gather(*[worker(share) for share in shares])
+
+    return [sample for batch in batches for sample in batch], time.perf_counter() - start
+
+
+def peak_memory(run):
+    """Peak bytes of Python memory allocated while run() executes, above what was allocated before"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        run()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(samples, wall):
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+
+    return {
+        'requests': len(samples),
+        'errors': sum(status >= 400 for _, status, _ in samples),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'throughput_rps': round(len(samples) / wall, 1),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(app, requests=100, concurrency=4, warmup=5, writes=False, url=None, routes=None, seed=0,
+                  echo=lambda message: None):
+    """Benchmark each route and return the report"""
+    rng = random.Random(seed)
+    with app.app_context():
+        plan = route_plan(rng, writes)
+        dataset = {name: db.session.query(func.count(model.id)).scalar()
+                   for name, model in (('users', User), ('posts', Post), ('tags', Tags))}
+        db.session.remove()
+
+    make_caller = http_caller(url.rstrip('/')) if url else test_client_caller(app)
+    results = {}
+    for endpoint, make_request in plan.items():
+        if routes and endpoint not in routes:
+            continue
+
+        drive(make_caller, make_request, warmup, 1)
+        results[endpoint] = summarize(*drive(make_caller, make_request, requests, concurrency))
+        echo(f'{endpoint:<20} p50 {results[endpoint]["p50_ms"]:>9.2f} ms  '
+             f'p99 {results[endpoint]["p99_ms"]:>9.2f} ms  {results[endpoint]["throughput_rps"]:>8.1f} req/s')
+
+    return {
+        'commit': git_commit(),
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'target': url or 'test-client',
+        'concurrency': concurrency,
+        'requests_per_route': requests,
+        'dataset': dataset,
+        'routes': results,
+    }
+
+
+def compare_async(app, application, requests=100, concurrency=32, warmup=5, routes=None, seed=0,
+                  echo=lambda message: None):
+    """Benchmark the async pages against the same pages on the WSGI app and return the report"""
+    from asgi import ROUTES
+
+    rng = random.Random(seed)
+    with app.app_context():
+        plan = route_plan(rng)
+        db.session.remove()
+
+    def run_async(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await application.dispose()
+
+        return asyncio.run(main())
+
+    call = asgi_caller(application)
+    make_caller = test_client_caller(app)
+    results = {}
+    for endpoint in [rule.endpoint.__name__ for rule in ROUTES]:
+        if routes and endpoint not in routes:
+            continue
+        make_request = plan[endpoint]
+
+        drive(make_caller, make_request, warmup, 1)
+        run_async(drive_async(call, make_request, warmup, 1))
+        sync = summarize(*drive(make_caller, make_request, requests, concurrency))
+        async_ = summarize(*run_async(drive_async(call, make_request, requests, concurrency)))
+
+        # A second pass per mode, as tracemalloc slows the first down
+        sync['memory_per_in_flight_kb'] = round(peak_memory(
+            lambda: drive(make_caller, make_request, concurrency, concurrency)) / concurrency / 1024, 1)
+        async_['memory_per_in_flight_kb'] = round(peak_memory(
+            lambda: run_async(drive_async(call, make_request, concurrency, concurrency))) / concurrency / 1024, 1)
+
+        results[endpoint] = {'sync': sync, 'async': async_}
+        echo(f'{endpoint:<12} sync {sync["throughput_rps"]:>8.1f} req/s {sync["memory_per_in_flight_kb"]:>8.1f} KiB  '
+             f'async {async_["throughput_rps"]:>8.1f} req/s {async_["memory_per_in_flight_kb"]:>8.1f} KiB')
+
+    return {
+        'commit': git_commit(),
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'concurrency': concurrency,
+        'requests_per_route': requests,
+        'routes': results,
+    }
+
+
+@click.group()
+@click.option('--config', default='production', show_default=True, help='Config profile to build the app with')
+@click.pass_context
+def cli(ctx, config):
+    """Seed a synthetic corpus and benchmark Blogly's routes"""
+    ctx.obj = create_app(config, {'SERVER_TIMING': True, 'SQLALCHEMY_ECHO': False})
+
+
+@cli.command()
+@click.option('--users', default=1000, show_default=True)
+@click.option('--posts', default=20000, show_default=True)
+@click.option('--tags', default=200, show_default=True)
+@click.option('--max-tags', default=3, show_default=True, help='Most tags on one post')
+@click.option('--seed', default=0, show_default=True)
+@click.pass_obj
+def seed(app, users, posts, tags, max_tags, seed):
+    """Add a synthetic corpus to the database"""
+    with app.app_context():
+        db.create_all()
+        seed_corpus(users, posts, tags, max_tags=max_tags, seed=seed, echo=click.echo)
+
+
+@cli.command()
+@click.option('--requests', default=100, show_default=True, help='Requests per route')
+@click.option('--concurrency', default=4, show_default=True)
+@click.option('--warmup', default=5, show_default=True, help='Unmeasured requests per route')
+@click.option('--writes/--no-writes', default=False, help='Also resubmit posts and tags unchanged')
+@click.option('--url', help='Benchmark a running server instead of the test client')
+@click.option('--route', 'routes', multiple=True, help='Only benchmark these endpoints')
+@click.option('--output', type=click.File('w'), default='-', help='Where to write the JSON report')
+@click.pass_obj
+def run(app, requests, concurrency, warmup, writes, url, routes, output):
+    """Benchmark every route and write a JSON report"""
+    report = run_benchmark(app, requests, concurrency, warmup, writes, url, routes,
+                           echo=lambda message: click.echo(message, err=True))
+    json.dump(report, output, indent=2)
+    output.write('\n')
+
+
+@cli.command('compare-async')
+@click.option('--requests', default=200, show_default=True, help='Requests per route and mode')
+@click.option('--concurrency', default=32, show_default=True, help='Requests in flight at once')
+@click.option('--warmup', default=5, show_default=True, help='Unmeasured requests per route and mode')
+@click.option('--route', 'routes', multiple=True, help='Only benchmark these endpoints')
+@click.option('--output', type=click.File('w'), default='-', help='Where to write the JSON report')
+@click.pass_obj
+def compare_async_command(app, requests, concurrency, warmup, routes, output):
+    """Compare the async read pages with the WSGI app's and write a JSON report"""
+    from asgi import AsyncReads
+
+    report = compare_async(app, AsyncReads(app), requests, concurrency, warmup, routes,
+                           echo=lambda message: click.echo(message, err=True))
+    json.dump(report, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,66 @@
+"""Per-worker cache of the tag catalogue for Blogly.
+
+Every post form lists all tags as checkboxes. Each worker keeps the tag
+list and its rendered checkboxes in memory, stamped with the 'tags' row of
+catalog_versions. Whatever adds, renames or deletes tags bumps that row in
+the same transaction. A form request then costs one primary key lookup of
+the version, and a worker only re-reads tags after some worker bumps it.
+"""
+from collections import namedtuple
+
+from markupsafe import Markup
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Tags, CatalogVersion
+
+CHECKBOX = Markup('<input type="checkbox" name="{field}" id="tag_{id}" value="{id}"{checked}>\n'
+                  '<label for="tag_{id}">{name}</label>\n')
+
+Snapshot = namedtuple('Snapshot', 'version tags boxes')
+
+
+def catalog_version(name):
+    return db.session.execute(select(CatalogVersion.version).where(CatalogVersion.name == name)).scalar() or 0
+
+
+def bump_version(name):
+    """Mark a catalogue changed for every worker, as part of the caller's transaction"""
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(CatalogVersion).values(name=name, version=1)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=[CatalogVersion.name],
+                                                  set_={'version': CatalogVersion.version + 1}))
+
+
+class TagCatalog:
+    """Every tag's id and name, and their form checkboxes, re-read only when the tags version moves"""
+
+    def __init__(self):
+        self.snapshot = Snapshot(None, [], {})
+
+    def current(self):
+        # The version is read before the tags, so a change racing the refresh leaves the version stale,
+        # never the tags, and the next request reloads
+        version = catalog_version('tags')
+        snapshot = self.snapshot
+        if snapshot.version != version:
+            tags = [tuple(row) for row in db.session.query(Tags.id, Tags.name).order_by(Tags.id)]
+            snapshot = self.snapshot = Snapshot(version, tags, {})
+
+        return snapshot
+
+    def checkboxes(self, field, checked_ids=()):
+        """A checkbox named field for every tag, ticking those in checked_ids"""
+        snapshot = self.current()
+        if field not in snapshot.boxes:
+            snapshot.boxes[field] = [
+                (tag_id, CHECKBOX.format(field=field, id=tag_id, name=name, checked=''),
+                 CHECKBOX.format(field=field, id=tag_id, name=name, checked=Markup(' checked')))
+                for tag_id, name in snapshot.tags]
+
+        return Markup('').join(checked if tag_id in checked_ids else unchecked
+                               for tag_id, unchecked, checked in snapshot.boxes[field])
+
+
+def init_catalog(app):
+    app.extensions['tag_catalog'] = TagCatalog()
@@ -0,0 +1,56 @@
+"""Conditional GET (ETag / Last-Modified / 304) for Blogly pages."""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+
+def conditional(validators):
+    """Decorate a view to answer revalidations with 304 before rendering.
+
+    validators takes the view's arguments and returns rows of ids and
+    updated_at timestamps covering everything the page shows, or None if
+    the page's main entity doesn't exist.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pages carrying flashed messages are one-offs
+            if '_flashes' in session:
+                return view(*args, **kwargs)
+
+            rows = validators(*args, **kwargs)
+            if rows is None:
+                return view(*args, **kwargs)
+
+            etag = hashlib.sha1(repr((request.full_path, rows)).encode()).hexdigest()
+            stamps = [value for row in rows for value in row if isinstance(value, datetime)]
+            last_modified = max(stamps).replace(tzinfo=timezone.utc, microsecond=0) if stamps else None
+
+            if is_fresh(etag, last_modified):
+                resp = current_app.response_class(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+
+            resp.set_etag(etag)
+            if last_modified:
+                resp.last_modified = last_modified
+            resp.cache_control.no_cache = True
+
+            return resp
+
+        return wrapper
+
+    return decorator
+
+
+def is_fresh(etag, last_modified):
+    """Whether the client's cached copy matches, preferring If-None-Match over If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+
+    return False
@@ -0,0 +1,96 @@
+"""Configuration profiles for Blogly."""
+import os
+
+
+class Config:
+    """Settings shared by every profile"""
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///blogly')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+
+    # 'queue' pools connections per worker; 'null' leaves pooling to PgBouncer
+    DB_POOL = os.environ.get('DB_POOL', 'queue')
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 30 * 60
+    DB_POOL_PRE_PING = True
+
+    # Read-only requests use these; clients stay on the primary for a while after writing
+    DATABASE_REPLICA_URLS = os.environ.get('DATABASE_REPLICA_URLS', '').split()
+    REPLICA_STICKY_SECONDS = 10
+
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'HendrixIsAnnoying123')
+    DEBUG_TB_ENABLED = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    FEED_PER_PAGE = 5
+    FEED_ENTRIES = 20
+    POPULAR_PER_PAGE = 20
+    RELATED_POSTS = 5
+    RELATED_MAX_TAG_POSTS = 1000
+    RELATED_SYNC_POSTS = 20
+    RELATED_BATCH = 100
+    USERS_PER_PAGE = 50
+    USERS_MAX_PER_PAGE = 200
+    USER_POSTS_PER_PAGE = 20
+    USER_POSTS_MAX_PER_PAGE = 100
+    SEARCH_PER_PAGE = 20
+    LOOKUP_LIMIT = 10
+    API_PER_PAGE = 100
+    API_MAX_PER_PAGE = 1000
+    API_MAX_IDS = 100
+
+    # None means a directory under the app's instance path
+    MEDIA_ROOT = None
+    MEDIA_MAX_AGE = 60 * 60 * 24 * 365
+    THUMBNAIL_SIZES = (64, 200)
+    MAX_CONTENT_LENGTH = 8 * 1024 * 1024
+
+    # 'lru' keeps pages in the process, so invalidations reach only the worker that made them: run a single
+    # worker with it. 'filesystem' is shared between the workers using PAGE_CACHE_DIR
+    PAGE_CACHE_BACKEND = 'lru'
+    PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    PAGE_CACHE_DIR = None
+
+    # Users and tags with more posts than this are deleted in the background, this many posts at a time
+    DELETE_BACKGROUND_POSTS = 1000
+    DELETE_BATCH = 1000
+
+    # Post views are counted in memory and added to the database every few seconds, or sooner once this
+    # many posts have pending views
+    VIEW_FLUSH_SECONDS = 5
+    VIEW_FLUSH_SIZE = 1000
+
+    # Statements at least this slow go to the 'blogly.slow_queries' log
+    SLOW_QUERY_SECONDS = 0.25
+    SERVER_TIMING = False
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    SQLALCHEMY_ECHO = True
+    DEBUG_TB_ENABLED = True
+    SERVER_TIMING = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'postgresql:///blogly_test')
+
+    # Tests change tables directly, so caching is turned on only where it's tested
+    PAGE_CACHE_BACKEND = None
+
+    # Tests flush view counts themselves
+    VIEW_FLUSH_SECONDS = 3600
+
+
+class ProductionConfig(Config):
+    PAGE_CACHE_BACKEND = 'filesystem'
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
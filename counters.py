@@ -0,0 +1,71 @@
+"""Denormalized post counters on users and tags for Blogly.
+
+Simple writes adjust counters in place; cascading deletes and wholesale
+collection changes recount the affected rows exactly.
+"""
+from sqlalchemy import func, inspect, select, text, update
+
+from models import db, User, Post, Tags, PostTags
+
+
+def adjust_user_count(user_id, delta):
+    """Add delta to one user's post count"""
+    db.session.execute(update(User)
+                       .where(User.id == user_id)
+                       .values(post_count=User.post_count + delta)
+                       .execution_options(synchronize_session=False))
+
+
+def adjust_tag_counts(tag_ids, delta):
+    """Add delta to the post count of each given tag"""
+    if not tag_ids or not delta:
+        return
+
+    db.session.execute(update(Tags)
+                       .where(Tags.id.in_(tag_ids))
+                       .values(post_count=Tags.post_count + delta)
+                       .execution_options(synchronize_session=False))
+
+
+def recount_users(user_ids=None):
+    """Recompute post counts for the given users, or all users"""
+    stmt = update(User).values(post_count=select(func.count(Post.id))
+                               .where(Post.posted_by == User.id)
+                               .scalar_subquery())
+    if user_ids is not None:
+        if not user_ids:
+            return
+        stmt = stmt.where(User.id.in_(user_ids))
+
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def recount_tags(tag_ids=None):
+    """Recompute post counts for the given tags, or all tags"""
+    stmt = update(Tags).values(post_count=select(func.count(PostTags.post_id))
+                               .where(PostTags.tag_id == Tags.id)
+                               .scalar_subquery())
+    if tag_ids is not None:
+        if not tag_ids:
+            return
+        stmt = stmt.where(Tags.id.in_(tag_ids))
+
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+
+def tags_of_posts(post_filter):
+    """Ids of tags attached to posts matching post_filter"""
+    rows = (db.session.query(PostTags.tag_id)
+            .join(Post, Post.id == PostTags.post_id)
+            .filter(post_filter)
+            .distinct())
+
+    return [tag_id for (tag_id,) in rows]
+
+
+def install_count_columns(connection):
+    """Add the post_count columns to existing users and tags tables, if missing; recount afterwards"""
+    for table in ('users', 'tags'):
+        if 'post_count' not in {column['name'] for column in inspect(connection).get_columns(table)}:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0'))
+
@@ -0,0 +1,132 @@
+"""Set-based deletes of users and tags for Blogly.
+
+Foreign keys cascade in the database, so deleting a user takes their posts
+and links with it in one DELETE, and deleting a tag's posts takes their
+links. Deletes of more than DELETE_BACKGROUND_POSTS posts are recorded as
+DeleteJobs and run on a background thread, which removes the posts
+DELETE_BATCH at a time in separate transactions so no one statement locks
+the whole cascade.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, select, text
+
+from catalog import bump_version
+from counters import recount_users, recount_tags, tags_of_posts
+from models import db, User, Post, Tags, PostTags, DeleteJob
+
+# Existing databases were created before the foreign keys cascaded
+POSTGRESQL_DDL = [
+    """ALTER TABLE posts DROP CONSTRAINT IF EXISTS posts_posted_by_fkey,
+       ADD CONSTRAINT posts_posted_by_fkey FOREIGN KEY (posted_by) REFERENCES users (id) ON DELETE CASCADE""",
+    """ALTER TABLE posttags DROP CONSTRAINT IF EXISTS posttags_post_id_fkey,
+       ADD CONSTRAINT posttags_post_id_fkey FOREIGN KEY (post_id) REFERENCES posts (id) ON DELETE CASCADE""",
+    """ALTER TABLE posttags DROP CONSTRAINT IF EXISTS posttags_tag_id_fkey,
+       ADD CONSTRAINT posttags_tag_id_fkey FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE""",
+]
+
+ACTIVE = ('queued', 'running')
+
+
+def install_cascades(connection):
+    """Make the foreign keys of an existing PostgreSQL database cascade on delete"""
+    if connection.dialect.name != 'postgresql':
+        raise ValueError(f'Foreign keys can only be changed in place on PostgreSQL, not {connection.dialect.name}')
+
+    for statement in POSTGRESQL_DDL:
+        connection.execute(text(statement))
+
+
+def delete_posts_in_batches(post_filter, batch):
+    """Delete posts matching post_filter batch at a time, committing after each"""
+    while True:
+        post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter(post_filter).limit(batch)]
+        if not post_ids:
+            return
+
+        db.session.execute(delete(Post).where(Post.id.in_(post_ids)).execution_options(synchronize_session=False))
+        db.session.commit()
+
+
+def delete_user_rows(user_id, batch=None):
+    """Delete a user and everything of theirs, returning the page cache entities it changed.
+
+    With batch, their posts go first in batches. The caller commits.
+    """
+    authored = Post.posted_by == user_id
+    tag_ids = tags_of_posts(authored)
+
+    if batch:
+        delete_posts_in_batches(authored, batch)
+    db.session.execute(delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
+    recount_tags(tag_ids)
+
+    return [f'user:{ user_id }', 'posts', 'feeds', *[f'tag:{ tag_id }' for tag_id in tag_ids]]
+
+
+def delete_tag_rows(tag_id, batch=None):
+    """Delete a tag and its posts, returning the page cache entities it changed.
+
+    With batch, the posts go first in batches. The caller commits.
+    """
+    tagged = Post.id.in_(select(PostTags.post_id).where(PostTags.tag_id == tag_id))
+    user_ids = [user_id for (user_id,) in db.session.query(Post.posted_by).filter(tagged).distinct()]
+    tag_ids = set(tags_of_posts(tagged)) - {tag_id}
+
+    if batch:
+        delete_posts_in_batches(tagged, batch)
+    else:
+        db.session.execute(delete(Post).where(tagged).execution_options(synchronize_session=False))
+    db.session.execute(delete(Tags).where(Tags.id == tag_id).execution_options(synchronize_session=False))
+    bump_version('tags')
+    recount_users(user_ids)
+    recount_tags(tag_ids)
+
+    return [f'tag:{ tag_id }', 'tags', 'posts', 'feeds', *[f'user-posts:{ user_id }' for user_id in user_ids],
+            *[f'tag:{ other_id }' for other_id in tag_ids]]
+
+
+DELETERS = {'user': delete_user_rows, 'tag': delete_tag_rows}
+
+
+def queue_delete(kind, target_id):
+    """Record a background delete and hand it to the worker, reusing one already pending"""
+    job = DeleteJob.query.filter(DeleteJob.kind == kind, DeleteJob.target_id == target_id,
+                                 DeleteJob.status.in_(ACTIVE)).first()
+    if job is None:
+        job = DeleteJob(kind=kind, target_id=target_id)
+        db.session.add(job)
+        db.session.commit()
+        current_app.extensions['delete_worker'].submit(run_delete_job, current_app._get_current_object(), job.id)
+
+    return job
+
+
+def run_delete_job(app, job_id):
+    """Carry out a queued delete in its own app context"""
+    with app.app_context():
+        job = db.session.get(DeleteJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+
+        try:
+            entities = DELETERS[job.kind](job.target_id, batch=app.config['DELETE_BATCH'])
+            db.session.commit()
+        except Exception as err:
+            db.session.rollback()
+            app.logger.exception('Delete job %s failed', job_id)
+            job = db.session.get(DeleteJob, job_id)
+            job.status, job.error = 'failed', str(err)
+        else:
+            job = db.session.get(DeleteJob, job_id)
+            job.status = 'done'
+            app.extensions['page_cache'].invalidate(*entities)
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def init_deletes(app):
+    app.extensions['delete_worker'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='blogly-deletes')
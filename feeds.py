@@ -0,0 +1,191 @@
+"""Precomputed Atom and RSS feeds for Blogly.
+
+Each feed scope ('site', 'user:<id>' or 'tag:<id>') keeps its newest
+FEED_ENTRIES posts and both rendered documents in the page cache backend.
+Post writes place, replace or remove single entries in the scopes they
+touch and re-render just those. Changes that reach many feeds at once, such
+as renaming a user or deleting a tag, invalidate the 'feeds' entity, and
+every feed is rebuilt from the database the next time it's requested.
+Builds and updates of a scope hold its lock_key, so concurrent writes each
+apply to the state the last one left instead of overwriting each other.
+"""
+import hashlib
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+from flask import abort, current_app, render_template, url_for
+from markupsafe import escape
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, User, Post, Tags, PostTags
+from routing import primary_reads
+
+FORMATS = {
+    'atom': ('feed-atom.xml', 'application/atom+xml'),
+    'rss': ('feed-rss.xml', 'application/rss+xml'),
+}
+
+
+def rfc822(iso):
+    """RSS date for an ISO UTC timestamp"""
+    return format_datetime(datetime.fromisoformat(iso).replace(tzinfo=timezone.utc))
+
+
+def backend():
+    return current_app.extensions['page_cache'].backend
+
+
+def post_entry(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'content_html': post.content_html if post.content_html is not None else str(escape(post.content)),
+        'author': f'{post.users.first_name} {post.users.last_name}',
+        'link': url_for('blogly.show_post', post_id=post.id, _external=True),
+        'posted_at': post.posted_at.isoformat(),
+        'updated_at': post.updated_at.isoformat(),
+        'tags': sorted(tag.name for tag in post.tags),
+    }
+
+
+def scope_info(scope):
+    """Title, page URL, feed URL and post filter of a feed scope, aborting with a 404 if its owner is gone"""
+    if scope == 'site':
+        return ('Blogly', url_for('blogly.homepage', _external=True),
+                url_for('blogly.site_feed', _external=True), None)
+
+    kind, owner_id = scope.split(':')
+    if kind == 'user':
+        user = User.query.get_or_404(int(owner_id))
+        return (f'Posts by {user.first_name} {user.last_name}',
+                url_for('blogly.show_user', user_id=user.id, _external=True),
+                url_for('blogly.user_feed', user_id=user.id, _external=True),
+                Post.posted_by == user.id)
+
+    tag = Tags.query.get_or_404(int(owner_id))
+    return (f'Posts tagged {tag.name}',
+            url_for('blogly.show_tag', tag_id=tag.id, _external=True),
+            url_for('blogly.tag_feed', tag_id=tag.id, _external=True),
+            Post.id.in_(db.session.query(PostTags.post_id).filter(PostTags.tag_id == tag.id)))
+
+
+def render(state):
+    """Render state's documents, with an ETag for each"""
+    feed = dict(state)
+    feed['updated'] = max((entry['updated_at'] for entry in state['entries']), default=state['built_at'])
+
+    state['documents'] = {fmt: render_template(template, feed=feed) for fmt, (template, _) in FORMATS.items()}
+    state['etags'] = {fmt: hashlib.sha1(doc.encode()).hexdigest() for fmt, doc in state['documents'].items()}
+    state['updated'] = feed['updated']
+
+    return state
+
+
+def build(scope):
+    """Fetch a feed's newest posts and render it"""
+    title, link, feed_url, post_filter = scope_info(scope)
+    per_feed = current_app.config['FEED_ENTRIES']
+
+    query = Post.query.options(joinedload(Post.users), selectinload(Post.tags))
+    if post_filter is not None:
+        query = query.filter(post_filter)
+    posts = query.order_by(Post.posted_at.desc(), Post.id.desc()).limit(per_feed + 1).all()
+
+    state = {'title': title, 'link': link, 'self': feed_url, 'entries': [post_entry(post) for post in posts[:per_feed]],
+             'complete': len(posts) <= per_feed, 'built_at': datetime.utcnow().isoformat()}
+
+    return render(state)
+
+
+def load(scope):
+    """A feed's state, built if it isn't cached or has been invalidated"""
+    cache = backend()
+    if cache is None:
+        return build(scope)
+
+    key = f'feed:{scope}'
+    version = current_app.extensions['page_cache'].version('feeds')
+    state = cache.get(key)
+    if state is not None and state['version'] == version:
+        return state
+
+    # Writes committed while this builds wait for the lock and apply on top of it
+    with cache.lock_key(key):
+        state = cache.get(key)
+        if state is None or state['version'] != version:
+            with primary_reads():
+                state = {**build(scope), 'version': version}
+            cache.set(key, state)
+
+    return state
+
+
+def change(scopes, update):
+    """Apply update(state) to each scope's cached feed; scopes not cached are left to be built later"""
+    cache = backend()
+    if cache is None:
+        return
+
+    version = current_app.extensions['page_cache'].version('feeds')
+    for scope in scopes:
+        key = f'feed:{scope}'
+        with cache.lock_key(key):
+            state = cache.get(key)
+            if state is None or state['version'] != version:
+                continue
+
+            if update(state) is False:
+                # The feed lost an entry it can't refill without a query; rebuild it when next asked for
+                cache.delete(key)
+            else:
+                cache.set(key, render(state))
+
+
+def post_scopes(user_id, tag_ids):
+    """Every feed a post by user_id with tag_ids appears in"""
+    return ['site', f'user:{user_id}', *[f'tag:{tag_id}' for tag_id in tag_ids]]
+
+
+def place_post(post_id, removed_tag_ids=()):
+    """Add or refresh a post in its feeds, and take it out of the feeds of tags it lost"""
+    if backend() is None:
+        return
+
+    post = Post.query.options(joinedload(Post.users), selectinload(Post.tags)).get(post_id)
+    entry = post_entry(post)
+    per_feed = current_app.config['FEED_ENTRIES']
+    sort_key = lambda e: (e['posted_at'], e['id'])
+
+    def place(state):
+        entries = [e for e in state['entries'] if e['id'] != post_id]
+        if len(entries) < per_feed or sort_key(entry) > sort_key(entries[-1]) or state['complete']:
+            entries.append(entry)
+            entries.sort(key=sort_key, reverse=True)
+        if len(entries) > per_feed:
+            entries, state['complete'] = entries[:per_feed], False
+        state['entries'] = entries
+
+    change(post_scopes(post.posted_by, [tag.id for tag in post.tags]), place)
+    remove_post(post_id, [f'tag:{tag_id}' for tag_id in removed_tag_ids])
+
+
+def remove_post(post_id, scopes):
+    """Take a post out of the given feeds"""
+    def remove(state):
+        entries = [e for e in state['entries'] if e['id'] != post_id]
+        if len(entries) < len(state['entries']) and not state['complete']:
+            return False
+        state['entries'] = entries
+
+    change(scopes, remove)
+
+
+def serve(scope, fmt):
+    """The feed document for scope in fmt, with its validators"""
+    if fmt not in FORMATS:
+        abort(404)
+
+    state = load(scope)
+    updated = datetime.fromisoformat(state['updated']).replace(tzinfo=timezone.utc, microsecond=0)
+
+    return state['documents'][fmt], state['etags'][fmt], updated, FORMATS[fmt][1]
@@ -0,0 +1,92 @@
+"""Markdown rendering of post bodies for Blogly.
+
+Posts are written in Markdown. Writes render the body once, sanitize the
+HTML and store it in content_html, along with a plain-text excerpt for
+listings and the RENDERER_VERSION that made them, so pages never render
+Markdown. Changing the renderer or its allow-lists means bumping
+RENDERER_VERSION and running 'flask blogly render-posts'.
+"""
+import html
+import re
+
+import bleach
+import markdown
+from sqlalchemy import bindparam, inspect, text, update
+
+from models import db, Post
+
+RENDERER_VERSION = 1
+
+EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+
+ALLOWED_TAGS = {'a', 'abbr', 'blockquote', 'br', 'code', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li',
+                'ol', 'p', 'pre', 'strong', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul'}
+ALLOWED_ATTRIBUTES = {'a': ['href', 'title'], 'abbr': ['title'], 'th': ['align'], 'td': ['align']}
+ALLOWED_PROTOCOLS = {'http', 'https', 'mailto'}
+
+EXCERPT_LENGTH = 200
+
+# Existing databases were created before posts were rendered
+COLUMNS = {'content_html': 'TEXT', 'excerpt': 'VARCHAR(250)', 'render_version': 'INTEGER'}
+
+
+def render_markdown(source):
+    """Sanitized HTML for a Markdown body"""
+    rendered = markdown.markdown(source, extensions=EXTENSIONS)
+
+    return bleach.clean(rendered, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, protocols=ALLOWED_PROTOCOLS,
+                        strip=True)
+
+
+def excerpt_of(content_html, length=EXCERPT_LENGTH):
+    """The start of rendered HTML as plain text, cut at a word boundary"""
+    words = html.unescape(bleach.clean(content_html, tags=set(), strip=True))
+    words = re.sub(r'\s+', ' ', words).strip()
+    if len(words) <= length:
+        return words
+
+    return words[:length].rsplit(' ', 1)[0].rstrip(' .,;:') + '...'
+
+
+def rendered(source):
+    """The stored rendering columns for a Markdown body"""
+    content_html = render_markdown(source)
+
+    return {'content_html': content_html, 'excerpt': excerpt_of(content_html), 'render_version': RENDERER_VERSION}
+
+
+def render_post(post):
+    for column, value in rendered(post.content).items():
+        setattr(post, column, value)
+
+
+def install_render_columns(connection):
+    """Add the rendering columns to an existing posts table, if missing"""
+    existing = {column['name'] for column in inspect(connection).get_columns('posts')}
+    for name, type_ in COLUMNS.items():
+        if name not in existing:
+            connection.execute(text(f'ALTER TABLE posts ADD COLUMN {name} {type_}'))
+
+
+def rerender_posts(batch=1000, everything=False):
+    """Render posts made by an older renderer, or all posts, batch at a time; returns how many"""
+    stale = Post.render_version.is_(None) | (Post.render_version != RENDERER_VERSION)
+    stmt = (update(Post.__table__)
+            .where(Post.__table__.c.id == bindparam('post_id'))
+            .values({column: bindparam(f'new_{column}') for column in COLUMNS}))
+
+    after, count = 0, 0
+    while True:
+        query = db.session.query(Post.id, Post.content).filter(Post.id > after)
+        if not everything:
+            query = query.filter(stale)
+        rows = query.order_by(Post.id).limit(batch).all()
+        if not rows:
+            return count
+
+        params = []
+        for post_id, content in rows:
+            params.append({'post_id': post_id, **{f'new_{key}': value for key, value in rendered(content).items()}})
+        db.session.execute(stmt, params)
+        db.session.commit()
+        after, count = rows[-1].id, count + len(rows)
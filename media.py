@@ -0,0 +1,166 @@
+"""Content-addressed image storage for Blogly."""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+from urllib.parse import urlsplit
+
+from flask import current_app, url_for
+from PIL import Image
+
+MEDIA_PREFIX = 'media:'
+
+DIGEST_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+DATA_URI_PATTERN = re.compile(r'data:image/[\w.+-]+;base64,(.*)', re.DOTALL)
+
+# Image URLs are kept in users.profile_pic, a VARCHAR(500)
+MAX_URL_LENGTH = 500
+URL_SCHEMES = {'http', 'https'}
+
+IMAGE_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+
+class InvalidImageURL(ValueError):
+    """An image value that is neither a data URI nor a URL we can keep"""
+
+
+class ImageStore:
+    """Storage backend interface; images are keyed by digest and variant (None or a thumbnail size)"""
+
+    def exists(self, digest, variant=None):
+        raise NotImplementedError
+
+    def save(self, digest, variant, data):
+        raise NotImplementedError
+
+    def open(self, digest, variant=None):
+        """Return a readable binary file for the image, or None if it isn't stored"""
+        raise NotImplementedError
+
+
+class LocalImageStore(ImageStore):
+    """Store images as files under a root directory, fanned out by digest prefix"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest, variant=None):
+        name = digest if variant is None else f'{digest}_{variant}'
+        return os.path.join(self.root, digest[:2], name)
+
+    def exists(self, digest, variant=None):
+        return os.path.exists(self.path(digest, variant))
+
+    def save(self, digest, variant, data):
+        path = self.path(digest, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file and rename so readers never see a partial image
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def open(self, digest, variant=None):
+        try:
+            return open(self.path(digest, variant), 'rb')
+        except FileNotFoundError:
+            return None
+
+
+def get_image_store():
+    """Get the image store configured on the current app"""
+    return current_app.extensions['image_store']
+
+
+def store_image(data):
+    """Store image bytes and their thumbnails, returning a media reference.
+
+    Raises ValueError if data isn't a supported image.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, Image.DecompressionBombError):
+        raise ValueError('Not a readable image')
+
+    if image.format not in IMAGE_TYPES:
+        raise ValueError(f'Unsupported image format {image.format}')
+
+    store = get_image_store()
+    digest = hashlib.sha256(data).hexdigest()
+
+    if not store.exists(digest):
+        for size in current_app.config['THUMBNAIL_SIZES']:
+            thumb = image.copy()
+            thumb.thumbnail((size, size))
+            buf = io.BytesIO()
+            thumb.save(buf, format=image.format)
+            store.save(digest, size, buf.getvalue())
+
+        # Original goes last; its presence marks the set as complete
+        store.save(digest, None, data)
+
+    return MEDIA_PREFIX + digest
+
+
+def store_image_value(value):
+    """Turn a submitted image value into what we keep in the database.
+
+    Data URIs are decoded into the store; http(s) URLs and existing references pass through.
+    """
+    match = DATA_URI_PATTERN.fullmatch(value.strip())
+    if not match:
+        return check_image_url(value)
+
+    try:
+        data = base64.b64decode(re.sub(r'\s+', '', match.group(1)), validate=True)
+    except binascii.Error:
+        raise ValueError('Invalid base64 image data')
+
+    return store_image(data)
+
+
+def check_image_url(value):
+    """Return an image URL or stored reference unchanged, raising InvalidImageURL if it can't be kept"""
+    if not value or value.startswith(MEDIA_PREFIX):
+        return value
+
+    if len(value) > MAX_URL_LENGTH:
+        raise InvalidImageURL(f'Image URL is longer than {MAX_URL_LENGTH} characters')
+    parts = urlsplit(value)
+    if parts.scheme not in URL_SCHEMES or not parts.netloc:
+        raise InvalidImageURL('Image URL must start with http:// or https://')
+
+    return value
+
+
+def image_url(ref, size=None):
+    """URL for an image reference, optionally for one of its thumbnails"""
+    if ref and ref.startswith(MEDIA_PREFIX):
+        return url_for('blogly.serve_media', digest=ref[len(MEDIA_PREFIX):], size=size)
+
+    return ref
+
+
+def sniff_mimetype(head):
+    """Guess an image mimetype from its leading bytes"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+
+    return 'application/octet-stream'
@@ -0,0 +1,178 @@
+"""Per-request performance metrics for Blogly, exported in Prometheus text format.
+
+Each request records its latency, the SQL statements it ran and their
+total time, and the time spent rendering templates. Statements slower
+than SLOW_QUERY_SECONDS are logged to the 'blogly.slow_queries' logger,
+and statements that raise are counted as SQL errors.
+Counters are per worker process, like the page cache and pool stats.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import current_app, g, has_app_context, has_request_context, request, before_render_template, \
+    template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_log = logging.getLogger('blogly.slow_queries')
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic totals keyed by label values"""
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.series.items():
+            yield f'{self.name}{format_labels(labels)} {value}'
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations keyed by label values"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts, total = self.series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.series[labels] = (counts, total + value)
+
+    def samples(self):
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(labels, le=bound)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(labels)} {total}'
+            yield f'{self.name}_count{format_labels(labels)} {cumulative}'
+
+
+class Metrics:
+    """The app's request, SQL and template metrics"""
+
+    def __init__(self):
+        self.request_seconds = Histogram('blogly_request_duration_seconds', 'Request latency by endpoint')
+        self.sql_statements = Counter('blogly_sql_statements_total', 'SQL statements run by endpoint')
+        self.db_seconds = Counter('blogly_db_seconds_total', 'Time spent in SQL statements by endpoint')
+        self.template_seconds = Counter('blogly_template_seconds_total', 'Time spent rendering templates by endpoint')
+        self.slow_queries = Counter('blogly_slow_queries_total', 'SQL statements slower than SLOW_QUERY_SECONDS')
+        self.sql_errors = Counter('blogly_sql_errors_total', 'SQL statements that raised an error')
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        for metric in (self.request_seconds, self.sql_statements, self.db_seconds, self.template_seconds,
+                       self.slow_queries, self.sql_errors):
+            with metric.lock:
+                lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(metric.samples())
+
+        return '\n'.join(lines) + '\n'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_start', []).append((context, time.perf_counter()))
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_start'].pop()[1]
+    if not has_app_context() or 'metrics' not in current_app.extensions:
+        return
+
+    if has_request_context() and 'perf' in g:
+        g.perf['sql'] += 1
+        g.perf['db'] += elapsed
+
+    if elapsed >= current_app.config['SLOW_QUERY_SECONDS']:
+        current_app.extensions['metrics'].slow_queries.inc()
+        slow_query_log.warning('%.1f ms: %s', elapsed * 1000, statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def fail_statement(context):
+    # after_cursor_execute doesn't run for a statement that raised, so its start is dropped here, if
+    # it got as far as before_cursor_execute
+    starts = context.connection.info.get('statement_start') if context.connection is not None else None
+    if starts and starts[-1][0] is context.execution_context:
+        starts.pop()
+
+    if has_app_context() and 'metrics' in current_app.extensions:
+        current_app.extensions['metrics'].sql_errors.inc()
+
+
+def start_template(app, template, context, **extra):
+    if 'perf' in g:
+        g.perf['template_start'] = time.perf_counter()
+
+
+def end_template(app, template, context, **extra):
+    if 'perf' in g and 'template_start' in g.perf:
+        g.perf['template'] += time.perf_counter() - g.perf.pop('template_start')
+
+
+def start_request():
+    g.perf = {'start': time.perf_counter(), 'sql': 0, 'db': 0.0, 'template': 0.0}
+
+
+def record_request(resp):
+    perf = g.pop('perf', None)
+    if perf is None:
+        return resp
+
+    elapsed = time.perf_counter() - perf['start']
+    endpoint = (('endpoint', request.endpoint or '<unmatched>'),)
+
+    metrics = current_app.extensions['metrics']
+    metrics.request_seconds.observe(endpoint + (('method', request.method), ('status', resp.status_code)), elapsed)
+    metrics.sql_statements.inc(endpoint, perf['sql'])
+    metrics.db_seconds.inc(endpoint, perf['db'])
+    metrics.template_seconds.inc(endpoint, perf['template'])
+
+    if current_app.config['SERVER_TIMING']:
+        resp.headers['Server-Timing'] = ', '.join([
+            f'db;dur={perf["db"] * 1000:.2f};desc="{perf["sql"]} queries"',
+            f'tpl;dur={perf["template"] * 1000:.2f}',
+            f'total;dur={elapsed * 1000:.2f}',
+        ])
+
+    return resp
+
+
+def init_metrics(app):
+    app.extensions['metrics'] = Metrics()
+    app.before_request(start_request)
+    app.after_request(record_request)
+    before_render_template.connect(start_template, app)
+    template_rendered.connect(end_template, app)
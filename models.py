@@ -1,14 +1,47 @@
 """Models for Blogly."""
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import backref
+from routing import RoutingSession
 from datetime import *
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def connect_db(app):
     db.app = app
     db.init_app(app)
 
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, and so their ON DELETE CASCADEs, when each connection asks"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+def touch(model, ids):
+    """Bump updated_at on rows whose rendered pages change without their own columns changing"""
+    if not ids:
+        return
+
+    db.session.execute(db.update(model)
+                       .where(model.id.in_(ids))
+                       .values(updated_at=datetime.utcnow())
+                       .execution_options(synchronize_session=False))
+
+
+def install_timestamps(connection):
+    """Add updated_at to existing users, posts and tags tables, if missing, and fill in unset posted_at"""
+    now = datetime.utcnow()
+    # SQLite only adds NOT NULL columns with a constant default
+    type_ = db.DateTime().compile(dialect=connection.dialect)
+    column = f"updated_at {type_} NOT NULL DEFAULT '{now.isoformat(' ')}'"
+    for table in ('users', 'posts', 'tags'):
+        if 'updated_at' not in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column}'))
+
+    connection.execute(text('UPDATE posts SET posted_at = :now WHERE posted_at IS NULL'), {'now': now})
+
 class User(db.Model):
     
     __tablename__ = 'users'
@@ -19,16 +52,28 @@ class User(db.Model):
 
     last_name = db.Column(db.String(50), nullable=False)
 
-    profile_pic = db.Column(db.String, 
-                            nullable=True, 
+    profile_pic = db.Column(db.String(500),
+                            nullable=True,
                             default='https://twirpz.files.wordpress.com/2015/06/twitter-avi-gender-balanced-figure.png?w=640')
-    
-    posts = db.relationship('Post', backref='users', cascade='all, delete-orphan')
+
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    posts = db.relationship('Post', backref='users', cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_users_name', last_name, first_name, id),
+    )
 
     def __repr__(self):
         u = self
         return f"<User {u.id} {u.first_name} {u.last_name}>"
 
+    def serialize(self, fields=('id', 'first_name', 'last_name', 'profile_pic')):
+        """Serialize user to a dict for JSON responses, touching only the given fields"""
+        return {field: getattr(self, field) for field in fields}
+
 
 class Post(db.Model):
 
@@ -40,31 +85,98 @@ class Post(db.Model):
 
     content = db.Column(db.String, nullable=False)
 
-    posted_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    content_html = db.Column(db.Text, nullable=True)
+
+    excerpt = db.Column(db.String(250), nullable=True)
+
+    render_version = db.Column(db.Integer, nullable=True)
+
+    posted_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+
+    posted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
-    posted_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_posts_posted_at_id', posted_at.desc(), id.desc()),
+        db.Index('ix_posts_posted_by_posted_at', posted_by, posted_at.desc(), id.desc()),
+    )
 
     def __repr__(self):
         p = self
         return f"<Post {p.id} {p.title} {p.content} {p.posted_by} {p.posted_at}>"
 
+    def serialize(self):
+        """Serialize post to a dict for JSON responses"""
+        p = self
+        return {
+            'id': p.id,
+            'title': p.title,
+            'content': p.content,
+            'content_html': p.content_html,
+            'excerpt': p.excerpt,
+            'posted_by': p.posted_by,
+            'posted_at': p.posted_at.isoformat(),
+        }
+
+
+
+class PostViews(db.Model):
+    """How many times a post has been viewed, kept apart from posts so counting never rewrites post rows"""
+
+    __tablename__ = 'post_views'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+
+    views = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_post_views_views', views.desc(), post_id.desc()),
+    )
+
+    def __repr__(self):
+        pv = self
+        return f"<PostViews {pv.post_id} {pv.views}>"
+
+
+
+class RelatedPost(db.Model):
+    """One of a post's precomputed related posts"""
+
+    __tablename__ = 'related_posts'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+
+    related_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
+
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_related_posts_post_id_score', post_id, score.desc(), related_id.desc()),
+        db.Index('ix_related_posts_related_id', related_id),
+    )
+
+    def __repr__(self):
+        rp = self
+        return f"<RelatedPost {rp.post_id} {rp.related_id} {rp.score}>"
+
 
 
 class PostTags(db.Model):
 
     __tablename__ = 'posttags'
 
-    id = db.Column(db.Integer,
-                    primary_key=True,
-                    autoincrement=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete='CASCADE'), primary_key=True)
 
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
 
-    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    __table_args__ = (
+        db.Index('ix_posttags_tag_id', tag_id, post_id),
+    )
 
     def __repr__(self):
         pt = self
-        return f"<Post {pt.id} {pt.post_id} {pt.tag_id}>"
+        return f"<PostTag {pt.post_id} {pt.tag_id}>"
 
 
 
@@ -76,8 +188,66 @@ class Tags(db.Model):
 
     name = db.Column(db.String, nullable=False, unique=True)
 
-    posts = db.relationship('Post', secondary='posttags', backref='tags', cascade='all, delete')
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    posts = db.relationship('Post', secondary='posttags', backref=backref('tags', passive_deletes=True),
+                            cascade='all, delete', passive_deletes=True)
 
     def __repr__(self):
         t = self
         return f"<Tag {t.id} {t.name}>"
+
+
+
+class CatalogVersion(db.Model):
+    """Version number of a catalogue cached in each worker, bumped in the transaction that changes it"""
+
+    __tablename__ = 'catalog_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        cv = self
+        return f"<CatalogVersion {cv.name} {cv.version}>"
+
+
+
+class DeleteJob(db.Model):
+    """A user or tag deletion too big to run inside a request"""
+
+    __tablename__ = 'delete_jobs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    kind = db.Column(db.String(10), nullable=False)
+
+    target_id = db.Column(db.Integer, nullable=False)
+
+    status = db.Column(db.String(10), nullable=False, default='queued')
+
+    error = db.Column(db.String, nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        j = self
+        return f"<DeleteJob {j.id} {j.kind} {j.target_id} {j.status}>"
+
+    def serialize(self):
+        """Serialize job to a dict for JSON responses"""
+        j = self
+        return {
+            'id': j.id,
+            'kind': j.kind,
+            'target_id': j.target_id,
+            'status': j.status,
+            'error': j.error,
+            'created_at': j.created_at.isoformat(),
+            'finished_at': j.finished_at.isoformat() if j.finished_at else None,
+        }
@@ -0,0 +1,308 @@
+"""Rendered-page cache for Blogly.
+
+Each cached page records the entities it rendered (e.g. 'post:3', 'user:1')
+along with a version token for each. Write handlers invalidate the entities
+they change, which gives them fresh tokens, so every page that showed them
+misses on its next request. Tokens are random, so a token lost to eviction
+can only cause a miss, never serve a stale page. Tokens also carry the time
+of the write that issued them: views record their entities after reading
+them, so a page whose entities were invalidated while it rendered may hold
+rows from before the write, and isn't stored.
+
+LRUCache keeps its entries and version tokens in the process, so an
+invalidation only reaches the worker that made it: use it with a single
+worker process, and FileSystemCache when there are several.
+
+Backends also provide lock_key(key), held around a read-modify-write of one
+key; FileSystemCache's lock holds across worker processes too.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, g, request, session
+
+from routing import primary_reads
+
+KEY_LOCKS = 64
+# Pruning a FileSystemCache leaves this fraction of max_bytes, so it doesn't rescan on every write
+PRUNE_TO = 0.75
+
+
+def sizeof(value):
+    """Rough size in bytes of a cached value"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, list):
+        return sum(sizeof(v) for v in value)
+
+    return 64
+
+
+class LRUCache:
+    """In-process cache that evicts least recently used entries past max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = [threading.Lock() for _ in range(KEY_LOCKS)]
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = value
+            self.size += sizeof(key) + sizeof(value)
+
+            while self.size > self.max_bytes and self.entries:
+                self._discard(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def lock_key(self, key):
+        """Lock serialising updates to key, shared with the keys that hash alongside it"""
+        return self.key_locks[hash(key) % KEY_LOCKS]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _discard(self, key):
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.size -= sizeof(key) + sizeof(value)
+
+
+class FileSystemCache:
+    """Cache of JSON values stored as files, shareable between worker processes.
+
+    Reads touch a file's mtime, and once the files written pass max_bytes the
+    least recently used are deleted down to PRUNE_TO of it. Each process
+    counts only its own writes between scans, so the directory can briefly
+    exceed max_bytes by what the other processes wrote.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.size = self.prune()
+
+    def path(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return value
+
+    def set(self, key, value):
+        data = json.dumps(value)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp, self.path(key))
+
+        with self.lock:
+            self.size += len(data)
+            full = self.size > self.max_bytes
+        if full:
+            self.prune()
+
+    def prune(self):
+        """Delete the least recently used files until the cache fits, returning its size"""
+        files = []
+        for entry in os.scandir(self.root):
+            # Lock files and unfinished writes have suffixes; cached values don't
+            if '.' in entry.name:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        if size > self.max_bytes:
+            for _, file_size, path in sorted(files):
+                if size <= self.max_bytes * PRUNE_TO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+
+        with self.lock:
+            self.size = size
+
+        return size
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock_key(self, key):
+        """Lock serialising updates to key across processes, released when its file closes"""
+        with open(self.path(key) + '.lock', 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            os.remove(os.path.join(self.root, name))
+
+
+class PageCache:
+    """Caches GET view output against the versions of the entities it rendered.
+
+    With backend=None caching is off and views always run.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def issue(self, entity, changed_at):
+        """Give an entity a new version token, stamped with when it last changed"""
+        token = f'{changed_at:.6f}:{uuid.uuid4().hex}'
+        self.backend.set(f'version:{entity}', token)
+
+        return token
+
+    def version(self, entity):
+        """Current version token of an entity, issuing one if it has none"""
+        token = self.backend.get(f'version:{entity}')
+        if token is None:
+            # No write is known to have changed it
+            token = self.issue(entity, 0)
+
+        return token
+
+    @staticmethod
+    def issued_before(deps, started):
+        """Whether every recorded entity last changed before a render that started at started"""
+        # Tokens stored before they were stamped have no time, and count as unchanged
+        return all(float(token.split(':', 1)[0]) < started for token in deps.values() if ':' in token)
+
+    def depends(self, *entities):
+        """Record that the page being rendered shows these entities"""
+        deps = g.get('page_deps')
+        if deps is None or self.backend is None:
+            return
+
+        for entity in entities:
+            if entity not in deps:
+                deps[entity] = self.version(entity)
+
+    def invalidate(self, *entities):
+        """Expire every cached page that shows any of these entities"""
+        if self.backend is None:
+            return
+
+        for entity in entities:
+            self.issue(entity, time.time())
+
+    def lookup(self, key):
+        """Cached body for key if all of its entities are unchanged"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+
+        for entity, token in entry['deps'].items():
+            if self.backend.get(f'version:{entity}') != token:
+                return None
+
+        return entry['body']
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    @staticmethod
+    def page_key(query_args):
+        """Cache key for the current request's page, from its path and the query args its view reads"""
+        params = urlencode([(name, value) for name in sorted(query_args) for value in request.args.getlist(name)])
+
+        return f'page:{request.path}?{params}'
+
+    def serve(self, view, query_args, *args, **kwargs):
+        """Run view through the cache"""
+        # Pages carrying flashed messages are one-offs
+        if self.backend is None or request.method != 'GET' or '_flashes' in session:
+            return view(*args, **kwargs)
+
+        key = self.page_key(query_args)
+        body = self.lookup(key)
+        self.count(body is not None)
+        if body is not None:
+            return body
+
+        g.page_deps = {}
+        started = time.time()
+        try:
+            # A lagging replica's rows would be stored under tokens newer than they are
+            with primary_reads():
+                body = view(*args, **kwargs)
+            if isinstance(body, str) and self.issued_before(g.page_deps, started):
+                self.backend.set(key, {'deps': g.page_deps, 'body': body})
+        finally:
+            g.pop('page_deps', None)
+
+        return body
+
+
+def cached_page(*query_args):
+    """Decorate a view to serve its rendered page from the current app's page cache.
+
+    query_args names the query args the view reads; pages are cached per
+    path and values of those, so other query args share the same entry.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return current_app.extensions['page_cache'].serve(view, query_args, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,93 @@
+"""Keyset (cursor) pagination helpers for Blogly."""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import abort, request
+from sqlalchemy import literal, tuple_
+
+
+def encode_cursor(values):
+    """Pack a row's sort key into an opaque, URL-safe cursor string"""
+    def encode_value(value):
+        if isinstance(value, datetime):
+            return {'dt': value.isoformat()}
+        raise TypeError(f'Cannot encode {value!r} in a cursor')
+
+    raw = json.dumps(values, default=encode_value, separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Unpack a cursor made by encode_cursor, aborting with a 400 if it is malformed"""
+    def decode_value(obj):
+        if 'dt' in obj:
+            return datetime.fromisoformat(obj['dt'])
+        return obj
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded), object_hook=decode_value)
+    except (ValueError, binascii.Error):
+        abort(400, description='Invalid cursor')
+
+    if not isinstance(values, list):
+        abort(400, description='Invalid cursor')
+
+    return values
+
+
+def fits(column, value):
+    """Whether a decoded cursor value can be compared with column"""
+    expected = column.type.python_type
+    if isinstance(value, bool) or not isinstance(value, expected):
+        return False
+
+    # Databases store integers in at most 64 bits
+    return expected is not int or -2 ** 63 <= value < 2 ** 63
+
+
+def page_size(default, maximum):
+    """Page size from the ?per_page= query arg, clamped to 1..maximum"""
+    per_page = request.args.get('per_page', default, type=int)
+
+    return max(1, min(per_page, maximum))
+
+
+def keyset_query(query, columns, cursor=None, per_page=20, descending=False):
+    """query, a Query or select(), narrowed to one page past cursor plus a row to tell if there are more"""
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns) or not all(map(fits, columns, values)):
+            abort(400, description='Invalid cursor')
+
+        key = tuple_(*columns)
+        bound = tuple_(*[literal(value, col.type) for col, value in zip(columns, values)])
+        query = query.filter(key < bound if descending else key > bound)
+
+    order = [col.desc() if descending else col.asc() for col in columns]
+
+    return query.order_by(*order).limit(per_page + 1)
+
+
+def split_page(rows, columns, per_page=20):
+    """Trim keyset_query's rows to the page, returning (rows, next_cursor)"""
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([getattr(rows[-1], col.key) for col in columns])
+
+    return rows, next_cursor
+
+
+def keyset_page(query, columns, cursor=None, per_page=20, descending=False):
+    """Fetch one page of query ordered by columns, starting after cursor.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    The columns must form a unique sort key and should be backed by an index.
+    """
+    rows = keyset_query(query, columns, cursor, per_page, descending).all()
+
+    return split_page(rows, columns, per_page)
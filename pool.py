@@ -0,0 +1,134 @@
+"""Database connection pool settings and health metrics for Blogly.
+
+DB_POOL='queue' keeps a pool of connections in each worker process.
+DB_POOL='null' opens a connection per checkout and closes it on return,
+for running behind PgBouncer in transaction pooling mode, where the
+bouncer does the pooling and idle client connections only waste its slots.
+"""
+import threading
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class PoolMetrics:
+    """Checkout counters and wait times for one engine's pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checked_out = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.lock = threading.Lock()
+
+    def waited(self, seconds, acquired):
+        with self.lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if acquired:
+                self.checkouts += 1
+                self.checked_out += 1
+            else:
+                self.timeouts += 1
+
+    def returned(self):
+        with self.lock:
+            self.checked_out -= 1
+
+
+class TimedPool:
+    """Pool mixin timing how long each checkout waits for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        # Engines recreate their pool on dispose(); keep counting across it
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except TimeoutError:
+            self.metrics.waited(time.perf_counter() - start, acquired=False)
+            raise
+
+        self.metrics.waited(time.perf_counter() - start, acquired=True)
+        return conn
+
+    def _do_return_conn(self, conn):
+        self.metrics.returned()
+        super()._do_return_conn(conn)
+
+
+class TimedQueuePool(TimedPool, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedPool, NullPool):
+    pass
+
+
+def engine_options(config, url):
+    """SQLAlchemy engine options for the app's DB_POOL_* settings and a database URL"""
+    if config['DB_POOL'] == 'null':
+        options = {'poolclass': TimedNullPool}
+    else:
+        options = {
+            'poolclass': TimedQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        }
+
+    if make_url(url).get_backend_name() == 'sqlite':
+        # Pooled connections are handed to whichever thread serves the next request
+        options['connect_args'] = {'check_same_thread': False}
+
+    return options
+
+
+def async_engine_options(config, url):
+    """create_async_engine options for the DB_POOL_* settings; asyncio engines pool with their own class"""
+    if config['DB_POOL'] == 'null':
+        return {'poolclass': NullPool}
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def pool_stats(pool):
+    """Live connection counts and checkout wait times for a pool"""
+    metrics = pool.metrics
+    with metrics.lock:
+        stats = {
+            'pool': type(pool).__name__,
+            'checked_out': metrics.checked_out,
+            'checkouts': metrics.checkouts,
+            'timeouts': metrics.timeouts,
+            'wait_avg_ms': round(1000 * metrics.wait_total / max(metrics.checkouts + metrics.timeouts, 1), 3),
+            'wait_max_ms': round(1000 * metrics.wait_max, 3),
+        }
+
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), idle=pool.checkedin(), overflow=max(pool.overflow(), 0))
+    else:
+        stats.update(size=0, idle=0, overflow=0)
+
+    return stats
@@ -0,0 +1,168 @@
+"""Precomputed related posts for Blogly.
+
+related_posts keeps each post's RELATED_POSTS nearest neighbours, scored
+by the tags they share, each weighted 1 / ln(2 + posts with that tag) so
+rare tags count for more than common ones. Tags on more than
+RELATED_MAX_TAG_POSTS posts say little about what a post is about and are
+left out, which bounds each post's recompute to its tags' posts through
+ix_posttags_tag_id. Showing a post reads its list with one indexed lookup.
+
+When posts' tags change, the request recomputes the lists of up to
+RELATED_SYNC_POSTS of them. After it commits, queue_related hands the rest,
+and the posts that listed them or are now their closest candidates, to a
+background thread, which recomputes them RELATED_BATCH at a time. That is
+exact for the posts touched. Scores elsewhere drift as tag counts change,
+and imports skip the incremental updates; 'flask blogly rebuild-related'
+recomputes every list for both.
+"""
+import math
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import aliased
+
+from models import db, Post, Tags, PostTags, RelatedPost
+
+# How many of a changed post's closest posts are recomputed with it, as a multiple of RELATED_POSTS
+CANDIDATES = 4
+
+
+def tag_weight(post_count):
+    return 1 / math.log(2 + post_count)
+
+
+def top_related(post_ids, limit):
+    """{post_id: [(related_id, score)]} of the limit best-scoring posts sharing tags with each of post_ids"""
+    weights = {tag_id: tag_weight(post_count) for tag_id, post_count in
+               db.session.query(Tags.id, Tags.post_count)
+               .join(PostTags, PostTags.tag_id == Tags.id)
+               .filter(PostTags.post_id.in_(post_ids),
+                       Tags.post_count <= current_app.config['RELATED_MAX_TAG_POSTS'])
+               .distinct()}
+    lists = {post_id: [] for post_id in post_ids}
+    if not weights:
+        return lists
+
+    mine, other = aliased(PostTags), aliased(PostTags)
+    score = func.sum(case(weights, value=mine.tag_id))
+    rank = func.row_number().over(partition_by=mine.post_id, order_by=(score.desc(), other.post_id.desc()))
+    pairs = (db.session.query(mine.post_id, other.post_id.label('related_id'), score.label('score'),
+                              rank.label('rank'))
+             .join(other, (other.tag_id == mine.tag_id) & (other.post_id != mine.post_id))
+             .filter(mine.post_id.in_(post_ids), mine.tag_id.in_(list(weights)))
+             .group_by(mine.post_id, other.post_id)
+             .subquery())
+
+    for post_id, related_id, pair_score in (db.session.query(pairs.c.post_id, pairs.c.related_id, pairs.c.score)
+                                            .filter(pairs.c.rank <= limit)
+                                            .order_by(pairs.c.post_id, pairs.c.rank)):
+        lists[post_id].append((related_id, round(pair_score, 6)))
+
+    return lists
+
+
+def store(lists):
+    """Replace the stored lists of the posts in lists"""
+    if not lists:
+        return
+
+    db.session.execute(delete(RelatedPost).where(RelatedPost.post_id.in_(list(lists)))
+                       .execution_options(synchronize_session=False))
+    rows = [{'post_id': post_id, 'related_id': related_id, 'score': score}
+            for post_id, entries in lists.items() for related_id, score in entries]
+    if rows:
+        db.session.execute(insert(RelatedPost.__table__), rows)
+
+
+def refresh(post_ids):
+    """Recompute the lists of post_ids, storing and returning those that changed"""
+    lists = top_related(post_ids, current_app.config['RELATED_POSTS'])
+
+    current = defaultdict(list)
+    for post_id, related_id, score in (db.session.query(RelatedPost.post_id, RelatedPost.related_id,
+                                                        RelatedPost.score)
+                                       .filter(RelatedPost.post_id.in_(post_ids))):
+        current[post_id].append((related_id, score))
+
+    changed = {post_id: entries for post_id, entries in lists.items() if sorted(entries) != sorted(current[post_id])}
+    store(changed)
+
+    return set(changed)
+
+
+def update_related(post_ids):
+    """Recompute the lists of the first RELATED_SYNC_POSTS of post_ids, whose tags changed, returning whose changed.
+
+    The caller commits, then passes the same post_ids to queue_related.
+    """
+    return refresh(sorted(set(post_ids))[:current_app.config['RELATED_SYNC_POSTS']]) if post_ids else set()
+
+
+def queue_related(post_ids):
+    """Hand the lists update_related left, and the changed posts' neighbours, to the background worker"""
+    if post_ids:
+        current_app.extensions['related_worker'].submit(run_related_job, current_app._get_current_object(),
+                                                        sorted(set(post_ids)))
+
+
+def chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def run_related_job(app, post_ids):
+    """Recompute the lists that may have changed with the tags of post_ids, in its own app context"""
+    with app.app_context():
+        try:
+            batch = app.config['RELATED_BATCH']
+            per_post = app.config['RELATED_POSTS']
+            targets = set(post_ids[app.config['RELATED_SYNC_POSTS']:])
+            for ids in chunks(post_ids, batch):
+                # The posts that listed a changed post, and those it now scores highest with, which are symmetric
+                targets.update(post_id for (post_id,) in db.session.query(RelatedPost.post_id)
+                               .filter(RelatedPost.related_id.in_(ids)))
+                targets.update(related_id for entries in top_related(ids, per_post * CANDIDATES).values()
+                               for related_id, _ in entries)
+
+            for ids in chunks(sorted(targets), batch):
+                changed = refresh(ids)
+                db.session.commit()
+                app.extensions['page_cache'].invalidate(*[f'related:{ post_id }' for post_id in changed])
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Related posts update for %d posts failed', len(post_ids))
+
+
+def rebuild_related(batch=500):
+    """Recompute every post's related list, batch posts at a time; returns how many posts were done"""
+    per_post = current_app.config['RELATED_POSTS']
+    after, count = 0, 0
+    while True:
+        post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter(Post.id > after)
+                    .order_by(Post.id).limit(batch)]
+        if not post_ids:
+            return count
+
+        store(top_related(post_ids, per_post))
+        db.session.commit()
+        after, count = post_ids[-1], count + len(post_ids)
+
+
+def related_query(post_id):
+    """Select a post's related posts, best first"""
+    return (select(Post.id, Post.title, Post.updated_at)
+            .join(RelatedPost, RelatedPost.related_id == Post.id)
+            .where(RelatedPost.post_id == post_id)
+            .order_by(RelatedPost.score.desc(), RelatedPost.related_id.desc()))
+
+
+def related_posts(post_id):
+    """A post's related posts, best first, in one indexed lookup"""
+    return db.session.execute(related_query(post_id)).all()
+
+
+def init_related(app):
+    app.extensions['related_worker'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='blogly-related')
+
@@ -0,0 +1,78 @@
+"""Read-replica routing for Blogly.
+
+GET and HEAD requests read from a randomly chosen replica bind and every
+other request uses the primary. A client that has just written sticks to
+the primary for REPLICA_STICKY_SECONDS, so it reads its own writes however
+far the replicas lag. Flushes always go to the primary, and so do reads
+that fill shared caches, since a lagging replica's rows would be cached
+under the token of the write they predate and outlive it.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+
+from pool import engine_options
+
+REPLICA_PREFIX = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+
+
+def replica_binds(config):
+    """SQLALCHEMY_BINDS entries for the configured replica URLs"""
+    return {f'{REPLICA_PREFIX}{i}': {'url': url, **engine_options(config, url)}
+            for i, url in enumerate(config['DATABASE_REPLICA_URLS'])}
+
+
+def replica_keys():
+    return [key for key in current_app.config['SQLALCHEMY_BINDS'] if key.startswith(REPLICA_PREFIX)]
+
+
+class RoutingSession(Session):
+    """Session that reads from the request's replica, if it was given one"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = g.get('db_replica') if has_app_context() else None
+        if bind is None and replica is not None and not self._flushing:
+            return self._db.engines[replica]
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def choose_bind():
+    """Send this request's reads to a replica unless the client wrote recently"""
+    replicas = replica_keys()
+    if replicas and request.method in READ_METHODS and session.get('primary_until', 0) < time.time():
+        g.db_replica = random.choice(replicas)
+
+
+@contextmanager
+def primary_reads():
+    """Send the request's reads to the primary inside the block"""
+    replica = g.pop('db_replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            g.db_replica = replica
+
+
+def stick_to_primary(resp):
+    """Keep a client that just wrote on the primary for a while"""
+    if request.method not in READ_METHODS and replica_keys():
+        session['primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+    return resp
+
+
+def release_bind(exc):
+    g.pop('db_replica', None)
+
+
+def init_routing(app):
+    app.config['SQLALCHEMY_BINDS'] = {**replica_binds(app.config), **app.config.get('SQLALCHEMY_BINDS', {})}
+    app.before_request(choose_bind)
+    app.after_request(stick_to_primary)
+    app.teardown_request(release_bind)
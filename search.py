@@ -0,0 +1,121 @@
+"""Full-text search and title lookup over posts for Blogly.
+
+PostgreSQL keeps a generated, weighted tsvector column on posts behind a GIN
+index. SQLite keeps an external-content FTS5 table in sync with triggers.
+Title prefix lookups use a case-insensitive expression index on both.
+"""
+from sqlalchemy import column, event, func, literal_column, table, text
+from sqlalchemy.orm import joinedload
+
+from models import db, Post, Tags
+
+POSTGRESQL_DDL = [
+    """ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+       GENERATED ALWAYS AS (setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                            setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_posts_title_prefix ON posts (lower(title) text_pattern_ops)",
+]
+
+SQLITE_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_posts_title_prefix ON posts (title COLLATE NOCASE)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts
+       USING fts5(title, content, content='posts', content_rowid='id', tokenize='porter')""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+         INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+         INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE ON posts BEGIN
+         INSERT INTO posts_fts(posts_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+         INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+       END""",
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')",
+]
+
+posts_fts = table('posts_fts', column('rowid'))
+
+# bm25 column weights for (title, content), mirroring the A/B tsvector weights
+SQLITE_WEIGHTS = (10.0, 1.0)
+
+
+def install_search(connection):
+    """Create the search column/index or FTS table for this database, if missing"""
+    ddl = {'postgresql': POSTGRESQL_DDL, 'sqlite': SQLITE_DDL}.get(connection.dialect.name, [])
+    for statement in ddl:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Post.__table__, 'after_create')
+def create_search(target, connection, **kw):
+    install_search(connection)
+
+
+@event.listens_for(Post.__table__, 'before_drop')
+def drop_search(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DROP TABLE IF EXISTS posts_fts'))
+
+
+def fts5_query(q):
+    """Quote each word so user input can't use FTS5 query syntax"""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+
+def search_posts(q, tag_id=None, user_id=None, page=1, per_page=20):
+    """Rank posts matching q, optionally limited to a tag or author.
+
+    Returns ([(post, rank), ...], has_more) for the given 1-based page.
+    """
+    query = db.session.query(Post).options(joinedload(Post.users))
+
+    if db.engine.dialect.name == 'postgresql':
+        tsquery = func.websearch_to_tsquery('english', q)
+        search_vector = literal_column('posts.search_vector')
+        rank = func.ts_rank_cd(search_vector, tsquery)
+        query = query.filter(search_vector.op('@@')(tsquery))
+        order = rank.desc()
+    elif db.engine.dialect.name == 'sqlite':
+        match = fts5_query(q)
+        if not match:
+            return [], False
+        bm25 = func.bm25(literal_column('posts_fts'), *SQLITE_WEIGHTS)
+        rank = -bm25
+        query = (query.join(posts_fts, posts_fts.c.rowid == Post.id)
+                 .filter(literal_column('posts_fts').op('MATCH')(match)))
+        order = bm25
+    else:
+        raise NotImplementedError(f'Search is not supported on {db.engine.dialect.name}')
+
+    if tag_id is not None:
+        query = query.filter(Post.tags.any(Tags.id == tag_id))
+    if user_id is not None:
+        query = query.filter(Post.posted_by == user_id)
+
+    results = (query.add_columns(rank.label('rank'))
+               .order_by(order, Post.id.desc())
+               .offset((page - 1) * per_page)
+               .limit(per_page + 1)
+               .all())
+
+    return [tuple(row) for row in results[:per_page]], len(results) > per_page
+
+
+def lookup_posts(q, limit=10):
+    """Posts whose title starts with q, case-insensitively, in title order"""
+    prefix = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    if db.engine.dialect.name == 'postgresql':
+        title_key = func.lower(Post.title)
+        title_match = title_key.like(prefix.lower(), escape='\\')
+    else:
+        title_key = Post.title.collate('NOCASE')
+        title_match = Post.title.like(prefix, escape='\\')
+
+    return (Post.query
+            .options(joinedload(Post.users))
+            .filter(title_match)
+            .order_by(title_key, Post.id)
+            .limit(limit)
+            .all())
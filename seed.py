@@ -1,48 +1,31 @@
-from models import db, connect_db, User, Post, Tags, PostTags
-from app import app
+"""Seed the development database with a few users, tags and posts."""
+from models import db
+from app import create_app
+from transfer import import_records
+
+create_app().app_context().push()
 
 db.drop_all()
 db.create_all()
 
-user1 = User(first_name='Bob', last_name='Saget', profile_pic='data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBwgHBhAQBw4QEBASFxENFxUYFxsQEw0WIB0WIhUdHx8kKCgsJCYlJx8VLTotJykrLi4uIx8zODMsNygtLisBCgoKDQ0NDg0NDisZFRktKy0rKzcrNysrKysrKzcrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrK//AABEIAKoAqgMBIgACEQEDEQH/xAAbAAEAAgMBAQAAAAAAAAAAAAAABgcDBAUCAf/EADoQAAIBAgQCBwQIBgMAAAAAAAABAgMEBREhMQYSEyJBUXGBkVJhocEHFCMyM0JisSQ1cpLR4RY0ov/EABcBAQEBAQAAAAAAAAAAAAAAAAACAQP/xAAcEQEBAQADAQEBAAAAAAAAAAAAARECMUFREiH/2gAMAwEAAhEDEQA/ALLAB0cgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA81akKNNyqNRitW3okgPRrXN/aWv/Yqwh4tZ+m5EsZ4lr3M3CxbhT2z2lPz7ER9tt5vf1bKnH6y1YL4iwlP8b/y38jPQxjD7h5Uq0M+5vlfxK2Pu+5v5hq1lqtAV1hmNXmHTXRy5oew9Yvw7ic4ZiFDErbnoeDj+aD7mTZhLrcABjQAAAAAAAAAAAAAAAAh3GGJyqVugovqxyc/1PsXkSy5rK3tpzltFOXoisK1SVarKVTeTcn4srjPWWvAALSAAAb+DYhPDb1TX3X1ZL2l/o0ABasJRqQTg808pL3pno4nCV27nCVGW9NuHlujtnKxYAAAAAAAAAAAAAAACsPpd4mxfBrqlRw6SVKpSlKecFLN82W722KxfF+Lt/fh/Yi9/pBtqN3gXR3CzjOcU+x5avcoXiDAa2HXX2S5oTcnFRzk4pdj031FlzVTOnWwDFeIMdxOnQtp0o88lDnlBKlT0bzk0nktDqTo8TU7a+qVLi1jGyfLLNZfWNWs6enWWm55w3iHCsMsaFraWt1G1uIRjiMHHmlctLR023mlnntkY7mrc8W3tOFVcthZuVGhTmuSrGi11U2t2ko5tsmW3+KskYpXPESwv6w61Dk5ely5etl3bHD/5fi6/ND+xE+djQlYdA0+j5ejyzeeXdmV9j+BVsOuvs45wk5OKWcnFLbPQqyxMsrNT4sxqrNRpuDb0SUE237kiU/UuKeexXT2v8Ys11dLXb8XTq7kf4RvrLBKVavXoXDvock7ScY506M1nm5p6NbdjOzfcS1L60dHBadWlXxBNX8qkFyV6j1ThvyrNy2S3J3krJ8bPD3EXEeG8ZxsnVpTh08KFRwhGcJpPJtPLbLPUu97lZ/RfhNHCb7KP3503zvNuMmstVnsWYVl9RbL0AAMAAAAAAAAAAAAAHA4zg3hCa7JxfqmiEZ9xZGNWrvcMqQW7XMvFaordpp6l8ek0zYzPgKYAAAMlmADa7/BcG8Vb7oS+LROCM8E2jhbVKsvzNRXgt/iSYi9qnQACWgAAAAAAAAAAAAARDiXAKiqutZRzT1lFbxfa0u1EvBsuFmqpayep8LJvMJsL153FKLftLqy9Uc2rwjYSf2c6sfNS/dFTlE4hAJk+DrXsrVPRHqHCFkn16tV+i+RuwyoWdTBsFuMSqppONLtn2Zdy72S624ewy2eapcz/AFNz+Gx1ElFZLRbdyRN5fGyPFvRp21CMKKyjFcq8DIAS0AAAAAAAAAAAAAAAAB5nONODdRpJatvRJEaxPiynTbjh8ed7c70j5LtNk0txJ20lqadfE7Cg/tq1Neab+BX95iV5ev8AiKspe7aK8loahs4s1Yb4hwpP8Zej/wAGSljWGVX1K9PzfL+5XAN/MNWrCpCpHOm1Je5pr4Hoq2hcVraedCcoP3No7+HcWXFJpX0ekjtzLqyXyZl401Mwa9le299S5rWakvRxfc12GwS0AAAAAAAAAAAAADBe3dGyt3UuJZRXq33L3mWc404NzeSWbb7kivcexWeJ3emlOOaivd3v3s2TWW4YzjNfE6mvVp9kOzxfezmAF9JAAaAAAAADPZXdexrqdtLlfwa7mu1E8wTGKWKUfZqL70fmu9FeGa1uatpXU6DylHX/AE/cZZrZcWiDSwnEKeJWanT0f3ZL2X3G6c1AAAAAAAAAB8k1GLctlm/JARjjPEXTpqhSesutPw7F57kQNnErp3t9OpL8zb8F2L0NY6SZEWgANAAAAAAAAAAAdfhrEXYYglN9SplCXcu5+RYBVBY2AXbvcKpyluuo/FaEcp6qXx0QAS0AAAAADm8Q13b4NVa3a5PV5HSOHxj/ACZ/1w+Zs7KggAOiAAAAAAAAAAAAAAJbwNXbjWpv9NT5P5ESJHwR/Mp/0P8AdGXps7TQAHNQAAP/2Q==')
-user2 = User(first_name='Sponge', last_name='Bob', profile_pic='data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBxAPEBAQDxAQEBUPDxAQEA8ODxASDxAQFRYXFhYRExMYHSggGBoxGxUVITEhJSkrLi4uFx8zODMsNygtLisBCgoKDg0OFRAQFysaFyUuKyswKy4tLSsrLSs3KystLS0rKy0tLS8tNysrLTcwLSsrKysrLTctLSstNysrLSsrK//AABEIAM0A9gMBIgACEQEDEQH/xAAbAAEAAwEBAQEAAAAAAAAAAAAAAQUGBAMCB//EADgQAAIBAgMFAwkIAwEAAAAAAAABAgMRBAUhEjFBUXEiYYEGEzJCUnKRscEUFSNikqHR8DODokP/xAAZAQEBAQEBAQAAAAAAAAAAAAAAAQUEAwL/xAAhEQEAAgICAwADAQAAAAAAAAAAAQIDEQQxBRIhQVFhFP/aAAwDAQACEQMRAD8A/bAAVAAAAAAAAAAAAAAAIlNLVtLvbAkHLPMaK31I+F38jz+96Ht/8yA7gc9PH0pbqkX3Xt8zoTAAkgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAESkkrt2txZLZms2zF1XsxfYX/T5gdWOzv1aX639EVFWtKbvOTfVnmCoAAAe+HxdSm7wk13b0/A8ABo8BnEaloztGXP1ZFmYkvclzG/4c37knx7mTS7XIJIAAAAAAAAAAAAAAAAAAAAAAAAAEkACqz7F7MVTi9Z7/AHTPHTmNfzlScu+y7ktDmKgAAAAAAAATFtNNaNO6fJkADW5divO01Ljul7x0me8nq+zNw4TX7o0JFAAAAAAAAAAAAAAAAAAAAAAAACq8pM1+yUJ1PNznZS1itIWV7y5FqV+eztRffKKs9zXFAYrD4qrUpqqlTjGd9m6cpaaO+pPn6yV/wn4ST+Z7xSjCdJW7M5VILj5ubu14S2l8DwW4x8/Ky48s1/DY4vFxZMcTPb5WZSXpUZPvpyUv2djoo42nN2UrP2Jpxl8Hv8LnJuZ9SipaSV1yZ215Xz6+8ni6a3WdLEGZxOPq4WqoQl5yEouahV1lHnFS3959vyvhZrzHa13zdutjqreLRuGPfFNLTWe2lUW9eC3t6JeJzTxtJabW0+VNOT/bQoMuq1MZUqOtLsUnG1KLtGUnqtrmkXNklZWS5JWObJyorOo7dvH4E3j2tOodEcS36NN/7JpfsiJV5+xD4yZ403YnabaRn5edk3qHdHAxV/rroY9UJUp1YbKnNRi4NvtNpbvE20XdJrjqZDB4i8p1EoyjhoqlFtXjKvN7VS3upRV+bZrKFTahGXtRi9O9Grh9ppE27Y2b195ivT7AB6vIAAAAAAAAAAAAAAAAAAAAACq8o3+HBc5/QtSp8pPQh77+QGQznCVKkNqg1GrTvKk3uv60Zc0+RW4fM5xgvtVGdBrRztejLvUl6PRmhB4Z+NTN33+3Rx+VbD19hTLERlrGSkucWmj6+0JeHE9cTkGFqPadGKfGVO9NvxjY8oeTWFTu41JflnWqSh+ls5f8Nuvb41I8tTX2v1WZZgJYqtPEVNKavCnznwuu7Qv4ZXQW6lDXnFN/E6oxSSSSSWiS0SXKxJ346RSsVY2XJOS83Z2pgvsdfbi/wq6tr6tReq/odrxCLOrTjOLjKKkno4yV0+pwLIcKnfzS6OUrfC5w5+DOS/tWdNHjeRjHT1tDwnjYLfJdFrJ+C/g4sS8ZVexRpSoxkv8ALPScludl6itxepoKGGhTVqcIwX5YpHqXD4+lZ3afaXxm8ja/ysahFCmqdKnRhpGmtFzb1cnzZrssd6NP3EZI1mVf4afumhrUM7e3UACAAAAAAAAAAAAAAAAAAAAAAFZ5QQvSvymn8SzPDHUdunOPNadQMgACo+lISkfIAkXIAE3IAAAAAbDBQ2adNcoR+RlcHR26kY82r9OJsEJWAAEAAAAAAAAAAAAAAAAAAAAAAJIAGczvBOEnNLsy1f5XyKw2tSCkmpJNPemUONyWUdaXaXsv0ippUA+pwcXaSa6o+QAAKgAAAPWjh5zdoxb6LQusvyZRalVs3vUVrHx5kVORYFxTqSVnJdlPelzLcgEUAAAAAAAAAAAAAAAAAAAAAAAAAAAAAfNSnGXpJPqrnLPK6Ev/ADS91tfI7CQK2WS0XwkukmR9x0fz/qLIAV8clocpPrJntTy6jHdTj46/M6yAIjFLckuhIAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA2BJEpJatpdX9SqxudRjeNPtP2n6K/kpMRip1Hecm+7h8Bo20NfN6UeLm+UV9Thq5+/Vppe82/kUwLpNrKWdVn7K6RPn74re0v0orwBZwzuqt6i/A6aWf+3T8Yv6MowBq8PmVKpukk+UtDrMSdeEzCpT3SuvZlqho21YODA5pCro+zL2Xx6M7yKAAAAAAAAAAAAAAAAAAAAAAB8VqsYRcpOyX9sAr14wjtTdkv7ZGbzDMpVdF2Y+zxfU8sfjZVpXeiXox4Lv6nKWEmQAAAAAAAAAAAAALjLc3cbQqu63KXFdSnAG2TT1Wt9VbkDOZTmTptQm7xb0b9V/waNEUAAAAAAAAAAAAAAAAAJAhmazjHedlsx9GL+L5lnneL2IbEX2p6dI8WZssEgACAAAAAAAAAAAAAAAABe5Fj7/hSe70H3ciiPqEmmmnZpqz7wNqQeGBxKqwUlx3rk+KPcigAAAAAAAAAAAAAGwcmbV9ilNre+yvH+sDO5jiPOVJS4XtHojmAKgAAAAAAAAAAAAAAAAAAAAAtfJ/EbM3B7prT3kaIxVKo4yUlvi0/gbKlPaSkvWSfxJKw+gAAAAAAAAAAAAApfKSp6Eesn8i6M3n8vxrcoxArQAfSAAIAAAAAAAAAAAAAAAAAAAGoySptUY/lvH4GXL/ycl2JrlJfISQuCACKAAAAAP/Z')
-user3 = User(first_name='Michael', last_name='Jordan')
-user4 = User(first_name='Biggy', last_name='Smalls', profile_pic='data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBxAQDxAQDw8SDxIPDxAQDxAXERUPDxASFRUWFhYSFhcYHCghGBolGxYTITEiJSkrLi4vFx8zODUtNygtLisBCgoKDg0OGhAQFy0dHR0tLS0tLS8tLS01Ky0tLS0rLS0tLS0tLS0tLSstLS0tKy0rKystLSstKy0tKysrLTctK//AABEIANoA5wMBIgACEQEDEQH/xAAcAAEAAQUBAQAAAAAAAAAAAAAABgIDBAUHAQj/xABCEAACAQIDBAcFBAYKAwAAAAAAAQIDEQQSIQUxQVEGEyJSYXGBBzKRkqEUQnKxI4LBwtHwFTNTYoOTotLh8UNUw//EABgBAQEBAQEAAAAAAAAAAAAAAAABAgME/8QAHREBAQEBAAIDAQAAAAAAAAAAAAERAiExAxJBUf/aAAwDAQACEQMRAD8A6UADo5gAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAGr2t0iwmF0r14xl/Zq86nyxu16gbQEFxftNw0bqlQq1LcZONJP6t/Q11T2pT4YOC867f7gXK6WDhuO6abRniJVoV3Ti5XhRUv0cI921rS9VqS7D+1Sm/6zBzi+UasZP0zJfmDHRARDCe0fZ09Jyq0HynTb+sMxI9n7Vw+IV6FenV5qM1KS81vQTGYAAAAAAAAAAAAAAAAAAAAAAAAAAABHen20Xh9n1ZRdpVLUYvc1n95rxyqQER6adO5znPD4OfV043jOuvfqPc1B8I+K1fgt/PJ1Xd673dve34sTZTjaE6UstSLhK0ZOL0klJKSbXC6afqR0xQ6h5nLdSLi2pJxkm1KLVpJ8U09zKXMDIznrlfeY2YqUwL8Z37MteKfEu00004yytap3yteTW5mG5bnyd/TiZNwJr0Z9oOIw8owxbliaN7OT1r01zUvvrwevjwOtYXEwqwhUpyU4VIqUJLdJPifOKOleyPaz/TYOTukuvo+CulUivC7i/WRWbHSQAGQAAAAAAAAAAAAAAAAAAAAAIJ7XKlsLQj3sRf5YSX7xOznntgl+jwi5zrP4KH8Qs9on0M2VGvLFVWnUng6CxNGirWqyhNO0r714cbko2jsOniNv1cTWaWEo0aG0K0npCUXD9HBvk3Bt+EZGl9n2OlhKe0cbGKk8Ph6UVF7pOdVPL6qDRIfaltRT2Lh6mDg1h8T1fWTtZxhHNkpT5WklHlvXE5W3Xo5kxCem2HliJT2tRw7p4TFVpQhJtuUpx7LrSjbsRm00vFO9myJM6D7V8W6P2LZtNuNHD4SlOUVopy1hFvnbJJ+crnPWanpjr2XKrlBUioriZNJ3in4Ix0i7hn2Y/hRUX4ki6BYnq9pYV3spzdKXipxcUvjlI6jYbEqZcVhpd3E0H8KkSpX0GAwGAAAAAAAAAAAAAAAAAAAACtU2S3F55vXpQc49sT0wf+P/APM6TKmyMdM+iksdTjlnkqUszg3rF3teL5blqZ+0d+fgvu1yPDbZdPB4nCKKtialGo5/eXVt9l800/T1J1idsrB7K2S6kY4nCYijPD42hpLSeaaa5Tj2tH4rxUM2v0Sx2Hv1mHm4r78F1sPPs6r1SI1V3vz1/wCRZp55T32ufZ6s8Di8PWhVjXw3V2Uu24wd4za3rWU077mrHPZFckW5CTGbdeFcShFcSou8CrC+7HyRRcqoPsryRRJeiWyIYurUpz6x5acXBQkovNKrTp3bcZdlZ293DeZG1tiLB43D041VWjN0asZWytJ1LZWrvXsmq2JteeFlVlTjCTq0XR7azRinOE82Xc2nBaPTnc3XRbZ2K2jjadWcp1FCpTnWrzblpTs8t3veiSREvp2tgMGnMAAAAAAAAAAAAAAAAAAF3DtZtdNNOVzKaMAojGcf6uo4rutZ4eieq9GZ6muvHcnirO2NqTp1IUKSjGdSDmqk75NHbLFL3pcfhvNHjMZjFeOtWTW+M+rS8stk34WJBWqOUXGtRp1Y8dU155Z/xMGMMI7WjOnfcozqRi/LJKx5fk+P5LfFdpeb+uSY3aWPp4mUXicZTvmkk6s5xikrvRy8HZMl3s8qVNpKr9tw9HF0FHsYmeHjGpnTt1b0tPS7utVbW9yXrA4CUlOUKdSS3SqN1ZLyzt2NnHEwSSUopLck0kvI3zLPddJxf60GM9neyqm/CKH4JzpfSMrGnxXsi2fL3KuJpeCqQmv9cG/qTf7XDvx+KDx9Jb5x+JvUvx45zV9jVH7mNqr8VOE/ysYk/Y1P7uPj64Z/sqHTv6Uprc3LyjJmLiOkdKF9ytvzTjFr0V2Wa59fWOcP2O1v/dpP/Akv3xP2UdXBOtj4RSjdpUW72WrV5knx3T6krxp1YyfKCv8AWzf0I3tDpA61883GL3rJUSf4pNXfqbkt9uXXfP5GJhdg7PoavrMZJc/0dL4Wu/VMkGwdpS+00o2jCnrCNOKy043WmnwI/TxFOXu1IS8pK/wZl4KTjVpy3WnF/BnWSOFt/XTwL7gYaAAAAAAAAAAAAAAAAAAACAQGu6RKr9krdS7VMqcdVFtZlmSb3Xjm1OOqM6uN92WHVKKnJRq1JSb0y9tyb1vfR8PM7XtFXo1fwS/I5i8unYjmas527bUX7rfGKzK3my/XabjKjtKuv/LN+bzfncuLa9fvr/Lh/tMEHTIxtZ39L1++v8uH+00eyMVjaGLxLnUq1aNVOVKUpy6tVLweuVrRRc1lTjwM4q628VHhGUn6tRv+SM9cytTqszF7Yq1IqM6dGe694NN+UlK69W/UistmzxGKrzrOp9mjVmsLRk5RjOF2lJqyzJJWvbV35G8Ltad40/7sHH/VKX7X8CfSafZj0qUYJRhFRS3JJRS9EVgHRlYxOEp1F24pvhLdNeT3o02CrVKc5011s5QlJQyTjFKz0lKMoST0y93zJAI0qSd4QtVlldWd2829Rja9lZJbt9zn3zrUuOm7OlN0KLq/1jpU3U5Z8qzfW5klvDq0IL+7H8i4ZUAAAAAAAAAAAAAAAAAAAIACmtG8ZLnFr6HK8XBxk1bWEndcWtU0vz9EdXRz/pPg3SxEnbSp21+1GuWa06d9UeiCSbeVO+/er+OjRcc4W0p683JteiVjaLLfBb/51fgVeX8+I8la/wDPqAB7F8P5/wC/+eZ4ADVvz81zQK41Xaz1X8/AZ49xed5X/O30HkUJF7CUs9WEUtZSinzevF8bKy9C3Kd+Frbjd9EcG5187XZpK/rwRKJyluAYOetgAAAAAAAAAAAAAAAAAAAAAjXbe2YsRSa3TjrB+PI2IBXLa9CVOTjNOMlo0WzpG09k0sQu2teE1pJEXxnRStFt02qi4L3WblYxHwZdbZleHvUZr0uvoY7pSW+Ml+qzWwUA9yPk/gypUpvdGT/VY0UAzKOy8RP3aM35qy+LNtguidWTvVkoLilrIaNFhcNOpJQprM39PFnRNjbPWHpKC1b1nLmz3Z2zKVCNqcbPjJ6yZmHO1ZAAEaAAAAAAAAAAAAAAAAAAAAAAAAAAUenjS5L4XPG0t7t9CxPHUY+9Vgv1kEX8i7q+B6kvD8jD/pbD/wBvT+ZF2GNoy92rB/rIDIPAncA8AAIoAAAAAAAAAAAAAAAAAAAAAAAADHxuNp0YZ6krLguL8CFbX6Q1azcYPq4clvfmyyampPtDpDQo6X6yS+7H9rI5jOlNed1C1JeGr+JogbkZ1erYupN3nUlLzk7Fix6C4FgABfoYyrB3hUlH9Z2Nxg+lVaFlUSqLj92XxNABg6Fs7b1CtopZJd2Wj9HxNocpRvdj9I6lK0an6SGi196K8zN5WVOQWcJioVYKdOWZP6eBeMNAAAAAAAAAAAAAAAAAAQAwtq7Thh4Zpat+7Hmy9jsXGjTlUm9Et3N8jnW0sdOvUc5/qx4RXI1IlptDHVK83Ko78lwiuSMUA2yAAoAAAAAAAAAADN2ZtGpQnmg9PvR4SRP9m7QhXgpwf4o8U+RzMztkbRlh6iktY/fjwaM2ErpALWGxEakIzg7xkrrw8C6c2wAAAAAAAAAAAAAANZ0ix3U0JNPtS7EPXj6AqMdKtqdbU6uL7FN285cWaMBnWOYACqAAAAAAAAAAAAAAAIJF0S2pkn1M32Zvs+EiaHKoyaaa0a1TOj7FxnX0IT42tLwaM9RZWcADDQAAAAAAv5VyQyrkgLAL+Vcke5VyXwAx0Qnpji81dU09KS1/E9f4E+yrkiC7Uoxdaq3GLed62RrlKjYN11EO5H5UOoh3I/KjaY0oN11EO5H5UOoh3I/KgmNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKSXoVi7VJUm9JrNHzW8xOoh3I/KjP2JSisRTtGK1fBLgSr6S1gyMq5IZVyRzaY4L+VckMq5ICwC/lXJHoH//Z')
-user5 = User(first_name='Jawn', last_name='Jawnson')
-
-db.session.add_all([user1, user2, user3, user4, user5])
-db.session.commit()
-
-post1 = Post(title='First Post', content='I made a post!', posted_by=1)
-post2 = Post(title='Second Post', content='So did I!', posted_by=2)
-post3 = Post(title='Third Post', content='Wooooooooow', posted_by=3)
-post4 = Post(title='Fourth Post', content='I like to post', posted_by=3)
-post5 = Post(title='Fifth Post', content='Me too', posted_by=4)
-post6 = Post(title='Sixth Post', content="I don't know what to post", posted_by=5)
-
-db.session.add_all([post1, post2, post3, post4, post5, post6])
-db.session.commit()
-
-tag1 = Tags(name='First Tag')
-tag2 = Tags(name='Second Tag')
-tag3 = Tags(name='Third Tag')
-tag4 = Tags(name='Fourth Tag')
-tag5 = Tags(name='Fifth Tag')
-tag6 = Tags(name='Sixth Tag')
-
-db.session.add_all([tag1, tag2, tag3, tag4, tag5, tag6])
-db.session.commit()
-
-pt1 = PostTags(post_id='1', tag_id='1')
-pt2 = PostTags(post_id='1', tag_id='2')
-pt3 = PostTags(post_id='2', tag_id='3')
-pt4 = PostTags(post_id='2', tag_id='4')
-pt5 = PostTags(post_id='3', tag_id='5')
-pt6 = PostTags(post_id='4', tag_id='6')
-pt7 = PostTags(post_id='4', tag_id='5')
-pt8 = PostTags(post_id='4', tag_id='4')
-pt9 = PostTags(post_id='5', tag_id='3')
-pt10 = PostTags(post_id='6', tag_id='2')
-
-db.session.add_all([pt1, pt2, pt3, pt4, pt5, pt6, pt7, pt8, pt9, pt10])
-db.session.commit()
\ No newline at end of file
+records = [
+    {'type': 'user', 'id': 1, 'first_name': 'Bob', 'last_name': 'Saget', 'profile_pic': 'data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBwgHBhAQBw4QEBASFxENFxUYFxsQEw0WIB0WIhUdHx8kKCgsJCYlJx8VLTotJykrLi4uIx8zODMsNygtLisBCgoKDQ0NDg0NDisZFRktKy0rKzcrNysrKysrKzcrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrKysrK//AABEIAKoAqgMBIgACEQEDEQH/xAAbAAEAAgMBAQAAAAAAAAAAAAAABgcDBAUCAf/EADoQAAIBAgQCBwQIBgMAAAAAAAABAgMEBREhMQYSEyJBUXGBkVJhocEHFCMyM0JisSQ1cpLR4RY0ov/EABcBAQEBAQAAAAAAAAAAAAAAAAACAQP/xAAcEQEBAQADAQEBAAAAAAAAAAAAARECMUFREiH/2gAMAwEAAhEDEQA/ALLAB0cgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA81akKNNyqNRitW3okgPRrXN/aWv/Yqwh4tZ+m5EsZ4lr3M3CxbhT2z2lPz7ER9tt5vf1bKnH6y1YL4iwlP8b/y38jPQxjD7h5Uq0M+5vlfxK2Pu+5v5hq1lqtAV1hmNXmHTXRy5oew9Yvw7ic4ZiFDErbnoeDj+aD7mTZhLrcABjQAAAAAAAAAAAAAAAAh3GGJyqVugovqxyc/1PsXkSy5rK3tpzltFOXoisK1SVarKVTeTcn4srjPWWvAALSAAAb+DYhPDb1TX3X1ZL2l/o0ABasJRqQTg808pL3pno4nCV27nCVGW9NuHlujtnKxYAAAAAAAAAAAAAAACsPpd4mxfBrqlRw6SVKpSlKecFLN82W722KxfF+Lt/fh/Yi9/pBtqN3gXR3CzjOcU+x5avcoXiDAa2HXX2S5oTcnFRzk4pdj031FlzVTOnWwDFeIMdxOnQtp0o88lDnlBKlT0bzk0nktDqTo8TU7a+qVLi1jGyfLLNZfWNWs6enWWm55w3iHCsMsaFraWt1G1uIRjiMHHmlctLR023mlnntkY7mrc8W3tOFVcthZuVGhTmuSrGi11U2t2ko5tsmW3+KskYpXPESwv6w61Dk5ely5etl3bHD/5fi6/ND+xE+djQlYdA0+j5ejyzeeXdmV9j+BVsOuvs45wk5OKWcnFLbPQqyxMsrNT4sxqrNRpuDb0SUE237kiU/UuKeexXT2v8Ys11dLXb8XTq7kf4RvrLBKVavXoXDvock7ScY506M1nm5p6NbdjOzfcS1L60dHBadWlXxBNX8qkFyV6j1ThvyrNy2S3J3krJ8bPD3EXEeG8ZxsnVpTh08KFRwhGcJpPJtPLbLPUu97lZ/RfhNHCb7KP3503zvNuMmstVnsWYVl9RbL0AAMAAAAAAAAAAAAAHA4zg3hCa7JxfqmiEZ9xZGNWrvcMqQW7XMvFaordpp6l8ek0zYzPgKYAAAMlmADa7/BcG8Vb7oS+LROCM8E2jhbVKsvzNRXgt/iSYi9qnQACWgAAAAAAAAAAAAARDiXAKiqutZRzT1lFbxfa0u1EvBsuFmqpayep8LJvMJsL153FKLftLqy9Uc2rwjYSf2c6sfNS/dFTlE4hAJk+DrXsrVPRHqHCFkn16tV+i+RuwyoWdTBsFuMSqppONLtn2Zdy72S624ewy2eapcz/AFNz+Gx1ElFZLRbdyRN5fGyPFvRp21CMKKyjFcq8DIAS0AAAAAAAAAAAAAAAAB5nONODdRpJatvRJEaxPiynTbjh8ed7c70j5LtNk0txJ20lqadfE7Cg/tq1Neab+BX95iV5ev8AiKspe7aK8loahs4s1Yb4hwpP8Zej/wAGSljWGVX1K9PzfL+5XAN/MNWrCpCpHOm1Je5pr4Hoq2hcVraedCcoP3No7+HcWXFJpX0ekjtzLqyXyZl401Mwa9le299S5rWakvRxfc12GwS0AAAAAAAAAAAAADBe3dGyt3UuJZRXq33L3mWc404NzeSWbb7kivcexWeJ3emlOOaivd3v3s2TWW4YzjNfE6mvVp9kOzxfezmAF9JAAaAAAAADPZXdexrqdtLlfwa7mu1E8wTGKWKUfZqL70fmu9FeGa1uatpXU6DylHX/AE/cZZrZcWiDSwnEKeJWanT0f3ZL2X3G6c1AAAAAAAAAB8k1GLctlm/JARjjPEXTpqhSesutPw7F57kQNnErp3t9OpL8zb8F2L0NY6SZEWgANAAAAAAAAAAAdfhrEXYYglN9SplCXcu5+RYBVBY2AXbvcKpyluuo/FaEcp6qXx0QAS0AAAAADm8Q13b4NVa3a5PV5HSOHxj/ACZ/1w+Zs7KggAOiAAAAAAAAAAAAAAJbwNXbjWpv9NT5P5ESJHwR/Mp/0P8AdGXps7TQAHNQAAP/2Q=='},
+    {'type': 'user', 'id': 2, 'first_name': 'Sponge', 'last_name': 'Bob', 'profile_pic': 'data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBxAPEBAQDxAQEBUPDxAQEA8ODxASDxAQFRYXFhYRExMYHSggGBoxGxUVITEhJSkrLi4uFx8zODMsNygtLisBCgoKDg0OFRAQFysaFyUuKyswKy4tLSsrLSs3KystLS0rKy0tLS8tNysrLTcwLSsrKysrLTctLSstNysrLSsrK//AABEIAM0A9gMBIgACEQEDEQH/xAAbAAEAAwEBAQEAAAAAAAAAAAAAAQUGBAMCB//EADgQAAIBAgMFAwkIAwEAAAAAAAABAgMRBAUhEjFBUXEiYYEGEzJCUnKRscEUFSNikqHR8DODokP/xAAZAQEBAQEBAQAAAAAAAAAAAAAAAQUEAwL/xAAhEQEAAgICAwADAQAAAAAAAAAAAQIDEQQxBRIhQVFhFP/aAAwDAQACEQMRAD8A/bAAVAAAAAAAAAAAAAAAIlNLVtLvbAkHLPMaK31I+F38jz+96Ht/8yA7gc9PH0pbqkX3Xt8zoTAAkgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAESkkrt2txZLZms2zF1XsxfYX/T5gdWOzv1aX639EVFWtKbvOTfVnmCoAAAe+HxdSm7wk13b0/A8ABo8BnEaloztGXP1ZFmYkvclzG/4c37knx7mTS7XIJIAAAAAAAAAAAAAAAAAAAAAAAAAEkACqz7F7MVTi9Z7/AHTPHTmNfzlScu+y7ktDmKgAAAAAAAATFtNNaNO6fJkADW5divO01Ljul7x0me8nq+zNw4TX7o0JFAAAAAAAAAAAAAAAAAAAAAAAACq8pM1+yUJ1PNznZS1itIWV7y5FqV+eztRffKKs9zXFAYrD4qrUpqqlTjGd9m6cpaaO+pPn6yV/wn4ST+Z7xSjCdJW7M5VILj5ubu14S2l8DwW4x8/Ky48s1/DY4vFxZMcTPb5WZSXpUZPvpyUv2djoo42nN2UrP2Jpxl8Hv8LnJuZ9SipaSV1yZ215Xz6+8ni6a3WdLEGZxOPq4WqoQl5yEouahV1lHnFS3959vyvhZrzHa13zdutjqreLRuGPfFNLTWe2lUW9eC3t6JeJzTxtJabW0+VNOT/bQoMuq1MZUqOtLsUnG1KLtGUnqtrmkXNklZWS5JWObJyorOo7dvH4E3j2tOodEcS36NN/7JpfsiJV5+xD4yZ403YnabaRn5edk3qHdHAxV/rroY9UJUp1YbKnNRi4NvtNpbvE20XdJrjqZDB4i8p1EoyjhoqlFtXjKvN7VS3upRV+bZrKFTahGXtRi9O9Grh9ppE27Y2b195ivT7AB6vIAAAAAAAAAAAAAAAAAAAAACq8o3+HBc5/QtSp8pPQh77+QGQznCVKkNqg1GrTvKk3uv60Zc0+RW4fM5xgvtVGdBrRztejLvUl6PRmhB4Z+NTN33+3Rx+VbD19hTLERlrGSkucWmj6+0JeHE9cTkGFqPadGKfGVO9NvxjY8oeTWFTu41JflnWqSh+ls5f8Nuvb41I8tTX2v1WZZgJYqtPEVNKavCnznwuu7Qv4ZXQW6lDXnFN/E6oxSSSSSWiS0SXKxJ346RSsVY2XJOS83Z2pgvsdfbi/wq6tr6tReq/odrxCLOrTjOLjKKkno4yV0+pwLIcKnfzS6OUrfC5w5+DOS/tWdNHjeRjHT1tDwnjYLfJdFrJ+C/g4sS8ZVexRpSoxkv8ALPScludl6itxepoKGGhTVqcIwX5YpHqXD4+lZ3afaXxm8ja/ysahFCmqdKnRhpGmtFzb1cnzZrssd6NP3EZI1mVf4afumhrUM7e3UACAAAAAAAAAAAAAAAAAAAAAAFZ5QQvSvymn8SzPDHUdunOPNadQMgACo+lISkfIAkXIAE3IAAAAAbDBQ2adNcoR+RlcHR26kY82r9OJsEJWAAEAAAAAAAAAAAAAAAAAAAAAAJIAGczvBOEnNLsy1f5XyKw2tSCkmpJNPemUONyWUdaXaXsv0ippUA+pwcXaSa6o+QAAKgAAAPWjh5zdoxb6LQusvyZRalVs3vUVrHx5kVORYFxTqSVnJdlPelzLcgEUAAAAAAAAAAAAAAAAAAAAAAAAAAAAAfNSnGXpJPqrnLPK6Ev/ADS91tfI7CQK2WS0XwkukmR9x0fz/qLIAV8clocpPrJntTy6jHdTj46/M6yAIjFLckuhIAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA2BJEpJatpdX9SqxudRjeNPtP2n6K/kpMRip1Hecm+7h8Bo20NfN6UeLm+UV9Thq5+/Vppe82/kUwLpNrKWdVn7K6RPn74re0v0orwBZwzuqt6i/A6aWf+3T8Yv6MowBq8PmVKpukk+UtDrMSdeEzCpT3SuvZlqho21YODA5pCro+zL2Xx6M7yKAAAAAAAAAAAAAAAAAAAAAAB8VqsYRcpOyX9sAr14wjtTdkv7ZGbzDMpVdF2Y+zxfU8sfjZVpXeiXox4Lv6nKWEmQAAAAAAAAAAAAALjLc3cbQqu63KXFdSnAG2TT1Wt9VbkDOZTmTptQm7xb0b9V/waNEUAAAAAAAAAAAAAAAAAJAhmazjHedlsx9GL+L5lnneL2IbEX2p6dI8WZssEgACAAAAAAAAAAAAAAAABe5Fj7/hSe70H3ciiPqEmmmnZpqz7wNqQeGBxKqwUlx3rk+KPcigAAAAAAAAAAAAAGwcmbV9ilNre+yvH+sDO5jiPOVJS4XtHojmAKgAAAAAAAAAAAAAAAAAAAAAtfJ/EbM3B7prT3kaIxVKo4yUlvi0/gbKlPaSkvWSfxJKw+gAAAAAAAAAAAAApfKSp6Eesn8i6M3n8vxrcoxArQAfSAAIAAAAAAAAAAAAAAAAAAAGoySptUY/lvH4GXL/ycl2JrlJfISQuCACKAAAAAP/Z'},
+    {'type': 'user', 'id': 3, 'first_name': 'Michael', 'last_name': 'Jordan'},
+    {'type': 'user', 'id': 4, 'first_name': 'Biggy', 'last_name': 'Smalls', 'profile_pic': 'data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBxAQDxAQDw8SDxIPDxAQDxAXERUPDxASFRUWFhYSFhcYHCghGBolGxYTITEiJSkrLi4vFx8zODUtNygtLisBCgoKDg0OGhAQFy0dHR0tLS0tLS8tLS01Ky0tLS0rLS0tLS0tLS0tLSstLS0tKy0rKystLSstKy0tKysrLTctK//AABEIANoA5wMBIgACEQEDEQH/xAAcAAEAAQUBAQAAAAAAAAAAAAAABgIDBAUHAQj/xABCEAACAQIDBAcFBAYKAwAAAAAAAQIDEQQSIQUxQVEGEyJSYXGBBzKRkqEUQnKxI4LBwtHwFTNTYoOTotLh8UNUw//EABgBAQEBAQEAAAAAAAAAAAAAAAABAgME/8QAHREBAQEBAAIDAQAAAAAAAAAAAAERAiExAxJBUf/aAAwDAQACEQMRAD8A6UADo5gAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAGr2t0iwmF0r14xl/Zq86nyxu16gbQEFxftNw0bqlQq1LcZONJP6t/Q11T2pT4YOC867f7gXK6WDhuO6abRniJVoV3Ti5XhRUv0cI921rS9VqS7D+1Sm/6zBzi+UasZP0zJfmDHRARDCe0fZ09Jyq0HynTb+sMxI9n7Vw+IV6FenV5qM1KS81vQTGYAAAAAAAAAAAAAAAAAAAAAAAAAAABHen20Xh9n1ZRdpVLUYvc1n95rxyqQER6adO5znPD4OfV043jOuvfqPc1B8I+K1fgt/PJ1Xd673dve34sTZTjaE6UstSLhK0ZOL0klJKSbXC6afqR0xQ6h5nLdSLi2pJxkm1KLVpJ8U09zKXMDIznrlfeY2YqUwL8Z37MteKfEu00004yytap3yteTW5mG5bnyd/TiZNwJr0Z9oOIw8owxbliaN7OT1r01zUvvrwevjwOtYXEwqwhUpyU4VIqUJLdJPifOKOleyPaz/TYOTukuvo+CulUivC7i/WRWbHSQAGQAAAAAAAAAAAAAAAAAAAAAIJ7XKlsLQj3sRf5YSX7xOznntgl+jwi5zrP4KH8Qs9on0M2VGvLFVWnUng6CxNGirWqyhNO0r714cbko2jsOniNv1cTWaWEo0aG0K0npCUXD9HBvk3Bt+EZGl9n2OlhKe0cbGKk8Ph6UVF7pOdVPL6qDRIfaltRT2Lh6mDg1h8T1fWTtZxhHNkpT5WklHlvXE5W3Xo5kxCem2HliJT2tRw7p4TFVpQhJtuUpx7LrSjbsRm00vFO9myJM6D7V8W6P2LZtNuNHD4SlOUVopy1hFvnbJJ+crnPWanpjr2XKrlBUioriZNJ3in4Ix0i7hn2Y/hRUX4ki6BYnq9pYV3spzdKXipxcUvjlI6jYbEqZcVhpd3E0H8KkSpX0GAwGAAAAAAAAAAAAAAAAAAAACtU2S3F55vXpQc49sT0wf+P/APM6TKmyMdM+iksdTjlnkqUszg3rF3teL5blqZ+0d+fgvu1yPDbZdPB4nCKKtialGo5/eXVt9l800/T1J1idsrB7K2S6kY4nCYijPD42hpLSeaaa5Tj2tH4rxUM2v0Sx2Hv1mHm4r78F1sPPs6r1SI1V3vz1/wCRZp55T32ufZ6s8Di8PWhVjXw3V2Uu24wd4za3rWU077mrHPZFckW5CTGbdeFcShFcSou8CrC+7HyRRcqoPsryRRJeiWyIYurUpz6x5acXBQkovNKrTp3bcZdlZ293DeZG1tiLB43D041VWjN0asZWytJ1LZWrvXsmq2JteeFlVlTjCTq0XR7azRinOE82Xc2nBaPTnc3XRbZ2K2jjadWcp1FCpTnWrzblpTs8t3veiSREvp2tgMGnMAAAAAAAAAAAAAAAAAAF3DtZtdNNOVzKaMAojGcf6uo4rutZ4eieq9GZ6muvHcnirO2NqTp1IUKSjGdSDmqk75NHbLFL3pcfhvNHjMZjFeOtWTW+M+rS8stk34WJBWqOUXGtRp1Y8dU155Z/xMGMMI7WjOnfcozqRi/LJKx5fk+P5LfFdpeb+uSY3aWPp4mUXicZTvmkk6s5xikrvRy8HZMl3s8qVNpKr9tw9HF0FHsYmeHjGpnTt1b0tPS7utVbW9yXrA4CUlOUKdSS3SqN1ZLyzt2NnHEwSSUopLck0kvI3zLPddJxf60GM9neyqm/CKH4JzpfSMrGnxXsi2fL3KuJpeCqQmv9cG/qTf7XDvx+KDx9Jb5x+JvUvx45zV9jVH7mNqr8VOE/ysYk/Y1P7uPj64Z/sqHTv6Uprc3LyjJmLiOkdKF9ytvzTjFr0V2Wa59fWOcP2O1v/dpP/Akv3xP2UdXBOtj4RSjdpUW72WrV5knx3T6krxp1YyfKCv8AWzf0I3tDpA61883GL3rJUSf4pNXfqbkt9uXXfP5GJhdg7PoavrMZJc/0dL4Wu/VMkGwdpS+00o2jCnrCNOKy043WmnwI/TxFOXu1IS8pK/wZl4KTjVpy3WnF/BnWSOFt/XTwL7gYaAAAAAAAAAAAAAAAAAAACAQGu6RKr9krdS7VMqcdVFtZlmSb3Xjm1OOqM6uN92WHVKKnJRq1JSb0y9tyb1vfR8PM7XtFXo1fwS/I5i8unYjmas527bUX7rfGKzK3my/XabjKjtKuv/LN+bzfncuLa9fvr/Lh/tMEHTIxtZ39L1++v8uH+00eyMVjaGLxLnUq1aNVOVKUpy6tVLweuVrRRc1lTjwM4q628VHhGUn6tRv+SM9cytTqszF7Yq1IqM6dGe694NN+UlK69W/UistmzxGKrzrOp9mjVmsLRk5RjOF2lJqyzJJWvbV35G8Ltad40/7sHH/VKX7X8CfSafZj0qUYJRhFRS3JJRS9EVgHRlYxOEp1F24pvhLdNeT3o02CrVKc5011s5QlJQyTjFKz0lKMoST0y93zJAI0qSd4QtVlldWd2829Rja9lZJbt9zn3zrUuOm7OlN0KLq/1jpU3U5Z8qzfW5klvDq0IL+7H8i4ZUAAAAAAAAAAAAAAAAAAAIACmtG8ZLnFr6HK8XBxk1bWEndcWtU0vz9EdXRz/pPg3SxEnbSp21+1GuWa06d9UeiCSbeVO+/er+OjRcc4W0p683JteiVjaLLfBb/51fgVeX8+I8la/wDPqAB7F8P5/wC/+eZ4ADVvz81zQK41Xaz1X8/AZ49xed5X/O30HkUJF7CUs9WEUtZSinzevF8bKy9C3Kd+Frbjd9EcG5187XZpK/rwRKJyluAYOetgAAAAAAAAAAAAAAAAAAAAAjXbe2YsRSa3TjrB+PI2IBXLa9CVOTjNOMlo0WzpG09k0sQu2teE1pJEXxnRStFt02qi4L3WblYxHwZdbZleHvUZr0uvoY7pSW+Ml+qzWwUA9yPk/gypUpvdGT/VY0UAzKOy8RP3aM35qy+LNtguidWTvVkoLilrIaNFhcNOpJQprM39PFnRNjbPWHpKC1b1nLmz3Z2zKVCNqcbPjJ6yZmHO1ZAAEaAAAAAAAAAAAAAAAAAAAAAAAAAAUenjS5L4XPG0t7t9CxPHUY+9Vgv1kEX8i7q+B6kvD8jD/pbD/wBvT+ZF2GNoy92rB/rIDIPAncA8AAIoAAAAAAAAAAAAAAAAAAAAAAAADHxuNp0YZ6krLguL8CFbX6Q1azcYPq4clvfmyyampPtDpDQo6X6yS+7H9rI5jOlNed1C1JeGr+JogbkZ1erYupN3nUlLzk7Fix6C4FgABfoYyrB3hUlH9Z2Nxg+lVaFlUSqLj92XxNABg6Fs7b1CtopZJd2Wj9HxNocpRvdj9I6lK0an6SGi196K8zN5WVOQWcJioVYKdOWZP6eBeMNAAAAAAAAAAAAAAAAAAQAwtq7Thh4Zpat+7Hmy9jsXGjTlUm9Et3N8jnW0sdOvUc5/qx4RXI1IlptDHVK83Ko78lwiuSMUA2yAAoAAAAAAAAAADN2ZtGpQnmg9PvR4SRP9m7QhXgpwf4o8U+RzMztkbRlh6iktY/fjwaM2ErpALWGxEakIzg7xkrrw8C6c2wAAAAAAAAAAAAAANZ0ix3U0JNPtS7EPXj6AqMdKtqdbU6uL7FN285cWaMBnWOYACqAAAAAAAAAAAAAAAIJF0S2pkn1M32Zvs+EiaHKoyaaa0a1TOj7FxnX0IT42tLwaM9RZWcADDQAAAAAAv5VyQyrkgLAL+Vcke5VyXwAx0Qnpji81dU09KS1/E9f4E+yrkiC7Uoxdaq3GLed62RrlKjYN11EO5H5UOoh3I/KjaY0oN11EO5H5UOoh3I/KgmNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKDddRDuR+VDqIdyPyoGNKSXoVi7VJUm9JrNHzW8xOoh3I/KjP2JSisRTtGK1fBLgSr6S1gyMq5IZVyRzaY4L+VckMq5ICwC/lXJHoH//Z'},
+    {'type': 'user', 'id': 5, 'first_name': 'Jawn', 'last_name': 'Jawnson'},
+    {'type': 'tag', 'id': 1, 'name': 'First Tag'},
+    {'type': 'tag', 'id': 2, 'name': 'Second Tag'},
+    {'type': 'tag', 'id': 3, 'name': 'Third Tag'},
+    {'type': 'tag', 'id': 4, 'name': 'Fourth Tag'},
+    {'type': 'tag', 'id': 5, 'name': 'Fifth Tag'},
+    {'type': 'tag', 'id': 6, 'name': 'Sixth Tag'},
+    {'type': 'post', 'id': 1, 'title': 'First Post', 'content': 'I made a post!', 'posted_by': 1, 'tags': [1, 2]},
+    {'type': 'post', 'id': 2, 'title': 'Second Post', 'content': 'So did I!', 'posted_by': 2, 'tags': [3, 4]},
+    {'type': 'post', 'id': 3, 'title': 'Third Post', 'content': 'Wooooooooow', 'posted_by': 3, 'tags': [5]},
+    {'type': 'post', 'id': 4, 'title': 'Fourth Post', 'content': 'I like to post', 'posted_by': 3, 'tags': [6, 5, 4]},
+    {'type': 'post', 'id': 5, 'title': 'Fifth Post', 'content': 'Me too', 'posted_by': 4, 'tags': [3]},
+    {'type': 'post', 'id': 6, 'title': 'Sixth Post', 'content': "I don't know what to post", 'posted_by': 5, 'tags': [2]},
+]
+
+import_records(records)
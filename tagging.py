@@ -0,0 +1,121 @@
+"""Set-based post/tag association writes for Blogly.
+
+Each change diffs the wanted links against the stored ones and applies the
+difference with one bulk INSERT ... ON CONFLICT DO NOTHING and one
+DELETE ... IN (...), leaving the commit to the caller. The ids returned
+are the links those statements actually wrote, so a concurrent edit that
+got there first isn't counted twice by the post counters.
+"""
+from sqlalchemy import delete, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Post, Tags, PostTags
+
+DIALECT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def link(rows):
+    """Insert post/tag links, skipping any that already exist; returns the (post_id, tag_id) pairs inserted"""
+    if not rows:
+        return set()
+
+    dialect = db.engine.dialect.name
+    stmt = DIALECT_INSERTS[dialect](PostTags.__table__).on_conflict_do_nothing(index_elements=['post_id', 'tag_id'])
+    if dialect == 'sqlite':
+        # SQLAlchemy 1.4 has no RETURNING for SQLite; per-row rowcounts are cheap in process
+        return {(row['post_id'], row['tag_id']) for row in rows if db.session.execute(stmt.values(row)).rowcount}
+
+    return {tuple(row) for row in db.session.execute(stmt.values(rows).returning(PostTags.post_id, PostTags.tag_id))}
+
+
+def unlink(owner_column, owner_id, other_column, other_ids):
+    """Delete the links between one post or tag and the given tags or posts; returns the other ids unlinked"""
+    if not other_ids:
+        return set()
+
+    stmt = delete(PostTags.__table__).where(owner_column == owner_id)
+    if db.engine.dialect.name == 'sqlite':
+        return {other_id for other_id in other_ids
+                if db.session.execute(stmt.where(other_column == other_id)).rowcount}
+
+    return {other_id for (other_id,) in
+            db.session.execute(stmt.where(other_column.in_(other_ids)).returning(other_column))}
+
+
+def existing_ids(model, ids):
+    """The subset of ids that exist in model's table"""
+    if not ids:
+        return set()
+
+    return {row_id for (row_id,) in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+def set_post_tags(post_id, tag_ids, current=None):
+    """Make post_id's tags exactly tag_ids, returning (added, removed) tag ids.
+
+    Pass current=set() for a new post to skip reading its existing links.
+    """
+    wanted = existing_ids(Tags, set(tag_ids))
+    if current is None:
+        current = {tag_id for (tag_id,) in db.session.query(PostTags.tag_id).filter_by(post_id=post_id)}
+
+    added = {tag_id for _, tag_id in link([{'post_id': post_id, 'tag_id': tag_id} for tag_id in wanted - current])}
+    removed = unlink(PostTags.post_id, post_id, PostTags.tag_id, current - wanted)
+
+    return added, removed
+
+
+def set_tag_posts(tag_id, post_ids):
+    """Make tag_id's posts exactly post_ids, returning (added, removed) post ids"""
+    wanted = existing_ids(Post, set(post_ids))
+    current = {post_id for (post_id,) in db.session.query(PostTags.post_id).filter_by(tag_id=tag_id)}
+
+    added = {post_id for post_id, _ in link([{'post_id': post_id, 'tag_id': tag_id} for post_id in wanted - current])}
+    removed = unlink(PostTags.tag_id, tag_id, PostTags.post_id, current - wanted)
+
+    return added, removed
+
+
+def change_tag_posts(tag_id, add_ids, remove_ids):
+    """Add and remove posts on tag_id, returning the (added, removed) post ids that changed.
+
+    Only the links named in the change are read, however many posts the tag has.
+    """
+    remove_ids = set(remove_ids)
+    add_ids = existing_ids(Post, set(add_ids) - remove_ids)
+    if not add_ids and not remove_ids:
+        return set(), set()
+
+    current = {post_id for (post_id,) in
+               db.session.query(PostTags.post_id)
+               .filter(PostTags.tag_id == tag_id, PostTags.post_id.in_(add_ids | remove_ids))}
+
+    added = {post_id for post_id, _ in link([{'post_id': post_id, 'tag_id': tag_id} for post_id in add_ids - current])}
+    removed = unlink(PostTags.tag_id, tag_id, PostTags.post_id, remove_ids & current)
+
+    return added, removed
+
+
+def install_post_tag_key(connection):
+    """Key an existing posttags table on (post_id, tag_id), dropping its old id column and duplicate links"""
+    if 'id' not in {column['name'] for column in inspect(connection).get_columns('posttags')}:
+        return
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('DELETE FROM posttags a USING posttags b '
+                                'WHERE a.post_id = b.post_id AND a.tag_id = b.tag_id AND a.id > b.id'))
+        # Dropping id drops the (id, post_id, tag_id) key with it
+        connection.execute(text('ALTER TABLE posttags DROP COLUMN id'))
+        connection.execute(text('ALTER TABLE posttags ADD PRIMARY KEY (post_id, tag_id)'))
+        return
+
+    # SQLite can't change a table's key in place, so the table is rebuilt
+    connection.execute(text('ALTER TABLE posttags RENAME TO posttags_old'))
+    connection.execute(text('DROP INDEX IF EXISTS ix_posttags_tag_id'))
+    PostTags.__table__.create(connection)
+    connection.execute(text('INSERT INTO posttags (post_id, tag_id) SELECT DISTINCT post_id, tag_id FROM posttags_old'))
+    connection.execute(text('DROP TABLE posttags_old'))
+
@@ -1,20 +1,56 @@
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 from flask import url_for, request
-from models import db, User, Post, Tags, PostTags
-from app import app
-from sqlalchemy.exc import IntegrityError
+from models import db, User, Post, Tags, PostTags, PostViews, DeleteJob, RelatedPost
+from app import create_app
+from bench import seed_corpus, run_benchmark, asgi_caller, compare_async
+from transfer import import_records, write_rows, POST_COLUMNS
+from catalog import bump_version
+from tagging import set_post_tags, change_tag_posts
+from markup import RENDERER_VERSION
+from related import related_posts
+from feeds import place_post
+from pagecache import LRUCache, FileSystemCache
+from PIL import Image
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import IntegrityError, TimeoutError
+from contextlib import contextmanager
+from importlib.util import find_spec
+import asyncio
+import base64
+import json
+import io
+import os
+import tempfile
+import threading
 import time
+from datetime import datetime
 
+app = create_app('testing', {'MEDIA_ROOT': tempfile.mkdtemp()})
 app.app_context().push()
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///blogly_test'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['TESTING'] = True
+page_cache = app.extensions['page_cache']
 
 
 db.drop_all()
 db.create_all()
 
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements this thread issues inside the block, leaving out background workers'"""
+    statements = []
+    thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
 class UserModelTestCase(TestCase):
     """Test User model"""
     def setUp(self):
@@ -60,10 +96,10 @@ class HomepageTestCase(TestCase):
     """Test homepage display"""
     def setUp(self):
         """Clear tables"""
-        User.query.delete()
+        PostTags.query.delete()
         Post.query.delete()
+        User.query.delete()
         Tags.query.delete()
-        PostTags.query.delete()
 
         """Create a user"""
         user = User(first_name='First', last_name='Last')
@@ -133,6 +169,38 @@ class HomepageTestCase(TestCase):
             self.assertIn('Tag5', html)
             self.assertIn('Tag6', html)
 
+    def test_homepage_cursor(self):
+        with app.test_client() as client:
+            resp = client.get("/api/feed")
+            data = resp.get_json()
+
+            """Test that the first page holds the 5 newest posts and a cursor"""
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(data['posts']), 5)
+            self.assertEqual(data['posts'][0]['title'], 'Newest Post')
+            self.assertIsNotNone(data['next'])
+
+            """Test that following the cursor pages back to the oldest post"""
+            resp = client.get(f"/?before={ data['next'] }")
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('Oldest Post', html)
+            self.assertNotIn('Newest Post', html)
+            self.assertNotIn('Older Posts', html)
+
+    def test_homepage_bad_cursor(self):
+        with app.test_client() as client:
+            resp = client.get("/?before=not-a-cursor")
+
+            self.assertEqual(resp.status_code, 400)
+
+            """Test that well-formed cursors holding the wrong types are rejected too"""
+            for values in [['x', 1], [{'dt': '2020-01-01T00:00:00'}, 'x'], [{'dt': '2020-01-01T00:00:00'}, 2 ** 70],
+                           [{'dt': '2020-01-01T00:00:00'}, True], [{'dt': '2020-01-01T00:00:00'}]]:
+                cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+                self.assertEqual(client.get(f'/?before={ cursor }').status_code, 400, values)
+
 
 
 
@@ -140,10 +208,10 @@ class EditTagTestCase(TestCase):
     """Test homepage display"""
     def setUp(self):
         """Clear tables"""
+        PostTags.query.delete()
         Post.query.delete()
         User.query.delete()
         Tags.query.delete()
-        PostTags.query.delete()
 
     def tearDown(self):
         """Clear bad transactions"""
@@ -183,8 +251,8 @@ class EditPostTestCase(TestCase):
     def setUp(self):
         """Clear tables"""
         PostTags.query.delete()
-        User.query.delete()
         Post.query.delete()
+        User.query.delete()
         Tags.query.delete()
 
     def tearDown(self):
@@ -231,8 +299,8 @@ class EditUserTestCase(TestCase):
     def setUp(self):
         """Clear tables"""
         PostTags.query.delete()
-        User.query.delete()
         Post.query.delete()
+        User.query.delete()
         Tags.query.delete()
 
     def tearDown(self):
@@ -271,4 +339,1830 @@ class EditUserTestCase(TestCase):
             self.assertNotIn('First', html)
             self.assertNotIn('Last', html)
             self.assertIn('EditedName', html)
-            self.assertIn('UserName', html)
\ No newline at end of file
+            self.assertIn('UserName', html)
+
+
+class QueryBudgetTestCase(TestCase):
+    """Test that read routes load their object graph in a fixed number of queries"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        """Create users, each with tagged posts"""
+        users = [User(first_name=f'First{i}', last_name=f'Last{i}') for i in range(3)]
+        tags = [Tags(name=f'Tag{i}') for i in range(4)]
+        db.session.add_all(users + tags)
+        db.session.commit()
+
+        for user in users:
+            for i in range(3):
+                db.session.add(Post(title=f'Post {i}', content='Content', posted_by=user.id, tags=tags[i:]))
+        db.session.commit()
+
+        self.user_id = users[0].id
+        self.post_id = users[0].posts[0].id
+        self.tag_id = tags[-1].id
+
+        """Start every request with an empty identity map"""
+        db.session.expunge_all()
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def assert_query_budget(self, url, budget, conditional=False):
+        """Pages that serve ETag/Last-Modified first run up to 2 cheap validator queries for conditional GET"""
+        if conditional:
+            budget += 2
+
+        with app.test_client() as client:
+            with count_queries() as statements:
+                resp = client.get(url)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertLessEqual(len(statements), budget, statements)
+
+    def test_homepage_budget(self):
+        self.assert_query_budget('/', 2, conditional=True)
+
+    def test_show_user_budget(self):
+        self.assert_query_budget(f'/users/{ self.user_id }', 2, conditional=True)
+
+    def test_show_post_budget(self):
+        self.assert_query_budget(f'/posts/{ self.post_id }', 2, conditional=True)
+
+    def test_show_tag_budget(self):
+        self.assert_query_budget(f'/tags/{ self.tag_id }', 2, conditional=True)
+
+    def test_edit_post_budget(self):
+        # Each worker reads the tag catalogue once; after that a form costs one lookup of its version
+        app.test_client().get(f'/posts/{ self.post_id }/edit')
+        db.session.expunge_all()
+        self.assert_query_budget(f'/posts/{ self.post_id }/edit', 3)
+
+
+class ProfilePicTestCase(TestCase):
+    """Test profile pictures are kept in the image store"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def make_png(self, size=(400, 300)):
+        buf = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buf, format='PNG')
+        return buf.getvalue()
+
+    def test_data_uri_stored_by_hash(self):
+        data_uri = 'data:image/png;base64,' + base64.b64encode(self.make_png()).decode()
+
+        with app.test_client() as client:
+            resp = client.post('/users/new', data={'first_name': 'Pic', 'last_name': 'User',
+                                                   'profile_pic': data_uri})
+            self.assertEqual(resp.status_code, 302)
+
+            """Test that the column holds a short reference, not the image"""
+            user = User.query.filter_by(first_name='Pic').one()
+            self.assertTrue(user.profile_pic.startswith('media:'))
+            digest = user.profile_pic[len('media:'):]
+
+            """Test that the original is served with long-lived cache headers"""
+            resp = client.get(f'/media/{ digest }')
+            etag = resp.headers['ETag']
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.mimetype, 'image/png')
+            self.assertIn('immutable', resp.headers['Cache-Control'])
+            self.assertEqual(Image.open(io.BytesIO(resp.data)).size, (400, 300))
+
+            """Test that thumbnails are pre-generated"""
+            resp = client.get(f'/media/{ digest }?size=64')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(Image.open(io.BytesIO(resp.data)).size, (64, 48))
+
+            """Test that revalidation gets a 304"""
+            resp = client.get(f'/media/{ digest }', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 304)
+
+    def test_upload_profile_pic(self):
+        with app.test_client() as client:
+            resp = client.post('/users/new', data={'first_name': 'Up', 'last_name': 'Load', 'profile_pic': '',
+                                                   'profile_pic_file': (io.BytesIO(self.make_png()), 'pic.png')},
+                               content_type='multipart/form-data')
+            self.assertEqual(resp.status_code, 302)
+
+            user = User.query.filter_by(first_name='Up').one()
+            self.assertTrue(user.profile_pic.startswith('media:'))
+
+    def test_rejects_unusable_urls(self):
+        with app.test_client() as client:
+            resp = client.post('/users/new', data={'first_name': 'Long', 'last_name': 'Url',
+                                                   'profile_pic': 'https://example.com/' + 'a' * 500},
+                               follow_redirects=True)
+            self.assertIn('Image URL is longer than 500 characters', resp.get_data(as_text=True))
+            self.assertIsNone(User.query.filter_by(first_name='Long').first())
+
+            client.post('/users/new', data={'first_name': 'Kept', 'last_name': 'Url',
+                                            'profile_pic': 'https://example.com/pic.png'})
+            user = User.query.filter_by(first_name='Kept').one()
+            resp = client.post(f'/users/{ user.id }/edit', data={'first_name': '', 'last_name': '',
+                                                                'profile_pic': 'javascript:alert(1)'},
+                               follow_redirects=True)
+            self.assertIn('Image URL must start with http:// or https://', resp.get_data(as_text=True))
+            db.session.expire_all()
+            self.assertEqual(db.session.get(User, user.id).profile_pic, 'https://example.com/pic.png')
+
+    def test_unknown_media(self):
+        with app.test_client() as client:
+            self.assertEqual(client.get('/media/' + '0' * 64).status_code, 404)
+            self.assertEqual(client.get('/media/not-a-digest').status_code, 404)
+
+
+class UsersDirectoryTestCase(TestCase):
+    """Test the paginated users directory"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        """Create users out of name order, two sharing a last name"""
+        db.session.add_all([User(first_name='Cat', last_name='Zed'),
+                            User(first_name='Bea', last_name='Able'),
+                            User(first_name='Al', last_name='Able'),
+                            User(first_name='Dee', last_name='Mid'),
+                            User(first_name='Eve', last_name='Bee')])
+        db.session.commit()
+        db.session.expunge_all()
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_pages_in_name_order(self):
+        names = []
+        url = '/api/users?per_page=2'
+
+        with app.test_client() as client:
+            while url:
+                with count_queries() as statements:
+                    data = client.get(url).get_json()
+
+                """Test that heavy columns are deferred"""
+                self.assertNotIn('profile_pic', ' '.join(statements))
+                self.assertLessEqual(len(data['users']), 2)
+
+                names.extend(f"{ u['last_name'] } { u['first_name'] }" for u in data['users'])
+                url = f"/api/users?per_page=2&after={ data['next'] }" if data['next'] else None
+
+        self.assertEqual(names, ['Able Al', 'Able Bea', 'Bee Eve', 'Mid Dee', 'Zed Cat'])
+
+    def test_directory_page(self):
+        with app.test_client() as client:
+            resp = client.get('/users?per_page=3')
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('Able, Al', html)
+            self.assertIn('Bee, Eve', html)
+            self.assertNotIn('Mid, Dee', html)
+            self.assertIn('Next Page', html)
+
+
+class UserPostsTestCase(TestCase):
+    """Test the paginated post list on a user's page"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Prolific', last_name='Author')
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_post_count_and_pages(self):
+        with app.test_client() as client:
+            """Create posts through the app so the counter is maintained"""
+            for i in range(5):
+                client.post(f'/users/{ self.user_id }/posts/new', data={'post_title': f'Post number {i}',
+                                                                        'post_content': 'Content'})
+
+            self.assertEqual(User.query.get(self.user_id).post_count, 5)
+
+            resp = client.get(f'/users/{ self.user_id }?per_page=3')
+            html = resp.get_data(as_text=True)
+
+            """Test that the newest posts come first with a link to older ones"""
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('(5)', html)
+            self.assertIn('Post number 4', html)
+            self.assertIn('Post number 2', html)
+            self.assertNotIn('Post number 1', html)
+            self.assertIn('Older Posts', html)
+
+            """Test that ?per_page= is capped by the user posts limit, not the users directory's"""
+            app.config.update(USER_POSTS_MAX_PER_PAGE=2, USERS_MAX_PER_PAGE=10)
+            try:
+                html = client.get(f'/users/{ self.user_id }?per_page=10').get_data(as_text=True)
+            finally:
+                app.config.update(USER_POSTS_MAX_PER_PAGE=100, USERS_MAX_PER_PAGE=200)
+            self.assertIn('Post number 3', html)
+            self.assertNotIn('Post number 2', html)
+
+            """Test that deleting a post decrements the counter"""
+            post = Post.query.filter_by(title='Post number 0').one()
+            client.post(f'/posts/{ post.id }/delete')
+
+            self.assertEqual(User.query.get(self.user_id).post_count, 4)
+
+
+class SearchTestCase(TestCase):
+    """Test full-text post search"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        alice = User(first_name='Alice', last_name='Writer')
+        bob = User(first_name='Bob', last_name='Writer')
+        tag = Tags(name='Gardening')
+        db.session.add_all([alice, bob, tag])
+        db.session.commit()
+
+        db.session.add_all([
+            Post(title='Growing tomatoes', content='Tomatoes need sun and water', posted_by=alice.id, tags=[tag]),
+            Post(title='Weekend notes', content='I ate a tomato sandwich', posted_by=bob.id),
+            Post(title='Cooking pasta', content='Boil the water first', posted_by=bob.id),
+        ])
+        db.session.commit()
+
+        self.alice_id = alice.id
+        self.tag_id = tag.id
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_ranked_search(self):
+        with app.test_client() as client:
+            data = client.get('/api/search?q=tomatoes').get_json()
+            titles = [post['title'] for post in data['posts']]
+
+            """Test that title matches outrank body matches"""
+            self.assertEqual(titles, ['Growing tomatoes', 'Weekend notes'])
+
+    def test_search_filters(self):
+        with app.test_client() as client:
+            data = client.get(f'/api/search?q=water&author={ self.alice_id }').get_json()
+            self.assertEqual([post['title'] for post in data['posts']], ['Growing tomatoes'])
+
+            data = client.get(f'/api/search?q=water&tag={ self.tag_id }').get_json()
+            self.assertEqual([post['title'] for post in data['posts']], ['Growing tomatoes'])
+
+    def test_search_page(self):
+        with app.test_client() as client:
+            resp = client.get('/search?q=pasta')
+            html = resp.get_data(as_text=True)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('Cooking pasta', html)
+            self.assertNotIn('Growing tomatoes', html)
+
+
+class PostCountersTestCase(TestCase):
+    """Test that user and tag post counters follow every write path"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Count', last_name='Me')
+        other = User(first_name='Other', last_name='Writer')
+        tags = [Tags(name='One'), Tags(name='Two'), Tags(name='Three')]
+        db.session.add_all([user, other] + tags)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.other_id = other.id
+        self.tag_ids = [tag.id for tag in tags]
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def counts(self):
+        db.session.expire_all()
+        return ([User.query.get(self.user_id).post_count, User.query.get(self.other_id).post_count],
+                [Tags.query.get(tag_id).post_count for tag_id in self.tag_ids])
+
+    def new_post(self, client, user_id, title, tag_ids):
+        client.post(f'/users/{ user_id }/posts/new', data={'post_title': title, 'post_content': 'Content',
+                                                           'tag-name': tag_ids})
+        return Post.query.filter_by(title=title).one().id
+
+    def test_post_writes(self):
+        one, two, three = self.tag_ids
+
+        with app.test_client() as client:
+            post_id = self.new_post(client, self.user_id, 'First', [one, two])
+            self.new_post(client, self.other_id, 'Second', [two])
+            self.assertEqual(self.counts(), ([1, 1], [1, 2, 0]))
+
+            client.post(f'/posts/{ post_id }/edit', data={'edit_post_title': '', 'edit_post_content': '',
+                                                          'tags': [two, three]})
+            self.assertEqual(self.counts(), ([1, 1], [0, 2, 1]))
+
+            client.post(f'/tags/{ three }/edit', data={'tag_name': 'Three', 'remove_posts': [post_id]})
+            self.assertEqual(self.counts(), ([1, 1], [0, 2, 0]))
+
+            client.post(f'/posts/{ post_id }/delete')
+            self.assertEqual(self.counts(), ([0, 1], [0, 1, 0]))
+
+    def test_cascading_deletes(self):
+        one, two, three = self.tag_ids
+
+        with app.test_client() as client:
+            self.new_post(client, self.user_id, 'First', [one, two])
+            self.new_post(client, self.other_id, 'Second', [two, three])
+
+            client.post(f'/users/{ self.user_id }/delete')
+            self.assertEqual(Tags.query.get(one).post_count, 0)
+            self.assertEqual(Tags.query.get(two).post_count, 1)
+
+            """Deleting a tag deletes its posts"""
+            client.post(f'/tags/{ three }/delete')
+            self.assertEqual(User.query.get(self.other_id).post_count, 0)
+            self.assertEqual(Tags.query.get(two).post_count, 0)
+
+    def test_recount_command(self):
+        one, two, three = self.tag_ids
+
+        with app.test_client() as client:
+            self.new_post(client, self.user_id, 'First', [one])
+
+        User.query.update({User.post_count: 99})
+        Tags.query.update({Tags.post_count: 99})
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['blogly', 'recount'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(self.counts(), ([1, 0], [1, 0, 0]))
+
+
+class PostTagWritesTestCase(TestCase):
+    """Test post/tag links are written as set-based diffs"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Tag', last_name='Writer')
+        tags = [Tags(name=f'Tag{i}') for i in range(4)]
+        db.session.add_all([user] + tags)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.tag_ids = [tag.id for tag in tags]
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def statements_like(self, statements, prefix):
+        return [s for s in statements if s.lstrip().upper().startswith(prefix)]
+
+    def per_link(self, links):
+        return links if db.engine.dialect.name == 'sqlite' else 1
+
+    def test_counts_only_written_links(self):
+        with app.test_client() as client:
+            client.post(f'/users/{ self.user_id }/posts/new', data={'post_title': 'Raced', 'post_content': 'x',
+                                                                    'tag-name': self.tag_ids[:2]})
+        post_id = Post.query.filter_by(title='Raced').one().id
+
+        """Test that links another edit already wrote or removed aren't counted again"""
+        added, removed = set_post_tags(post_id, self.tag_ids[1:3], current={self.tag_ids[0]})
+        self.assertEqual(added, {self.tag_ids[2]})
+        self.assertEqual(removed, {self.tag_ids[0]})
+
+        added, removed = set_post_tags(post_id, self.tag_ids[1:3], current={self.tag_ids[0]})
+        self.assertEqual((added, removed), (set(), set()))
+
+        added, removed = change_tag_posts(self.tag_ids[3], [post_id], [])
+        self.assertEqual(added, {post_id})
+        self.assertEqual(change_tag_posts(self.tag_ids[3], [], [post_id]), (set(), {post_id}))
+        db.session.commit()
+
+    def test_unique_links(self):
+        with app.test_client() as client:
+            client.post(f'/users/{ self.user_id }/posts/new', data={'post_title': 'Linked', 'post_content': 'x',
+                                                                    'tag-name': self.tag_ids[:1]})
+        post = Post.query.filter_by(title='Linked').one()
+
+        db.session.add(PostTags(post_id=post.id, tag_id=self.tag_ids[0]))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
+    def test_bulk_diff(self):
+        with app.test_client() as client:
+            with count_queries() as statements:
+                client.post(f'/users/{ self.user_id }/posts/new', data={'post_title': 'Diffed', 'post_content': 'x',
+                                                                        'tag-name': self.tag_ids[:3]})
+
+            """Test that all links go in with one insert, or one per link on SQLite, which can't return them"""
+            self.assertEqual(len(self.statements_like(statements, 'INSERT INTO POSTTAGS')), self.per_link(3))
+            post_id = Post.query.filter_by(title='Diffed').one().id
+
+            with count_queries() as statements:
+                client.post(f'/posts/{ post_id }/edit', data={'edit_post_title': '', 'edit_post_content': '',
+                                                              'tags': self.tag_ids[1:]})
+
+            """Test that only the difference is written"""
+            self.assertEqual(len(self.statements_like(statements, 'INSERT INTO POSTTAGS')), 1)
+            self.assertEqual(len(self.statements_like(statements, 'DELETE FROM POSTTAGS')), self.per_link(1))
+            self.assertEqual({tag.id for tag in Post.query.get(post_id).tags}, set(self.tag_ids[1:]))
+
+            with count_queries() as statements:
+                client.post(f'/posts/{ post_id }/edit', data={'edit_post_title': '', 'edit_post_content': '',
+                                                              'tags': self.tag_ids[1:]})
+
+            """Test that an unchanged set writes nothing"""
+            self.assertEqual(self.statements_like(statements, 'INSERT INTO POSTTAGS'), [])
+            self.assertEqual(self.statements_like(statements, 'DELETE FROM POSTTAGS'), [])
+
+
+class SchemaUpgradeTestCase(TestCase):
+    """Test upgrade-schema brings tables made by an older Blogly up to date"""
+    def setUp(self):
+        """Clear tables and put back the old posttags key and tag columns"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Old', last_name='Schema')
+        tags = [Tags(name='Old0'), Tags(name='Old1')]
+        db.session.add_all([user, *tags])
+        db.session.commit()
+        post = Post(title='Old Post', content='x', posted_by=user.id)
+        db.session.add(post)
+        db.session.commit()
+        self.user_id, self.post_id = user.id, post.id
+        self.tag_ids = [tag.id for tag in tags]
+        db.session.close()
+
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP TABLE posttags'))
+            connection.execute(text('CREATE TABLE posttags (id INTEGER NOT NULL, '
+                                    'post_id INTEGER NOT NULL REFERENCES posts (id), '
+                                    'tag_id INTEGER NOT NULL REFERENCES tags (id), PRIMARY KEY (id, post_id, tag_id))'))
+            connection.execute(text('INSERT INTO posttags (id, post_id, tag_id) VALUES (:id, :post_id, :tag_id)'),
+                               [{'id': 1, 'post_id': post.id, 'tag_id': self.tag_ids[0]},
+                                {'id': 2, 'post_id': post.id, 'tag_id': self.tag_ids[0]},
+                                {'id': 3, 'post_id': post.id, 'tag_id': self.tag_ids[1]}])
+            connection.execute(text('ALTER TABLE tags DROP COLUMN post_count'))
+            connection.execute(text('ALTER TABLE tags DROP COLUMN updated_at'))
+
+    def tearDown(self):
+        """Clear bad transactions and recreate posttags with its cascading keys"""
+        db.session.rollback()
+        db.session.close()
+        with db.engine.begin() as connection:
+            PostTags.__table__.drop(connection)
+            PostTags.__table__.create(connection)
+
+    def test_upgrade_schema(self):
+        result = app.test_cli_runner().invoke(args=['blogly', 'upgrade-schema'])
+        self.assertIn('Schema upgraded', result.output)
+
+        with db.engine.connect() as connection:
+            key = inspect(connection).get_pk_constraint('posttags')['constrained_columns']
+        self.assertEqual(sorted(key), ['post_id', 'tag_id'])
+        self.assertEqual(PostTags.query.count(), 2)
+        self.assertEqual(db.session.get(Tags, self.tag_ids[0]).post_count, 1)
+
+        """Test that link writes work against the new key"""
+        with app.test_client() as client:
+            resp = client.post(f'/users/{ self.user_id }/posts/new',
+                               data={'post_title': 'New Post', 'post_content': 'x', 'tag-name': self.tag_ids})
+            self.assertEqual(resp.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Tags, self.tag_ids[0]).post_count, 2)
+
+        result = app.test_cli_runner().invoke(args=['blogly', 'upgrade-schema'])
+        self.assertIn('Schema upgraded', result.output)
+
+
+class PostLookupTestCase(TestCase):
+    """Test the typeahead post lookup and incremental tag edits"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Look', last_name='Up')
+        tag = Tags(name='Picked')
+        db.session.add_all([user, tag])
+        db.session.commit()
+
+        posts = [Post(title=f'Apple pie {i}', content='x', posted_by=user.id) for i in range(15)]
+        posts += [Post(title='apricot jam', content='x', posted_by=user.id),
+                  Post(title='100% juice', content='x', posted_by=user.id),
+                  Post(title='Banana bread', content='x', posted_by=user.id)]
+        db.session.add_all(posts)
+        db.session.commit()
+
+        self.tag_id = tag.id
+        self.post_ids = {post.title: post.id for post in posts}
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def lookup(self, client, q):
+        return [post['title'] for post in client.get('/api/posts/lookup', query_string={'q': q}).get_json()['posts']]
+
+    def test_lookup(self):
+        with app.test_client() as client:
+            """Test that matches are case-insensitive prefixes, bounded in number"""
+            titles = self.lookup(client, 'AP')
+            self.assertEqual(len(titles), 10)
+            self.assertTrue(all(title.lower().startswith('ap') for title in titles))
+
+            self.assertEqual(self.lookup(client, 'apr'), ['apricot jam'])
+            self.assertEqual(self.lookup(client, '100%'), ['100% juice'])
+            self.assertEqual(self.lookup(client, '%'), [])
+            self.assertEqual(self.lookup(client, ''), [])
+
+    def test_incremental_tag_edit(self):
+        apricot, banana = self.post_ids['apricot jam'], self.post_ids['Banana bread']
+
+        with app.test_client() as client:
+            client.post(f'/tags/{ self.tag_id }/edit', data={'tag_name': 'Picked', 'add_posts': [apricot, banana]})
+            self.assertEqual({post.id for post in Tags.query.get(self.tag_id).posts}, {apricot, banana})
+
+            client.post(f'/tags/{ self.tag_id }/edit', data={'tag_name': 'Picked', 'remove_posts': [apricot]})
+            db.session.expire_all()
+            tag = Tags.query.get(self.tag_id)
+            self.assertEqual([post.id for post in tag.posts], [banana])
+            self.assertEqual(tag.post_count, 1)
+
+            """Test that the edit page lists only tagged posts"""
+            html = client.get(f'/tags/{ self.tag_id }/edit').get_data(as_text=True)
+            self.assertIn('Banana bread', html)
+            self.assertNotIn('Apple pie', html)
+
+
+class PageCacheTestCase(TestCase):
+    """Test rendered pages are cached and invalidated by writes"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Cached', last_name='Author')
+        tag = Tags(name='CachedTag')
+        db.session.add_all([user, tag])
+        db.session.commit()
+
+        post = Post(title='Cached Post', content='Content', posted_by=user.id, tags=[tag])
+        db.session.add(post)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.tag_id = tag.id
+        self.post_id = post.id
+
+        page_cache.backend = LRUCache(1024 * 1024)
+        page_cache.hits = page_cache.misses = 0
+
+    def tearDown(self):
+        """Clear bad transactions and turn the cache back off"""
+        db.session.rollback()
+        page_cache.backend = None
+
+    def test_hit_skips_queries(self):
+        with app.test_client() as client:
+            first = client.get(f'/posts/{ self.post_id }').get_data(as_text=True)
+            with count_queries() as statements:
+                second = client.get(f'/posts/{ self.post_id }').get_data(as_text=True)
+
+            """Test that a hit runs only the conditional GET validator queries"""
+            self.assertEqual(first, second)
+            self.assertLessEqual(len(statements), 2)
+            self.assertNotIn('posts.title', ' '.join(statements))
+            self.assertEqual(client.get('/api/cache/stats').get_json(), {'hits': 1, 'misses': 1})
+
+    def test_write_during_render_not_cached(self):
+        def write_after_read(conn, cursor, statement, parameters, context, executemany):
+            """Write between reading the posts and the next query, once the posts cursor is done"""
+            if read == ['posts']:
+                read.append('written')
+                with db.engine.begin() as other:
+                    other.execute(text('UPDATE posts SET title = :title WHERE id = :id'),
+                                  {'title': 'Rewritten', 'id': self.post_id})
+                page_cache.invalidate(f'post:{ self.post_id }')
+            elif 'posts.title' in statement and not read:
+                read.append('posts')
+
+        read = []
+        event.listen(db.engine, 'before_cursor_execute', write_after_read)
+        try:
+            with app.test_client() as client:
+                """Test that a page read before a write isn't cached under the write's token"""
+                self.assertNotIn('Rewritten', client.get('/').get_data(as_text=True))
+                self.assertIn('Rewritten', client.get('/').get_data(as_text=True))
+                self.assertIn('Rewritten', client.get('/').get_data(as_text=True))
+                self.assertEqual(client.get('/api/cache/stats').get_json(), {'hits': 1, 'misses': 2})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', write_after_read)
+
+    def test_write_invalidates_dependent_pages(self):
+        with app.test_client() as client:
+            for url in ['/', f'/posts/{ self.post_id }', f'/tags/{ self.tag_id }', f'/users/{ self.user_id }']:
+                client.get(url)
+
+            """Test that renaming the author expires every page showing them"""
+            client.post(f'/users/{ self.user_id }/edit', data={'first_name': 'Renamed', 'last_name': ''})
+            for url in ['/', f'/posts/{ self.post_id }', f'/tags/{ self.tag_id }', f'/users/{ self.user_id }']:
+                self.assertIn('Renamed', client.get(url).get_data(as_text=True), url)
+
+            """Test that a new post expires the feed"""
+            client.post(f'/users/{ self.user_id }/posts/new', data={'post_title': 'Fresh Post', 'post_content': 'x'})
+            self.assertIn('Fresh Post', client.get('/').get_data(as_text=True))
+
+            """Test that renaming the tag expires the post page but not unrelated pages"""
+            client.get(f'/users/{ self.user_id }')
+            hits = page_cache.hits
+            client.post(f'/tags/{ self.tag_id }/edit', data={'tag_name': 'RenamedTag'})
+            self.assertIn('RenamedTag', client.get(f'/posts/{ self.post_id }').get_data(as_text=True))
+            client.get(f'/users/{ self.user_id }')
+            self.assertEqual(page_cache.hits, hits + 1)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_bytes=100)
+        cache.set('a', 'x' * 40)
+        cache.set('b', 'x' * 40)
+        cache.get('a')
+        cache.set('c', 'x' * 40)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertLessEqual(cache.size, 100)
+
+    def test_filesystem_eviction(self):
+        root = tempfile.mkdtemp()
+        cache = FileSystemCache(root, max_bytes=230)
+        # Recency goes by file mtimes, which can be coarser than back-to-back calls
+        cache.set('a', 'x' * 78)
+        time.sleep(0.02)
+        cache.set('b', 'x' * 78)
+        time.sleep(0.02)
+        cache.get('a')
+        time.sleep(0.02)
+        cache.set('c', 'x' * 78)
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(FileSystemCache(root, max_bytes=230).size, 160)
+
+    def test_unread_query_args_share_page(self):
+        with app.test_client() as client:
+            client.get(f'/posts/{ self.post_id }?x=1')
+            client.get(f'/posts/{ self.post_id }?x=2')
+            self.assertEqual(client.get('/api/cache/stats').get_json(), {'hits': 1, 'misses': 1})
+
+            """Test that the query args a view reads still get their own pages"""
+            client.get(f'/users/{ self.user_id }?per_page=1')
+            client.get(f'/users/{ self.user_id }?per_page=2&x=1')
+            self.assertEqual(client.get('/api/cache/stats').get_json(), {'hits': 1, 'misses': 3})
+
+    def test_filesystem_backend(self):
+        page_cache.backend = FileSystemCache(tempfile.mkdtemp(), 1024 * 1024)
+
+        with app.test_client() as client:
+            client.get(f'/posts/{ self.post_id }')
+            client.get(f'/posts/{ self.post_id }')
+            self.assertEqual(page_cache.hits, 1)
+
+            client.post(f'/posts/{ self.post_id }/edit', data={'edit_post_title': 'Edited Cached', 'edit_post_content': ''})
+            self.assertIn('Edited Cached', client.get(f'/posts/{ self.post_id }').get_data(as_text=True))
+
+
+class ConditionalGetTestCase(TestCase):
+    """Test ETag / Last-Modified revalidation of read pages"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Etag', last_name='Author')
+        tag = Tags(name='EtagTag')
+        db.session.add_all([user, tag])
+        db.session.commit()
+
+        post = Post(title='Etag Post', content='Content', posted_by=user.id, tags=[tag])
+        db.session.add(post)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.tag_id = tag.id
+        self.post_id = post.id
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_not_modified(self):
+        with app.test_client() as client:
+            for url in ['/', f'/posts/{ self.post_id }', f'/users/{ self.user_id }', f'/tags/{ self.tag_id }']:
+                resp = client.get(url)
+                self.assertEqual(resp.status_code, 200)
+                self.assertIsNotNone(resp.headers.get('ETag'), url)
+                self.assertIsNotNone(resp.headers.get('Last-Modified'), url)
+
+                """Test that revalidation returns 304 without rendering"""
+                with count_queries() as statements:
+                    again = client.get(url, headers={'If-None-Match': resp.headers['ETag']})
+                self.assertEqual(again.status_code, 304, url)
+                self.assertEqual(again.data, b'')
+                self.assertLessEqual(len(statements), 2)
+
+                again = client.get(url, headers={'If-Modified-Since': resp.headers['Last-Modified']})
+                self.assertEqual(again.status_code, 304, url)
+
+    def test_writes_change_validators(self):
+        with app.test_client() as client:
+            etags = {url: client.get(url).headers['ETag']
+                     for url in ['/', f'/posts/{ self.post_id }', f'/users/{ self.user_id }', f'/tags/{ self.tag_id }']}
+
+            """Test that renaming the tag changes the pages showing it"""
+            time.sleep(0.01)
+            client.post(f'/tags/{ self.tag_id }/edit', data={'tag_name': 'RenamedEtag'})
+            for url in ['/', f'/posts/{ self.post_id }', f'/tags/{ self.tag_id }']:
+                resp = client.get(url, headers={'If-None-Match': etags[url]})
+                self.assertEqual(resp.status_code, 200, url)
+                self.assertIn('RenamedEtag', resp.get_data(as_text=True))
+
+            """Test that the author's page, which doesn't show tags, is unchanged"""
+            resp = client.get(f'/users/{ self.user_id }', headers={'If-None-Match': etags[f'/users/{ self.user_id }']})
+            self.assertEqual(resp.status_code, 304)
+
+            """Test that retagging a post changes its page"""
+            etag = client.get(f'/posts/{ self.post_id }').headers['ETag']
+            client.post(f'/posts/{ self.post_id }/edit', data={'edit_post_title': '', 'edit_post_content': ''})
+            resp = client.get(f'/posts/{ self.post_id }', headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 200)
+
+
+class AppFactoryTestCase(TestCase):
+
+    def test_profiles(self):
+        """Test that production turns off debugging aids and development turns them on"""
+        prod = create_app('production', {'PAGE_CACHE_DIR': tempfile.mkdtemp()})
+        self.assertFalse(prod.debug)
+        self.assertFalse(prod.config['SQLALCHEMY_ECHO'])
+        self.assertNotIn('debugtoolbar', prod.blueprints)
+        self.assertIsInstance(prod.extensions['page_cache'].backend, FileSystemCache)
+
+        dev = create_app('development')
+        self.assertTrue(dev.debug)
+        self.assertIn('debugtoolbar', dev.blueprints)
+
+    def test_overrides(self):
+        """Test that overrides win over the profile and that apps don't share state"""
+        other = create_app('testing', {'FEED_PER_PAGE': 2, 'PAGE_CACHE_BACKEND': 'lru'})
+        self.assertEqual(other.config['FEED_PER_PAGE'], 2)
+        self.assertIsInstance(other.extensions['page_cache'].backend, LRUCache)
+        self.assertIsNone(app.extensions['page_cache'].backend)
+        self.assertIsNot(other.extensions['image_store'], app.extensions['image_store'])
+
+
+class PoolTestCase(TestCase):
+    """Test connection pool settings and metrics"""
+
+    def test_stats(self):
+        """Test that checked-out and idle connections are reported live"""
+        with app.test_client() as client:
+            before = client.get('/api/pool/stats').json
+            self.assertEqual(before['pool'], 'TimedQueuePool')
+
+            with db.engine.connect():
+                during = client.get('/api/pool/stats').json
+            self.assertEqual(during['checked_out'], before['checked_out'] + 1)
+            self.assertGreater(during['checkouts'], before['checkouts'])
+
+            after = client.get('/api/pool/stats').json
+            self.assertEqual(after['checked_out'], before['checked_out'])
+            self.assertGreaterEqual(after['idle'], 1)
+
+    def test_exhaustion(self):
+        """Test that a checkout timing out on a full pool is counted"""
+        small = create_app('testing', {'DB_POOL_SIZE': 1, 'DB_MAX_OVERFLOW': 0, 'DB_POOL_TIMEOUT': 0})
+        with small.app_context():
+            with db.engine.connect():
+                with self.assertRaises(TimeoutError):
+                    db.engine.connect()
+
+            stats = small.test_client().get('/api/pool/stats').json
+            self.assertEqual(stats['timeouts'], 1)
+            self.assertEqual(stats['checked_out'], 0)
+            db.engine.dispose()
+
+    def test_null_pool(self):
+        """Test that PgBouncer mode keeps no idle connections"""
+        bounced = create_app('testing', {'DB_POOL': 'null'})
+        with bounced.app_context():
+            with db.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+
+            stats = bounced.test_client().get('/api/pool/stats').json
+            self.assertEqual(stats['pool'], 'TimedNullPool')
+            self.assertEqual(stats['checkouts'], 1)
+            self.assertEqual(stats['idle'], 0)
+            self.assertEqual(stats['checked_out'], 0)
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Test reads go to a replica except just after the client writes"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+        db.session.add(User(first_name='OnPrimary', last_name='Only'))
+        db.session.commit()
+
+        """Stand in for a lagging replica with a separate database"""
+        replica_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replica.db')
+        self.routed = create_app('testing', {'DATABASE_REPLICA_URLS': [replica_url]})
+        with self.routed.app_context():
+            replica = db.engines['replica0']
+            db.metadata.create_all(replica)
+            with replica.begin() as conn:
+                conn.execute(User.__table__.insert().values(first_name='OnReplica', last_name='Only'))
+
+    def tearDown(self):
+        with self.routed.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    def test_reads_use_replica(self):
+        with self.routed.app_context(), self.routed.test_client() as client:
+            html = client.get('/users').get_data(as_text=True)
+            self.assertIn('OnReplica', html)
+            self.assertNotIn('OnPrimary', html)
+
+            stats = client.get('/api/pool/stats').json
+            self.assertEqual(list(stats['replicas']), ['replica0'])
+
+    def test_writes_stick_to_primary(self):
+        with self.routed.app_context(), self.routed.test_client() as client:
+            resp = client.post('/users/new', data={'first_name': 'JustWritten', 'last_name': 'Only'},
+                               follow_redirects=True)
+            self.assertIn('JustWritten', resp.get_data(as_text=True))
+
+            html = client.get('/users').get_data(as_text=True)
+            self.assertIn('JustWritten', html)
+            self.assertIn('OnPrimary', html)
+
+            """Test that reads return to the replica once the window passes"""
+            with client.session_transaction() as sess:
+                sess['primary_until'] = time.time() - 1
+            html = client.get('/users').get_data(as_text=True)
+            self.assertIn('OnReplica', html)
+            self.assertNotIn('JustWritten', html)
+
+
+    def test_shared_caches_fill_from_primary(self):
+        post = Post(title='Fresh Title', content='x', posted_by=User.query.one().id)
+        db.session.add(post)
+        db.session.commit()
+        cached = create_app('testing', {'DATABASE_REPLICA_URLS': self.routed.config['DATABASE_REPLICA_URLS'],
+                                        'PAGE_CACHE_BACKEND': 'lru'})
+        with cached.app_context():
+            with db.engines['replica0'].begin() as conn:
+                author_id = conn.execute(text("SELECT id FROM users WHERE first_name = 'OnReplica'")).scalar()
+                conn.execute(Post.__table__.insert().values(id=post.id, title='Stale Title', content='x',
+                                                            posted_by=author_id))
+
+            """Test that a replica lagging behind a write can't refill the page and feed caches"""
+            with cached.test_client() as client:
+                for url in [f'/posts/{ post.id }', f'/posts/{ post.id }', '/feed', '/feed']:
+                    html = client.get(url).get_data(as_text=True)
+                    self.assertIn('Fresh Title', html, url)
+                    self.assertNotIn('Stale Title', html, url)
+
+                """Test that uncached pages still read from the replica"""
+                self.assertIn('OnReplica', client.get('/users').get_data(as_text=True))
+
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+class MetricsTestCase(TestCase):
+    """Test per-request instrumentation and the Prometheus endpoint"""
+
+    def test_metrics_endpoint(self):
+        with app.test_client() as client:
+            client.get('/')
+            resp = client.get('/metrics')
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.content_type.startswith('text/plain'))
+            body = resp.get_data(as_text=True)
+            self.assertIn('# TYPE blogly_request_duration_seconds histogram', body)
+            self.assertIn('blogly_request_duration_seconds_bucket{endpoint="blogly.homepage",method="GET",status="200",le="+Inf"}', body)
+
+            statements = [line for line in body.splitlines()
+                          if line.startswith('blogly_sql_statements_total{endpoint="blogly.homepage"}')]
+            self.assertEqual(len(statements), 1)
+            self.assertGreater(float(statements[0].split()[-1]), 0)
+
+    def test_server_timing_and_slow_queries(self):
+        timed = create_app('testing', {'SERVER_TIMING': True, 'SLOW_QUERY_SECONDS': 0})
+        with timed.app_context(), timed.test_client() as client:
+            with self.assertLogs('blogly.slow_queries', 'WARNING'):
+                resp = client.get('/users')
+            timing = resp.headers['Server-Timing']
+            self.assertIn('db;dur=', timing)
+            self.assertIn('tpl;dur=', timing)
+            self.assertIn('total;dur=', timing)
+
+            self.assertNotIn('Server-Timing', app.test_client().get('/users').headers)
+            self.assertIn('blogly_slow_queries_total', client.get('/metrics').get_data(as_text=True))
+
+    def test_failed_statements(self):
+        errors = app.extensions['metrics'].sql_errors
+        before = errors.series.get((), 0)
+        with db.engine.connect() as conn:
+            for _ in range(3):
+                with self.assertRaises(Exception):
+                    conn.execute(text('SELECT * FROM no_such_table'))
+
+            """Test that failed statements are counted and leave no start times behind"""
+            self.assertEqual(conn.info.get('statement_start'), [])
+        self.assertEqual(errors.series[()], before + 3)
+
+
+class BenchmarkTestCase(TestCase):
+    """Test the benchmark harness on a tiny corpus"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+        db.session.commit()
+
+    def test_seed_and_run(self):
+        seed_corpus(users=10, posts=60, tags=5)
+        self.assertEqual(User.query.count(), 10)
+        self.assertEqual(Post.query.count(), 60)
+
+        """Test that counters match the skewed links"""
+        tag = Tags.query.order_by(Tags.id).first()
+        self.assertEqual(tag.post_count, PostTags.query.filter_by(tag_id=tag.id).count())
+
+        timed = create_app('testing', {'SERVER_TIMING': True})
+        report = run_benchmark(timed, requests=4, concurrency=2, warmup=1, writes=True,
+                               routes=['homepage', 'show_post', 'submit_edit_tag'])
+        self.assertEqual(report['dataset'], {'users': 10, 'posts': 60, 'tags': 5})
+        self.assertEqual(set(report['routes']), {'homepage', 'show_post', 'submit_edit_tag'})
+
+        homepage = report['routes']['homepage']
+        self.assertEqual(homepage['requests'], 4)
+        self.assertEqual(homepage['errors'], 0)
+        self.assertLessEqual(homepage['p50_ms'], homepage['p99_ms'])
+        self.assertGreater(homepage['queries_per_request'], 0)
+        self.assertEqual(report['routes']['submit_edit_tag']['errors'], 0)
+
+
+class TransferTestCase(TestCase):
+    """Test streaming export and import"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Dumped', last_name='Author')
+        other = User(first_name='Quiet', last_name='Author', profile_pic='')
+        tags = [Tags(name='DumpOne'), Tags(name='DumpTwo')]
+        db.session.add_all([user, other, *tags])
+        db.session.commit()
+
+        posts = [Post(title='Dumped Post', content='with, "quotes"\nand lines', posted_by=user.id,
+                      posted_at=datetime(2020, 5, 17, 12, 30)),
+                 Post(title='Untagged', content='', posted_by=user.id)]
+        db.session.add_all(posts)
+        db.session.flush()
+        db.session.add_all([PostTags(post_id=posts[0].id, tag_id=tag.id) for tag in tags])
+        db.session.commit()
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def roundtrip(self, filename):
+        path = os.path.join(tempfile.mkdtemp(), filename)
+        result = app.test_cli_runner().invoke(args=['blogly', 'export', path])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['blogly', 'import', path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 2 users, 2 tags and 2 posts', result.output)
+        db.session.expunge_all()
+
+    def check_restored(self):
+        post = Post.query.filter_by(title='Dumped Post').one()
+        self.assertEqual(post.content, 'with, "quotes"\nand lines')
+        self.assertEqual(post.posted_at, datetime(2020, 5, 17, 12, 30))
+        self.assertEqual(post.users.first_name, 'Dumped')
+        self.assertEqual(post.users.post_count, 2)
+        self.assertEqual(sorted(tag.name for tag in post.tags), ['DumpOne', 'DumpTwo'])
+        self.assertEqual([tag.post_count for tag in post.tags], [1, 1])
+        self.assertEqual(Post.query.filter_by(title='Untagged').one().content, '')
+
+    def test_jsonl_roundtrip(self):
+        self.roundtrip('dump.jsonl')
+        self.check_restored()
+
+    def test_csv_roundtrip(self):
+        self.roundtrip('dump.csv')
+        self.check_restored()
+
+    def test_import_remaps_ids_and_merges_tags(self):
+        records = [{'type': 'user', 'id': 7, 'first_name': 'New', 'last_name': 'Person'},
+                   {'type': 'tag', 'id': 1, 'name': 'DumpOne'},
+                   {'type': 'tag', 'id': 2, 'name': 'Brand New'},
+                   {'type': 'post', 'id': 1, 'title': 'Imported', 'content': 'Hi', 'posted_by': 7, 'tags': [1, 2]}]
+        counts, entities = import_records(records)
+        self.assertEqual(counts, {'user': 1, 'tag': 2, 'post': 1})
+
+        post = Post.query.filter_by(title='Imported').one()
+        self.assertEqual(post.users.last_name, 'Person')
+        self.assertEqual(sorted(tag.name for tag in post.tags), ['Brand New', 'DumpOne'])
+        self.assertEqual(Tags.query.filter_by(name='DumpOne').one().post_count, 2)
+        self.assertTrue(post.users.profile_pic.startswith('https://'))
+
+    def test_import_refreshes_merged_tag_pages(self):
+        tag = Tags.query.filter_by(name='DumpOne').one()
+        tag_id, updated_at = tag.id, tag.updated_at
+        path = os.path.join(tempfile.mkdtemp(), 'dump.jsonl')
+        with open(path, 'w') as dump:
+            dump.write('{"type": "user", "id": 1, "first_name": "New", "last_name": "Person"}\n'
+                       '{"type": "tag", "id": 1, "name": "DumpOne"}\n'
+                       '{"type": "post", "id": 1, "title": "Gamma", "content": "Hi", "posted_by": 1, "tags": [1]}\n')
+
+        page_cache.backend = LRUCache(1024 * 1024)
+        try:
+            with app.test_client() as client:
+                self.assertNotIn('Gamma', client.get(f'/tags/{ tag_id }').get_data(as_text=True))
+                result = app.test_cli_runner().invoke(args=['blogly', 'import', path])
+                self.assertEqual(result.exit_code, 0, result.output)
+                self.assertIn('Gamma', client.get(f'/tags/{ tag_id }').get_data(as_text=True))
+        finally:
+            page_cache.backend = None
+
+        db.session.expunge_all()
+        self.assertGreater(Tags.query.get(tag_id).updated_at, updated_at)
+
+    def test_bulk_rows_keep_nulls(self):
+        user_id = User.query.filter_by(first_name='Dumped').one().id
+        post_id = Post.query.order_by(Post.id.desc()).first().id + 1
+        write_rows(Post.__table__, POST_COLUMNS,
+                   [(post_id, 'Bulk', '', '', None, 1, user_id, datetime(2020, 5, 17), datetime(2020, 5, 17))])
+
+        """Test that None is stored as NULL and an empty string as an empty string"""
+        post = Post.query.get(post_id)
+        self.assertIsNone(post.excerpt)
+        self.assertEqual(post.content, '')
+
+    def test_bad_reference(self):
+        records = [{'type': 'post', 'id': 1, 'title': 'Orphan', 'content': 'Hi', 'posted_by': 99}]
+        with self.assertRaisesRegex(ValueError, 'Record 1: refers to a user'):
+            import_records(records)
+        self.assertEqual(Post.query.filter_by(title='Orphan').count(), 0)
+
+
+class CascadingDeleteTestCase(TestCase):
+    """Test deletes cascade in the database and big ones run in the background"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Prolific', last_name='Author')
+        other = User(first_name='Other', last_name='Author')
+        tag = Tags(name='Crowded')
+        db.session.add_all([user, other, tag])
+        db.session.commit()
+        self.user_id, self.other_id, self.tag_id = user.id, other.id, tag.id
+
+        posts = [Post(title=f'Post { i }', content='...', posted_by=user.id) for i in range(20)]
+        posts.append(Post(title='Bystander', content='...', posted_by=other.id))
+        db.session.add_all(posts)
+        db.session.flush()
+        db.session.add_all([PostTags(post_id=post.id, tag_id=tag.id) for post in posts])
+        db.session.commit()
+
+        app.test_cli_runner().invoke(args=['blogly', 'recount'])
+        db.session.expunge_all()
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_delete_user_is_set_based(self):
+        with app.test_client() as client:
+            with count_queries() as statements:
+                client.post(f'/users/{ self.user_id }/delete')
+
+        self.assertLessEqual(len(statements), 6)
+        self.assertIsNone(User.query.get(self.user_id))
+        self.assertEqual(Post.query.count(), 1)
+        self.assertEqual(PostTags.query.count(), 1)
+        self.assertEqual(Tags.query.get(self.tag_id).post_count, 1)
+
+    def test_background_delete(self):
+        background = create_app('testing', {'DELETE_BACKGROUND_POSTS': 5, 'DELETE_BATCH': 3})
+        with background.app_context(), background.test_client() as client:
+            resp = client.post(f'/users/{ self.user_id }/delete', follow_redirects=True)
+            self.assertIn('being deleted in the background', resp.get_data(as_text=True))
+
+            background.extensions['delete_worker'].submit(lambda: None).result()
+            job = DeleteJob.query.one()
+            status = client.get(f'/api/deletes/{ job.id }').json
+            self.assertEqual(status['status'], 'done')
+            self.assertEqual(status['kind'], 'user')
+
+            self.assertIsNone(User.query.get(self.user_id))
+            self.assertEqual(Post.query.count(), 1)
+            self.assertEqual(Tags.query.get(self.tag_id).post_count, 1)
+
+            """Test that a small tag is still deleted in the request, taking its posts"""
+            client.post(f'/tags/{ self.tag_id }/delete')
+            self.assertEqual(Post.query.count(), 0)
+            self.assertEqual(User.query.get(self.other_id).post_count, 0)
+            self.assertEqual(DeleteJob.query.count(), 1)
+            DeleteJob.query.delete()
+            db.session.commit()
+
+
+class JSONAPITestCase(TestCase):
+    """Test the versioned JSON API"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Api', last_name='Author')
+        tag = Tags(name='ApiTag')
+        db.session.add_all([user, tag])
+        db.session.commit()
+
+        posts = [Post(title=f'Api Post { i }', content='x' * 1000, posted_by=user.id) for i in range(5)]
+        db.session.add_all(posts)
+        db.session.flush()
+        db.session.add(PostTags(post_id=posts[0].id, tag_id=tag.id))
+        db.session.commit()
+        self.user_id, self.tag_id = user.id, tag.id
+        self.post_ids = [post.id for post in posts]
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_batched_ids(self):
+        first, second = self.post_ids[:2]
+        with app.test_client() as client:
+            with count_queries() as statements:
+                resp = client.get(f'/api/v1/posts?ids={ second },{ first },999999&fields=title,tags')
+            body = resp.json
+
+        self.assertEqual([post['id'] for post in body['data']], [second, first])
+        self.assertEqual(body['missing'], [999999])
+        self.assertEqual(set(body['data'][0]), {'id', 'title', 'tags'})
+        self.assertEqual(body['data'][1]['tags'], [self.tag_id])
+        self.assertEqual(len([s for s in statements if 'posttags' not in s]), 1)
+        self.assertEqual(len(statements), 2)
+
+    def test_sparse_fields_and_pages(self):
+        with app.test_client() as client:
+            body = client.get(f'/api/v1/users?ids={ self.user_id }&fields=first_name').json
+            self.assertEqual(body['data'], [{'id': self.user_id, 'first_name': 'Api'}])
+
+            page = client.get('/api/v1/posts?per_page=3&fields=title').json
+            self.assertEqual([post['id'] for post in page['data']], self.post_ids[:3])
+            page = client.get(f'/api/v1/posts?per_page=3&fields=title&after={ page["next"] }').json
+            self.assertEqual([post['id'] for post in page['data']], self.post_ids[3:])
+            self.assertIsNone(page['next'])
+
+            tags = client.get('/api/v1/tags').json['data']
+            self.assertEqual(tags[0]['name'], 'ApiTag')
+            self.assertEqual(set(tags[0]), {'id', 'name', 'post_count', 'updated_at'})
+            datetime.fromisoformat(tags[0]['updated_at'])
+
+    def test_errors_are_json(self):
+        with app.test_client() as client:
+            resp = client.get('/api/v1/users?fields=password')
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('password', resp.json['error'])
+
+            resp = client.get('/api/v1/posts?ids=1,two')
+            self.assertEqual(resp.status_code, 400)
+
+            ids = ','.join(str(i) for i in range(app.config['API_MAX_IDS'] + 1))
+            self.assertEqual(client.get(f'/api/v1/tags?ids={ ids }').status_code, 400)
+
+    def test_stream(self):
+        with app.test_client() as client:
+            resp = client.get(f'/api/v1/posts/stream?fields=title,tags&after_id={ self.post_ids[0] }')
+            self.assertEqual(resp.mimetype, 'application/x-ndjson')
+            self.assertTrue(resp.is_streamed)
+            records = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+        self.assertEqual([record['id'] for record in records], self.post_ids[1:])
+        self.assertEqual(records[0], {'id': self.post_ids[1], 'title': 'Api Post 1', 'tags': []})
+
+
+class FeedTestCase(TestCase):
+    """Test Atom/RSS feeds are built once and kept up to date by post writes"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Feed', last_name='Author')
+        tag = Tags(name='FeedTag')
+        db.session.add_all([user, tag])
+        db.session.commit()
+
+        posts = [Post(title=f'Feed Post { i }', content='Body', posted_by=user.id,
+                      posted_at=datetime(2020, 1, i + 1), tags=[tag] if i % 2 == 0 else [])
+                 for i in range(4)]
+        db.session.add_all(posts)
+        db.session.commit()
+        self.user_id, self.tag_id = user.id, tag.id
+        self.post_ids = [post.id for post in posts]
+
+        self.entries = app.config['FEED_ENTRIES']
+        app.config['FEED_ENTRIES'] = 3
+        page_cache.backend = LRUCache(1024 * 1024)
+
+    def tearDown(self):
+        """Clear bad transactions and turn the cache back off"""
+        db.session.rollback()
+        app.config['FEED_ENTRIES'] = self.entries
+        page_cache.backend = None
+
+    def test_feeds(self):
+        with app.test_client() as client:
+            resp = client.get('/feed')
+            self.assertEqual(resp.mimetype, 'application/atom+xml')
+            body = resp.get_data(as_text=True)
+            self.assertEqual([f'Feed Post { i }' in body for i in range(4)], [False, True, True, True])
+
+            resp = client.get(f'/tags/{ self.tag_id }/feed?format=rss')
+            self.assertEqual(resp.mimetype, 'application/rss+xml')
+            body = resp.get_data(as_text=True)
+            self.assertIn('<title>Posts tagged FeedTag</title>', body)
+            self.assertIn('Feed Post 2', body)
+            self.assertNotIn('Feed Post 1', body)
+            self.assertIn('Wed, 01 Jan 2020 00:00:00 +0000', body)
+
+            self.assertIn('Posts by Feed Author', client.get(f'/users/{ self.user_id }/feed').get_data(as_text=True))
+            self.assertEqual(client.get('/users/999999/feed').status_code, 404)
+            self.assertEqual(client.get('/feed?format=json').status_code, 404)
+
+    def test_revalidation(self):
+        with app.test_client() as client:
+            resp = client.get('/feed')
+            etag = resp.headers['ETag']
+
+            with count_queries() as statements:
+                again = client.get('/feed', headers={'If-None-Match': etag})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(statements, [])
+
+            rss = client.get('/feed?format=rss')
+            self.assertNotEqual(rss.headers['ETag'], etag)
+
+    def test_post_writes_update_cached_feeds(self):
+        with app.test_client() as client:
+            for url in ['/feed', f'/users/{ self.user_id }/feed', f'/tags/{ self.tag_id }/feed']:
+                client.get(url)
+
+            """Test that a new post is placed in its feeds without rebuilding them"""
+            client.post(f'/users/{ self.user_id }/posts/new',
+                        data={'post_title': 'Newest', 'post_content': 'x', 'tag-name': [self.tag_id]})
+            with count_queries() as statements:
+                for url in ['/feed', f'/users/{ self.user_id }/feed', f'/tags/{ self.tag_id }/feed']:
+                    body = client.get(url).get_data(as_text=True)
+                    self.assertIn('Newest', body, url)
+                    self.assertNotIn('Feed Post 1', body, url)
+            self.assertEqual(statements, [])
+
+            """Test that an edit replaces the entry and leaves tags it lost"""
+            client.post(f'/posts/{ self.post_ids[2] }/edit',
+                        data={'edit_post_title': 'Edited', 'edit_post_content': '', 'tags': []})
+            self.assertIn('Edited', client.get('/feed').get_data(as_text=True))
+            self.assertNotIn('Edited', client.get(f'/tags/{ self.tag_id }/feed').get_data(as_text=True))
+
+            """Test that deleting a post refills the feed from the database"""
+            client.post(f'/posts/{ self.post_ids[3] }/delete')
+            body = client.get('/feed').get_data(as_text=True)
+            self.assertNotIn('Feed Post 3', body)
+            self.assertIn('Feed Post 1', body)
+
+            """Test that renaming the author rebuilds every feed"""
+            client.post(f'/users/{ self.user_id }/edit', data={'first_name': 'Renamed', 'last_name': ''})
+            self.assertIn('Renamed Author', client.get(f'/tags/{ self.tag_id }/feed').get_data(as_text=True))
+
+    def test_concurrent_writes_all_land(self):
+        class SlowCache(FileSystemCache):
+            """Widens the gap between reading a feed's state and writing it back"""
+            def get(self, key):
+                value = super().get(key)
+                if key.startswith('feed:'):
+                    time.sleep(0.05)
+                return value
+
+        page_cache.backend = SlowCache(tempfile.mkdtemp(), 1024 * 1024)
+        with app.test_client() as client:
+            client.get('/feed')
+
+            posts = [Post(title=f'Racing { i }', content='x', posted_by=self.user_id) for i in range(2)]
+            db.session.add_all(posts)
+            db.session.commit()
+
+            def place(post_id):
+                with app.test_request_context():
+                    place_post(post_id)
+
+            threads = [threading.Thread(target=place, args=(post.id,)) for post in posts]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            with count_queries() as statements:
+                body = client.get('/feed').get_data(as_text=True)
+            self.assertEqual(statements, [])
+            self.assertIn('Racing 0', body)
+            self.assertIn('Racing 1', body)
+
+
+class ViewCounterTestCase(TestCase):
+    """Test post views are tallied in memory and flushed in bulk"""
+    def setUp(self):
+        """Clear tables, dropping views other tests left pending"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+        db.session.commit()
+        self.counter = app.extensions['view_counter']
+        self.counter.flush()
+
+        user = User(first_name='Viewed', last_name='Author')
+        db.session.add(user)
+        db.session.commit()
+
+        posts = [Post(title=f'Viewed Post { i }', content='Body', posted_by=user.id) for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        self.post_ids = [post.id for post in posts]
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def stored_views(self):
+        return dict(db.session.query(PostViews.post_id, PostViews.views))
+
+    def test_views_flush_in_bulk(self):
+        first, second, third = self.post_ids
+        with app.test_client() as client:
+            etag = client.get(f'/posts/{ first }').headers['ETag']
+            self.assertEqual(client.get(f'/posts/{ first }', headers={'If-None-Match': etag}).status_code, 304)
+            client.get(f'/posts/{ first }')
+            client.get(f'/posts/{ second }')
+            client.get('/posts/999999')
+
+            """Test that views wait in memory until flushed"""
+            self.assertEqual(self.stored_views(), {})
+            with count_queries() as statements:
+                self.assertEqual(self.counter.flush(), 2)
+            self.assertEqual(len([s for s in statements if 'post_views' in s]), 1)
+            self.assertEqual(self.stored_views(), {first: 3, second: 1})
+
+            """Test that later flushes add to the stored counts"""
+            client.get(f'/posts/{ second }')
+            client.get(f'/posts/{ second }')
+            client.get(f'/posts/{ second }')
+            self.counter.flush()
+            self.assertEqual(self.stored_views(), {first: 3, second: 4})
+
+            body = client.get('/posts/popular').get_data(as_text=True)
+            self.assertLess(body.index('Viewed Post 1'), body.index('Viewed Post 0'))
+            self.assertIn('4 views', body)
+            self.assertNotIn('Viewed Post 2', body)
+
+    def test_deleted_posts_are_skipped(self):
+        first, second, third = self.post_ids
+        self.counter.record(first)
+        self.counter.record(third)
+        Post.query.filter_by(id=third).delete()
+        db.session.commit()
+
+        self.counter.flush()
+        self.assertEqual(self.stored_views(), {first: 1})
+
+    def test_concurrent_records(self):
+        threads = [threading.Thread(target=lambda: [self.counter.record(post_id)
+                                                    for _ in range(50) for post_id in self.post_ids])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.counter.flush()
+        self.assertEqual(self.stored_views(), {post_id: 400 for post_id in self.post_ids})
+
+
+class TagCatalogTestCase(TestCase):
+    """Test post forms list tags from the cached catalogue"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Form', last_name='Author')
+        tags = [Tags(name='Alpha'), Tags(name='Beta')]
+        db.session.add_all([user, *tags])
+        bump_version('tags')
+        db.session.commit()
+
+        post = Post(title='Form Post', content='Body', posted_by=user.id, tags=[tags[1]])
+        db.session.add(post)
+        db.session.commit()
+        self.user_id, self.post_id = user.id, post.id
+        self.tag_ids = [tag.id for tag in tags]
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_forms_reuse_catalogue(self):
+        with app.test_client() as client:
+            client.get(f'/users/{ self.user_id }/posts/new')
+            with count_queries() as statements:
+                body = client.get(f'/users/{ self.user_id }/posts/new').get_data(as_text=True)
+
+            self.assertNotIn('FROM tags', ' '.join(statements))
+            self.assertIn(f'name="tag-name" id="tag_{ self.tag_ids[0] }" value="{ self.tag_ids[0] }">', body)
+            self.assertIn('<label for="tag_%d">Beta</label>' % self.tag_ids[1], body)
+
+            body = client.get(f'/posts/{ self.post_id }/edit').get_data(as_text=True)
+            self.assertIn(f'name="tags" id="tag_{ self.tag_ids[1] }" value="{ self.tag_ids[1] }" checked>', body)
+            self.assertIn(f'name="tags" id="tag_{ self.tag_ids[0] }" value="{ self.tag_ids[0] }">', body)
+
+    def test_tag_changes_refresh_catalogue(self):
+        with app.test_client() as client:
+            client.get(f'/users/{ self.user_id }/posts/new')
+
+            client.post('/tags/new', data={'tag_name': 'Gamma'})
+            self.assertIn('Gamma', client.get(f'/users/{ self.user_id }/posts/new').get_data(as_text=True))
+
+            client.post(f'/tags/{ self.tag_ids[0] }/edit', data={'tag_name': 'Aleph'})
+            body = client.get(f'/posts/{ self.post_id }/edit').get_data(as_text=True)
+            self.assertIn('Aleph', body)
+            self.assertNotIn('Alpha', body)
+
+            client.post(f'/tags/{ self.tag_ids[1] }/delete')
+            self.assertNotIn('Beta', client.get(f'/users/{ self.user_id }/posts/new').get_data(as_text=True))
+
+            """Test that a bump by another worker is noticed"""
+            db.session.execute(text('UPDATE tags SET name = :name WHERE id = :id'),
+                               {'name': 'Elsewhere', 'id': self.tag_ids[0]})
+            bump_version('tags')
+            db.session.commit()
+            self.assertIn('Elsewhere', client.get(f'/users/{ self.user_id }/posts/new').get_data(as_text=True))
+
+
+ASYNC_DRIVER = 'asyncpg' if db.engine.dialect.name == 'postgresql' else 'aiosqlite'
+
+
+@skipUnless(find_spec('asgiref') and find_spec(ASYNC_DRIVER), f'needs asgiref and {ASYNC_DRIVER}')
+class AsyncReadsTestCase(TestCase):
+    """Test the ASGI entry point's async read pages"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Async', last_name='Author')
+        tag = Tags(name='AsyncTag')
+        db.session.add_all([user, tag])
+        db.session.commit()
+
+        post = Post(title='Async Post', content='Body', posted_by=user.id, tags=[tag])
+        db.session.add(post)
+        db.session.commit()
+        self.user_id, self.tag_id, self.post_id = user.id, tag.id, post.id
+
+        from asgi import AsyncReads
+        self.application = AsyncReads(app)
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def call(self, method, url, data=None):
+        async def main():
+            try:
+                return await asgi_caller(self.application)(method, url, data)
+            finally:
+                await self.application.dispose()
+
+        return asyncio.run(main())
+
+    def test_pages_match_wsgi(self):
+        with app.test_client() as client:
+            for url in ['/', f'/users/{ self.user_id }', f'/posts/{ self.post_id }', f'/tags/{ self.tag_id }']:
+                response = self.call('GET', url)
+                self.assertEqual(response['status'], 200, url)
+                self.assertEqual(response['body'], client.get(url).get_data(), url)
+
+        self.assertEqual(self.call('GET', '/users/999999')['status'], 404)
+        self.assertEqual(self.call('GET', '/?before=garbage')['status'], 400)
+
+        head = self.call('HEAD', f'/posts/{ self.post_id }')
+        self.assertEqual(head['status'], 200)
+        self.assertEqual(head['body'], b'')
+
+    def test_views_and_metrics_recorded(self):
+        view_counter = app.extensions['view_counter']
+        view_counter.flush()
+        latency = app.extensions['metrics'].request_seconds.series
+        labels = (('endpoint', 'blogly.show_post'), ('method', 'GET'), ('status', 200))
+        requests_before = sum(latency.get(labels, ([0], 0))[0])
+
+        self.assertEqual(self.call('GET', f'/posts/{ self.post_id }')['status'], 200)
+        self.assertEqual(self.call('GET', '/posts/999999')['status'], 404)
+        self.assertEqual(view_counter.pending, {self.post_id: 1})
+        view_counter.flush()
+
+        """Test that async pages go through the request hooks that feed /metrics"""
+        self.assertEqual(sum(latency[labels][0]), requests_before + 1)
+
+    def test_other_requests_go_to_wsgi(self):
+        response = self.call('POST', '/tags/new', {'tag_name': 'ViaWsgi'})
+        self.assertEqual(response['status'], 302)
+        self.assertEqual(Tags.query.filter_by(name='ViaWsgi').count(), 1)
+
+        response = self.call('GET', f'/api/v1/users?ids={ self.user_id }')
+        self.assertEqual(json.loads(response['body'])['data'][0]['first_name'], 'Async')
+
+    def test_compare_async(self):
+        report = compare_async(app, self.application, requests=4, concurrency=2, warmup=1,
+                               routes=['show_user', 'show_tag'])
+        self.assertEqual(set(report['routes']), {'show_user', 'show_tag'})
+
+        for modes in report['routes'].values():
+            for mode in ('sync', 'async'):
+                self.assertEqual(modes[mode]['requests'], 4)
+                self.assertEqual(modes[mode]['errors'], 0)
+                self.assertGreater(modes[mode]['memory_per_in_flight_kb'], 0)
+
+
+class MarkdownTestCase(TestCase):
+    """Test post bodies are rendered from Markdown when written"""
+    def setUp(self):
+        """Clear tables"""
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Markdown', last_name='Author')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def test_render_on_write(self):
+        source = ('# Heading\n\nSome **bold** text <script>alert(1)</script> and '
+                  '[a link](javascript:alert(1)) &amp; more. ' + 'word ' * 100)
+        with app.test_client() as client:
+            client.post(f'/users/{ self.user_id }/posts/new', data={'post_title': 'Rich', 'post_content': source})
+            post = Post.query.filter_by(title='Rich').one()
+
+            self.assertEqual(post.content, source)
+            self.assertIn('<h1>Heading</h1>', post.content_html)
+            self.assertIn('<strong>bold</strong>', post.content_html)
+            self.assertNotIn('<script>', post.content_html)
+            self.assertNotIn('javascript:', post.content_html)
+            self.assertTrue(post.excerpt.startswith('Heading Some bold text alert(1) and a link & more. word'))
+            self.assertLessEqual(len(post.excerpt), 203)
+            self.assertTrue(post.excerpt.endswith('word...'))
+
+            self.assertIn('<strong>bold</strong>', client.get(f'/posts/{ post.id }').get_data(as_text=True))
+            self.assertIn('Heading Some bold text', client.get('/').get_data(as_text=True))
+
+            """Test that editing the body renders it again"""
+            client.post(f'/posts/{ post.id }/edit',
+                        data={'edit_post_title': '', 'edit_post_content': '*changed*', 'tags': []})
+            db.session.expire_all()
+            self.assertEqual(db.session.get(Post, post.id).content_html, '<p><em>changed</em></p>')
+            self.assertEqual(db.session.get(Post, post.id).excerpt, 'changed')
+
+    def test_render_command(self):
+        posts = [Post(title=f'Old { i }', content=f'_old { i }_', posted_by=self.user_id) for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        self.assertIsNone(posts[0].content_html)
+        self.assertIn('_old 0_', app.test_client().get(f'/posts/{ posts[0].id }').get_data(as_text=True))
+
+        result = app.test_cli_runner().invoke(args=['blogly', 'render-posts', '--batch', '2'])
+        self.assertIn('Rendered 3 posts', result.output)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Post, posts[2].id).content_html, '<p><em>old 2</em></p>')
+        self.assertEqual(db.session.get(Post, posts[2].id).render_version, RENDERER_VERSION)
+
+        result = app.test_cli_runner().invoke(args=['blogly', 'render-posts'])
+        self.assertIn('Rendered 0 posts', result.output)
+        result = app.test_cli_runner().invoke(args=['blogly', 'render-posts', '--all'])
+        self.assertIn('Rendered 3 posts', result.output)
+
+
+class RelatedPostsTestCase(TestCase):
+    """Test the precomputed related posts"""
+    def setUp(self):
+        """Clear tables"""
+        RelatedPost.query.delete()
+        PostTags.query.delete()
+        Post.query.delete()
+        User.query.delete()
+        Tags.query.delete()
+
+        user = User(first_name='Related', last_name='Author')
+        tags = [Tags(name='Common'), Tags(name='Rare')]
+        db.session.add_all([user, *tags])
+        db.session.commit()
+        self.user_id = user.id
+        self.common_id, self.rare_id = [tag.id for tag in tags]
+
+    def tearDown(self):
+        """Clear bad transactions"""
+        db.session.rollback()
+
+    def settle(self):
+        """Wait for the background list updates queued so far"""
+        app.extensions['related_worker'].submit(lambda: None).result()
+
+    def new_post(self, client, title, tag_ids):
+        client.post(f'/users/{ self.user_id }/posts/new',
+                    data={'post_title': title, 'post_content': 'Body', 'tag-name': tag_ids})
+        self.settle()
+        return Post.query.filter_by(title=title).one().id
+
+    def related_ids(self, post_id):
+        return [row.id for row in related_posts(post_id)]
+
+    def stored_lists(self):
+        return sorted(db.session.query(RelatedPost.post_id, RelatedPost.related_id, RelatedPost.score))
+
+    def test_incremental_updates(self):
+        with app.test_client() as client:
+            first = self.new_post(client, 'First', [self.common_id, self.rare_id])
+            second = self.new_post(client, 'Second', [self.common_id])
+            third = self.new_post(client, 'Third', [self.common_id, self.rare_id])
+            lone = self.new_post(client, 'Lone', [])
+
+            """Test that sharing the rare tag outranks sharing only the common one"""
+            self.assertEqual(self.related_ids(first), [third, second])
+            self.assertEqual(self.related_ids(third), [first, second])
+            self.assertEqual(self.related_ids(second), [third, first])
+            self.assertEqual(self.related_ids(lone), [])
+            body = client.get(f'/posts/{ first }').get_data(as_text=True)
+            self.assertIn(f'<a href="/posts/{ third }">Third</a>', body)
+
+            """Test that editing a post's tags updates its list and the lists it's in"""
+            client.post(f'/posts/{ lone }/edit',
+                        data={'edit_post_title': '', 'edit_post_content': '', 'tags': [self.rare_id]})
+            self.settle()
+            self.assertEqual(self.related_ids(lone), [third, first])
+            self.assertIn(lone, self.related_ids(first))
+            self.assertIn(f'<a href="/posts/{ lone }">Lone</a>', client.get(f'/posts/{ first }').get_data(as_text=True))
+
+            """Test that taking posts out of a tag drops them from each other's lists"""
+            client.post(f'/tags/{ self.rare_id }/edit', data={'tag_name': 'Rare', 'remove_posts': [lone]})
+            self.settle()
+            self.assertEqual(self.related_ids(lone), [])
+            self.assertNotIn(lone, self.related_ids(first))
+            self.assertNotIn(f'/posts/{ lone }"', client.get(f'/posts/{ first }').get_data(as_text=True))
+
+    def test_lists_keep_top_scores(self):
+        with app.test_client() as client:
+            """Test that lists left to the background worker come out the same"""
+            app.config.update(RELATED_POSTS=2, RELATED_SYNC_POSTS=0)
+            try:
+                post_ids = [self.new_post(client, f'Post { i }', [self.common_id]) for i in range(4)]
+                self.assertEqual(self.related_ids(post_ids[0]), [post_ids[3], post_ids[2]])
+
+                closest = self.new_post(client, 'Closest', [self.common_id, self.rare_id])
+                client.post(f'/tags/{ self.rare_id }/edit',
+                            data={'tag_name': 'Rare', 'add_posts': [post_ids[0], post_ids[1]]})
+                self.settle()
+                self.assertEqual(self.related_ids(post_ids[0]), [closest, post_ids[1]])
+                self.assertEqual(self.related_ids(closest), [post_ids[1], post_ids[0]])
+                self.assertEqual(self.related_ids(post_ids[3]), [closest, post_ids[2]])
+            finally:
+                app.config.update(RELATED_POSTS=5, RELATED_SYNC_POSTS=20)
+
+    def test_common_tags_ignored(self):
+        with app.test_client() as client:
+            app.config['RELATED_MAX_TAG_POSTS'] = 2
+            try:
+                post_ids = [self.new_post(client, f'Post { i }', [self.common_id]) for i in range(2)]
+                self.assertEqual(self.related_ids(post_ids[0]), [post_ids[1]])
+
+                """Test that a tag on more posts than the cutoff stops relating them"""
+                crowded = self.new_post(client, 'Crowded', [self.common_id, self.rare_id])
+                self.assertEqual(self.related_ids(crowded), [])
+
+                app.test_cli_runner().invoke(args=['blogly', 'rebuild-related'])
+                self.assertEqual(self.related_ids(post_ids[0]), [])
+            finally:
+                app.config['RELATED_MAX_TAG_POSTS'] = 1000
+
+    def test_rebuild_command(self):
+        with app.test_client() as client:
+            post_ids = [self.new_post(client, f'Post { i }', [self.common_id, self.rare_id][:1 + i % 2])
+                        for i in range(6)]
+        incremental = self.stored_lists()
+        self.assertTrue(incremental)
+
+        RelatedPost.query.delete()
+        db.session.commit()
+        self.assertEqual(self.related_ids(post_ids[0]), [])
+
+        result = app.test_cli_runner().invoke(args=['blogly', 'rebuild-related', '--batch', '4'])
+        self.assertIn('Related posts rebuilt for 6 posts', result.output)
+        self.assertEqual(self.stored_lists(), incremental)
+
@@ -0,0 +1,264 @@
+"""Streaming bulk import and export of Blogly content.
+
+A dump is a stream of records, one per user, tag and post, in that order:
+
+    {"type": "user", "id": 1, "first_name": "...", "last_name": "...", "profile_pic": "..."}
+    {"type": "tag", "id": 1, "name": "..."}
+    {"type": "post", "id": 1, "title": "...", "content": "...", "posted_at": "...", "posted_by": 1, "tags": [1]}
+
+as JSON lines or as CSV with FIELDS as columns and space-separated tag ids.
+Imported rows get fresh ids and references between records are remapped
+to them; a tag whose name already exists is merged into the existing tag.
+Post content is Markdown and is rendered as it's imported.
+Memory use is bounded by BATCH rows plus the user and tag id maps.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import func, select, text
+
+from catalog import bump_version
+from counters import recount_users, recount_tags
+from markup import rendered
+from media import store_image_value
+from models import db, touch, User, Post, Tags, PostTags
+
+BATCH = 5000
+
+FIELDS = ('type', 'id', 'first_name', 'last_name', 'profile_pic', 'name', 'title', 'content', 'posted_at',
+          'posted_by', 'tags')
+
+USER_COLUMNS = ('id', 'first_name', 'last_name', 'profile_pic', 'updated_at')
+TAG_COLUMNS = ('id', 'name', 'updated_at')
+POST_COLUMNS = ('id', 'title', 'content', 'content_html', 'excerpt', 'render_version', 'posted_by', 'posted_at',
+                'updated_at')
+LINK_COLUMNS = ('post_id', 'tag_id')
+
+REQUIRED = {
+    'user': ('id', 'first_name', 'last_name'),
+    'tag': ('id', 'name'),
+    'post': ('id', 'title', 'content', 'posted_by'),
+}
+
+
+class RecordError(ValueError):
+    """A record that can't be imported, with its position in the input"""
+
+    def __init__(self, number, message):
+        super().__init__(f'Record {number}: {message}')
+
+
+# export -----------------------------------------------------------------------------------------------------------
+
+def stream(conn, stmt):
+    """Rows of stmt fetched in batches through a server-side cursor where the driver has one"""
+    return conn.execution_options(stream_results=True).execute(stmt).yield_per(BATCH)
+
+
+def export_records():
+    """Every user, tag and post as dump records, without loading any table into memory"""
+    conn = db.session.connection()
+
+    for row in stream(conn, select(User.id, User.first_name, User.last_name, User.profile_pic).order_by(User.id)):
+        yield {'type': 'user', **row._mapping}
+
+    for row in stream(conn, select(Tags.id, Tags.name).order_by(Tags.id)):
+        yield {'type': 'tag', **row._mapping}
+
+    # Posts and links are both read in post id order and merged, rather than querying tags per post
+    links = stream(conn, select(PostTags.post_id, PostTags.tag_id).order_by(PostTags.post_id, PostTags.tag_id))
+    link = next(links, None)
+    for row in stream(conn, select(Post.id, Post.title, Post.content, Post.posted_at, Post.posted_by)
+                      .order_by(Post.id)):
+        tags = []
+        while link is not None and link.post_id <= row.id:
+            if link.post_id == row.id:
+                tags.append(link.tag_id)
+            link = next(links, None)
+
+        yield {'type': 'post', **row._mapping, 'posted_at': row.posted_at.isoformat(), 'tags': tags}
+
+
+def write_jsonl(records, out):
+    for record in records:
+        out.write(json.dumps(record) + '\n')
+
+
+def write_csv(records, out):
+    writer = csv.DictWriter(out, FIELDS)
+    writer.writeheader()
+    for record in records:
+        if 'tags' in record:
+            record = {**record, 'tags': ' '.join(map(str, record['tags']))}
+        writer.writerow(record)
+
+
+# import -----------------------------------------------------------------------------------------------------------
+
+def dump_format(filename):
+    return 'csv' if filename.endswith('.csv') else 'jsonl'
+
+
+def read_jsonl(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    # CSV can't tell empty from missing, so empty optional fields fall back to their defaults
+    for record in csv.DictReader(lines):
+        if record['type'] == 'post':
+            record['tags'] = record['tags'].split()
+        yield record
+
+
+DUMP_READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+DUMP_WRITERS = {'jsonl': write_jsonl, 'csv': write_csv}
+
+
+def allocate_ids(table, count):
+    """Reserve count new primary keys for table"""
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                                       "FROM generate_series(1, :count)"),
+                                  {'table': table.name, 'count': count})
+        return [row_id for (row_id,) in rows]
+
+    start = db.session.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar() + 1
+    return list(range(start, start + count))
+
+
+def copy_field(value):
+    """A COPY csv field: NULL as an unquoted empty field, anything else quoted so '' stays an empty string"""
+    if value is None:
+        return ''
+
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def write_rows(table, columns, rows):
+    """Bulk-insert rows, with COPY on PostgreSQL and executemany elsewhere"""
+    if not rows:
+        return
+
+    if db.engine.dialect.name != 'postgresql':
+        db.session.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+        return
+
+    buf = io.StringIO(''.join(','.join(map(copy_field, row)) + '\n' for row in rows))
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '')", buf)
+
+
+class Importer:
+    """Buffers records by type and writes them a batch at a time"""
+
+    def __init__(self):
+        self.user_ids = {}
+        self.tag_ids = {}
+        self.merged_tags = set()
+        self.pending = {'user': [], 'tag': [], 'post': []}
+        self.counts = {'user': 0, 'tag': 0, 'post': 0}
+        self.now = datetime.utcnow()
+        self.default_pic = User.__table__.c.profile_pic.default.arg
+
+    def add(self, number, record):
+        kind = record.get('type')
+        if kind not in REQUIRED:
+            raise RecordError(number, f'unknown type {kind!r}')
+        missing = [field for field in REQUIRED[kind] if record.get(field) is None]
+        if missing:
+            raise RecordError(number, f'missing {", ".join(missing)}')
+        if kind == 'post':
+            # Posts refer to users and tags, so those must be written first
+            self.flush('user')
+            self.flush('tag')
+
+        self.pending[kind].append((number, record))
+        if len(self.pending[kind]) >= BATCH:
+            self.flush(kind)
+
+    def flush(self, kind):
+        batch, self.pending[kind] = self.pending[kind], []
+        if not batch:
+            return
+
+        getattr(self, f'write_{kind}s')(batch, allocate_ids(self.table(kind), len(batch)))
+        self.counts[kind] += len(batch)
+
+    def table(self, kind):
+        return {'user': User, 'tag': Tags, 'post': Post}[kind].__table__
+
+    def write_users(self, batch, new_ids):
+        rows = []
+        for (number, record), new_id in zip(batch, new_ids):
+            self.user_ids[int(record['id'])] = new_id
+            try:
+                profile_pic = store_image_value(record.get('profile_pic') or self.default_pic)
+            except ValueError as err:
+                raise RecordError(number, str(err))
+            rows.append((new_id, record['first_name'], record['last_name'], profile_pic, self.now))
+
+        write_rows(User.__table__, USER_COLUMNS, rows)
+
+    def write_tags(self, batch, new_ids):
+        # Tag names are unique, so a tag that already exists is reused rather than added
+        existing = dict(db.session.query(Tags.name, Tags.id)
+                        .filter(Tags.name.in_({record['name'] for _, record in batch})))
+        self.merged_tags.update(existing.values())
+        rows = []
+        for (number, record), new_id in zip(batch, new_ids):
+            if record['name'] not in existing:
+                existing[record['name']] = new_id
+                rows.append((new_id, record['name'], self.now))
+            self.tag_ids[int(record['id'])] = existing[record['name']]
+
+        write_rows(Tags.__table__, TAG_COLUMNS, rows)
+
+    def write_posts(self, batch, new_ids):
+        rows, links = [], []
+        for (number, record), new_id in zip(batch, new_ids):
+            try:
+                posted_by = self.user_ids[int(record['posted_by'])]
+                tag_ids = {self.tag_ids[int(tag_id)] for tag_id in record.get('tags', [])}
+            except KeyError as err:
+                raise RecordError(number, f'refers to a user or tag not earlier in the input: {err}')
+
+            posted_at = datetime.fromisoformat(record['posted_at']) if record.get('posted_at') else self.now
+            body = rendered(record['content'])
+            rows.append((new_id, record['title'], record['content'], body['content_html'], body['excerpt'],
+                         body['render_version'], posted_by, posted_at, self.now))
+            links.extend((new_id, tag_id) for tag_id in sorted(tag_ids))
+
+        write_rows(Post.__table__, POST_COLUMNS, rows)
+        write_rows(PostTags.__table__, LINK_COLUMNS, links)
+
+
+def import_records(records):
+    """Import dump records in one transaction.
+
+    Returns how many of each type were added and the page cache entities
+    to invalidate once it's committed.
+    """
+    importer = Importer()
+    try:
+        for number, record in enumerate(records, 1):
+            importer.add(number, record)
+        for kind in importer.pending:
+            importer.flush(kind)
+
+        recount_users()
+        recount_tags()
+        # Existing tags that took imported posts show them on their pages
+        touch(Tags, importer.merged_tags)
+        if importer.counts['tag']:
+            bump_version('tags')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return importer.counts, ['posts', 'tags', 'feeds', *[f'tag:{ tag_id }' for tag_id in importer.merged_tags]]
@@ -0,0 +1,117 @@
+"""Write-behind post view counts for Blogly.
+
+Each worker process tallies views in memory and a background thread adds
+the tallies to post_views every VIEW_FLUSH_SECONDS, as soon as
+VIEW_FLUSH_SIZE posts have pending views, and when the process exits.
+Each flush is one upsert of view = view + delta per post, so concurrent
+workers never overwrite each other's counts and a busy post costs one row
+update per flush rather than one per view. Rows are written in post id
+order so overlapping flushes lock them in the same order.
+"""
+import atexit
+import threading
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, make_response
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Post, PostViews
+
+CHUNK = 1000
+
+
+def add_views(counts):
+    """Add {post_id: views} to the stored counts, skipping posts deleted since they were viewed"""
+    post_ids = sorted(counts)
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+
+    for start in range(0, len(post_ids), CHUNK):
+        chunk = post_ids[start:start + CHUNK]
+        live = {post_id for (post_id,) in db.session.query(Post.id).filter(Post.id.in_(chunk))}
+        rows = [{'post_id': post_id, 'views': counts[post_id]} for post_id in chunk if post_id in live]
+        if not rows:
+            continue
+
+        stmt = insert(PostViews).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=[PostViews.post_id],
+                                                      set_={'views': PostViews.views + stmt.excluded.views}))
+
+
+class ViewCounter:
+    """Thread-safe in-memory view tallies, flushed to the database by a background thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self.pending = Counter()
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def record(self, post_id):
+        with self.lock:
+            self.pending[post_id] += 1
+            full = len(self.pending) >= self.app.config['VIEW_FLUSH_SIZE']
+            if self.thread is None:
+                self.start()
+
+        if full:
+            self.wake.set()
+
+    def start(self):
+        # Started on the first view, so commands and tests that never count views run no thread
+        self.thread = threading.Thread(target=self.run, name='blogly-views', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self.wake.wait(self.app.config['VIEW_FLUSH_SECONDS'])
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write out every view recorded so far, returning how many posts had pending views"""
+        with self.flushing:
+            with self.lock:
+                counts, self.pending = self.pending, Counter()
+            if not counts:
+                return 0
+
+            with self.app.app_context():
+                try:
+                    add_views(counts)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Flushing views of %s posts failed', len(counts))
+                    # Keep the views for the next flush rather than lose them
+                    with self.lock:
+                        self.pending.update(counts)
+                    return 0
+
+            return len(counts)
+
+
+def counts_views(view):
+    """Decorate a post view to count every successful response, including cache hits and 304s"""
+    @wraps(view)
+    def wrapper(post_id, **kwargs):
+        resp = make_response(view(post_id, **kwargs))
+        if resp.status_code < 400:
+            current_app.extensions['view_counter'].record(post_id)
+
+        return resp
+
+    return wrapper
+
+
+def popular_query():
+    """Posts with their view counts, for keyset paging by (views, post_id) descending"""
+    return (db.session.query(Post, PostViews.views, PostViews.post_id)
+            .join(PostViews, PostViews.post_id == Post.id))
+
+
+def init_views(app):
+    app.extensions['view_counter'] = ViewCounter(app)